@@ -0,0 +1,124 @@
+"""结构化访问日志和审计日志：JSON Lines 格式，按大小轮转，写文件在后台线程。
+
+请求线程只把日志记录放进队列（QueueHandler），由一个 QueueListener 线程统一写控制台和文件，
+磁盘慢或日志文件被杀毒软件锁住时不会拖慢收银请求。原来 basicConfig 的控制台输出也挪到同一个队列后面。
+
+access：每个请求一行（接口、状态码、耗时、客户端 IP、订单号）。
+audit：开房、点单、结账、预约、房间/商品改价等会改动账目的操作，一行一条，带金额。
+多进程模式下每个工作进程写自己的文件（access-worker-0.jsonl），避免多个进程同时轮转同一个文件。
+"""
+import os
+import json
+import time
+import queue
+import atexit
+import logging
+import logging.handlers
+
+class JsonLinesFormatter(logging.Formatter):
+    """record.fields（通过 extra 传入）输出为一行 JSON；timestamp 为 True 时加上 ts 字段。"""
+
+    def __init__(self, timestamp=True):
+        super().__init__()
+        self.timestamp = timestamp
+
+    def format(self, record):
+        entry = {}
+        if self.timestamp:
+            entry["ts"] = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + ".%03d" % record.msecs
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        else:
+            entry["msg"] = record.getMessage()
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _ExcludeFilter(logging.Filter):
+    """控制台不重复输出写到文件的结构化记录（chess.* logger）。"""
+
+    def __init__(self, names):
+        super().__init__()
+        self.names = tuple(names)
+
+    def filter(self, record):
+        return not record.name.startswith(self.names)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        # 访问/审计记录没有格式化参数和异常信息，直接入队，省掉格式化和复制；其它记录照常处理
+        if getattr(record, "fields", None) is not None:
+            return record
+        return super().prepare(record)
+
+
+class StructuredLog:
+    def __init__(self, log_dir, config=None, suffix=""):
+        config = config or {}
+        self.log_dir = log_dir
+        self.queue = queue.SimpleQueue()
+        self.suffix = suffix
+        self.max_bytes = int(config.get("max_bytes", 10 * 1024 * 1024))
+        self.backup_count = int(config.get("backup_count", 5))
+        self.files = {}
+        self._streams = []
+        self._stopped = False
+
+        root = logging.getLogger()
+        self._console = list(root.handlers)
+        for h in self._console:
+            h.addFilter(_ExcludeFilter(("chess.",)))
+        self._queue_handler = _QueueHandler(self.queue)
+        root.handlers = [self._queue_handler]
+        self.listener = logging.handlers.QueueListener(self.queue, *self._console, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+        self.access_enabled = config.get("access_log", True)
+        self.audit_enabled = config.get("audit_log", True)
+        self.access = self.add_stream("access") if self.access_enabled else None
+        self.audit_logger = self.add_stream("audit") if self.audit_enabled else None
+
+    def add_stream(self, name, timestamp=True):
+        """新建一个 JSON Lines 文件 {name}{suffix}.jsonl，返回对应的 logger（记录通过 extra={"fields": ...} 传入）。"""
+        logger = logging.getLogger(f"chess.{name}")
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        os.makedirs(self.log_dir, exist_ok=True)
+        path = os.path.join(self.log_dir, f"{name}{self.suffix}.jsonl")
+        # delay：没有记录时不创建文件（多进程模式的主进程不处理请求）
+        h = logging.handlers.RotatingFileHandler(path, maxBytes=self.max_bytes, backupCount=self.backup_count,
+                                                 encoding="utf-8", delay=True)
+        h.setFormatter(JsonLinesFormatter(timestamp))
+        h.addFilter(logging.Filter(logger.name))
+        # 日志线程每条记录都重新读 handlers，整体替换元组即可生效
+        self.listener.handlers = self.listener.handlers + (h,)
+        logger.handlers = [self._queue_handler]
+        self.files[name] = path
+        self._streams.append(logger)
+        return logger
+
+    def log_access(self, **fields):
+        if self.access_enabled:
+            self.access.info("access", extra={"fields": fields})
+
+    def audit(self, event, **fields):
+        if self.audit_enabled:
+            self.audit_logger.info(event, extra={"fields": {"event": event, **fields}})
+
+    def stop(self):
+        """写完队列里剩余的记录后停止后台线程（可重复调用），之后的日志直接写控制台。"""
+        if self._stopped:
+            return
+        self._stopped = True
+        self.access_enabled = self.audit_enabled = False
+        for logger in self._streams:
+            logger.disabled = True
+        logging.getLogger().handlers = self._console
+        self.listener.stop()
+        for h in self.listener.handlers:
+            h.flush()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "files": dict(self.files)}
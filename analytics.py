@@ -0,0 +1,296 @@
+"""房间入座率分析：按小时/按天的使用率曲线、星期×小时热力图、平均时长、最高同时在用房间数。
+
+订单区间一次性读成 NumPy 数组，用差分数组（np.add.at + cumsum）把占用时长分摊到小时桶里：
+区间完整覆盖的桶在差分数组上 +1/-1，首尾不满一小时的部分直接累加到对应桶；
+最高同时在用数用开始/结束事件排序后的累加和（sweep line）求出。
+
+时间统一换算成“按 UTC 解释的本地时间”秒数（即 orders.start_ts / end_ts 列），只用于相对计算，不涉及时区。
+已经过去、且没有当天开始仍未结账订单的日期结果不会再变，按天缓存；当天和还挂着跨夜未结订单的日期每次重新计算
+（结账后该订单才计入开始那天的场次和平均时长）。
+"""
+import calendar
+import datetime
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np  # 可选依赖：未安装时分析接口不可用
+except ImportError:
+    np = None
+
+DAY = 86400
+HOUR = 3600
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+# 订单区间：[开始, 结束) 秒数；未结账的订单结束时间按当前时间算。
+# 只扫描开始时间落在 [lo, hi) 的订单（走 start_ts 索引），lo 比统计起点提前 max_session_hours，
+# 更早开始且仍未结账的订单单独补上。
+_INTERVALS_SQL = """
+    SELECT room_id, s, e, closed FROM (
+        SELECT room_id, start_ts AS s, IFNULL(end_ts, :now) AS e, end_time IS NOT NULL AS closed
+        FROM all_orders
+        WHERE start_ts >= :lo AND start_ts < :hi
+        UNION ALL
+        SELECT room_id, start_ts, :now, 0
+        FROM orders
+        WHERE payment_status = 'unpaid' AND end_time IS NULL AND start_ts < :lo
+    ) WHERE s IS NOT NULL AND e IS NOT NULL
+"""
+
+
+def available():
+    return np is not None
+
+
+def to_epoch(dt):
+    return calendar.timegm(dt.timetuple())
+
+
+def from_epoch(ts):
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=int(ts))
+
+
+class DayResult:
+    """一天的统计结果：rooms 为房间 id 数组，occupied 为 房间×24 小时 的占用秒数。
+
+    open_sessions：当天开始、计算时仍未结账的订单数，不为 0 时结果还会变，不能缓存。
+    """
+    __slots__ = ('rooms', 'occupied', 'sessions', 'session_seconds', 'peak', 'peak_at', 'open_sessions')
+
+    def __init__(self, rooms, occupied, sessions, session_seconds, peak, peak_at, open_sessions=0):
+        self.rooms = rooms
+        self.occupied = occupied
+        self.sessions = sessions
+        self.session_seconds = session_seconds
+        self.peak = peak
+        self.peak_at = peak_at
+        self.open_sessions = open_sessions
+
+
+def load_intervals(cur, t0, t1, now, max_session_hours=48):
+    """返回 (room_id, start, end, closed) 四个 int64 数组，区间未裁剪。cur 需返回元组（row_factory 为 None）。"""
+    lo = int(t0 - max_session_hours * HOUR)
+    cur.execute(_INTERVALS_SQL, {"lo": lo, "hi": int(t1), "now": int(now)})
+    rows = cur.fetchall()
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    data = np.array(rows, dtype=np.int64)
+    return data[:, 0], data[:, 1], data[:, 2], data[:, 3]
+
+
+def hourly_occupancy(ridx, s, e, n_rooms, t0, n_buckets, bucket=HOUR):
+    """把区间占用时长分摊到 房间×桶 的二维数组（秒）。s/e 已裁剪到 [t0, t0 + n_buckets*bucket]。"""
+    sb = (s - t0) // bucket
+    eb = (e - t0) // bucket
+    occupied = np.zeros(n_rooms * n_buckets, dtype=np.float64)
+    base = ridx * n_buckets
+    same = sb == eb
+    # 同一个桶内开始和结束
+    np.add.at(occupied, base[same] + sb[same], (e - s)[same])
+    # 跨桶：首桶、尾桶的零头
+    cross = ~same
+    sb, eb, s, e, base = sb[cross], eb[cross], s[cross], e[cross], base[cross]
+    np.add.at(occupied, base + sb, t0 + (sb + 1) * bucket - s)
+    tail = e - (t0 + eb * bucket)
+    has_tail = tail > 0
+    np.add.at(occupied, base[has_tail] + eb[has_tail], tail[has_tail])
+    # 中间完整覆盖的桶：差分数组 [sb+1, eb) 区间 +1，按房间累加
+    full = eb > sb + 1
+    diff = np.zeros(n_rooms * (n_buckets + 1), dtype=np.int64)
+    dbase = ridx[cross][full] * (n_buckets + 1)
+    np.add.at(diff, dbase + sb[full] + 1, 1)
+    np.add.at(diff, dbase + eb[full], -1)
+    covered = np.cumsum(diff.reshape(n_rooms, n_buckets + 1), axis=1)[:, :n_buckets]
+    return occupied.reshape(n_rooms, n_buckets) + covered * bucket
+
+
+def daily_peaks(s, e, t0, n_days):
+    """每天最高同时在用房间数及首次达到的时刻。"""
+    peaks = np.zeros(n_days, dtype=np.int64)
+    peak_at = t0 + np.arange(n_days, dtype=np.int64) * DAY
+    if len(s) == 0:
+        return peaks, peak_at
+    # 事件按时间排序，同一时刻先结束后开始（交接不算两间同时在用）
+    times = np.concatenate([s, e])
+    deltas = np.concatenate([np.ones(len(s), dtype=np.int64), -np.ones(len(e), dtype=np.int64)])
+    order = np.lexsort((deltas, times))
+    times, running = times[order], np.cumsum(deltas[order])
+    # 每天零点的在用数（跨天的订单在当天可能没有任何事件）
+    starts = t0 + np.arange(n_days, dtype=np.int64) * DAY
+    at_midnight = np.searchsorted(np.sort(s), starts, 'right') - np.searchsorted(np.sort(e), starts, 'right')
+    inside = times < t0 + n_days * DAY
+    cand_t = np.concatenate([starts, times[inside]])
+    cand_c = np.concatenate([at_midnight, running[inside]])
+    cand_d = (cand_t - t0) // DAY
+    # 按 (天, 在用数降序, 时间) 排序，每天取第一条
+    order = np.lexsort((cand_t, -cand_c, cand_d))
+    days, first = np.unique(cand_d[order], return_index=True)
+    peaks[days] = cand_c[order][first]
+    peak_at[days] = cand_t[order][first]
+    return peaks, peak_at
+
+
+class OccupancyAnalytics:
+    def __init__(self, max_session_hours=48, cache_days=3660, settle_seconds=0):
+        self.max_session_hours = max_session_hours
+        self.cache_days = cache_days
+        # 数据源可能落后（只读副本），日期结束后再过 settle_seconds 秒才视为不再变化
+        self.settle_seconds = settle_seconds
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def compute_days(self, cur, first_day, n_days, now):
+        """一次扫描计算连续 n_days 天，返回 DayResult 列表。"""
+        t0 = to_epoch(first_day)
+        t1 = t0 + n_days * DAY
+        room, s, e, closed = load_intervals(cur, t0, t1, now, self.max_session_hours)
+        cur.execute("SELECT id FROM rooms")
+        rooms = np.union1d(np.array([r[0] for r in cur.fetchall()], dtype=np.int64), room)
+        ridx = np.searchsorted(rooms, room)
+        n_rooms = len(rooms)
+
+        # 当前时间之后的部分不计（未结账订单的结束时间就是 now）
+        limit = min(t1, now)
+        cs, ce = np.clip(s, t0, limit), np.clip(e, t0, limit)
+        keep = ce > cs
+        occupied = hourly_occupancy(ridx[keep], cs[keep], ce[keep], n_rooms, t0, n_days * 24)
+        occupied = occupied.reshape(n_rooms, n_days, 24)
+        peaks, peak_at = daily_peaks(cs[keep], ce[keep], t0, n_days)
+
+        # 时长统计按开始日期归属，只算已结账的订单
+        started = (closed == 1) & (s >= t0) & (s < limit) & (e >= s)
+        flat = ridx[started] * n_days + (s[started] - t0) // DAY
+        sessions = np.bincount(flat, minlength=n_rooms * n_days).reshape(n_rooms, n_days)
+        seconds = np.zeros(n_rooms * n_days, dtype=np.float64)
+        np.add.at(seconds, flat, (e - s)[started])
+        seconds = seconds.reshape(n_rooms, n_days)
+        # 按开始日期统计未结账的订单：结账后会计入当天的场次，这些日期暂不缓存
+        pending = (closed == 0) & (s >= t0) & (s < t1)
+        open_sessions = np.bincount((s[pending] - t0) // DAY, minlength=n_days)
+
+        # 拷贝出每天的切片，缓存淘汰时才能释放整段数组
+        return [DayResult(rooms, occupied[:, d, :].copy(), sessions[:, d].copy(), seconds[:, d].copy(), int(peaks[d]), int(peak_at[d]),
+                          int(open_sessions[d]))
+                for d in range(n_days)]
+
+    def days(self, cur, first_day, last_day, now):
+        """[first_day, last_day] 每天的结果。已结束的日期走缓存，缺失的连续日期合并成一次计算。"""
+        n = (last_day - first_day).days + 1
+        wanted = [first_day + datetime.timedelta(days=i) for i in range(n)]
+        results = {}
+        with self._lock:
+            for d in wanted:
+                r = self._cache.get(d)
+                if r is not None:
+                    self._cache.move_to_end(d)
+                    results[d] = r
+            self.cache_hits += len(results)
+            self.cache_misses += n - len(results)
+        run = []
+        for d in wanted + [None]:
+            if d is not None and d not in results:
+                run.append(d)
+                continue
+            if run:
+                for day, r in zip(run, self.compute_days(cur, run[0], len(run), now)):
+                    results[day] = r
+                    if to_epoch(day) + DAY + self.settle_seconds <= now and not r.open_sessions:
+                        self._store(day, r)
+                run = []
+        return [results[d] for d in wanted]
+
+    def _store(self, day, result):
+        with self._lock:
+            self._cache[day] = result
+            while len(self._cache) > self.cache_days:
+                self._cache.popitem(last=False)
+
+    def occupancy(self, cur, first_day, last_day, granularity="hour", by_room=False, now=None):
+        now = to_epoch(now or datetime.datetime.now())
+        records = self.days(cur, first_day, last_day, now)
+        n_days = len(records)
+        t0 = to_epoch(first_day)
+
+        rooms = np.unique(np.concatenate([r.rooms for r in records]))
+        n_rooms = len(rooms)
+        occupied = np.zeros((n_rooms, n_days, 24))
+        sessions = np.zeros((n_rooms, n_days), dtype=np.int64)
+        seconds = np.zeros((n_rooms, n_days))
+        for d, r in enumerate(records):
+            idx = np.searchsorted(rooms, r.rooms)
+            occupied[idx, d, :] = r.occupied
+            sessions[idx, d] = r.sessions
+            seconds[idx, d] = r.session_seconds
+
+        # 每个小时桶的可用秒数：未来的时间不计入分母
+        bucket_start = t0 + np.arange(n_days * 24, dtype=np.int64) * HOUR
+        capacity = np.clip(now - bucket_start, 0, HOUR).astype(np.float64).reshape(n_days, 24)
+        total_capacity = capacity.sum() * n_rooms
+
+        hourly = occupied.sum(axis=0)
+        if granularity == "day":
+            labels = [(first_day + datetime.timedelta(days=i)).isoformat() for i in range(n_days)]
+            num, den = hourly.sum(axis=1), capacity.sum(axis=1)
+            room_num = occupied.sum(axis=2)
+        else:
+            labels = [from_epoch(t).strftime("%Y-%m-%d %H:00") for t in bucket_start]
+            num, den = hourly.ravel(), capacity.ravel()
+            room_num = occupied.reshape(n_rooms, -1)
+        valid = den > 0
+
+        def ratio(a, b):
+            return np.round(np.divide(a, b, out=np.zeros_like(a, dtype=np.float64), where=b > 0), 4)
+
+        curve = {"labels": [l for l, v in zip(labels, valid) if v],
+                 "utilization": ratio(num, den * n_rooms)[valid].tolist()}
+        if by_room:
+            curve["by_room"] = {int(rid): ratio(room_num[i], den)[valid].tolist() for i, rid in enumerate(rooms)}
+
+        # 星期×小时热力图（周一为 0）
+        weekday = (np.arange(n_days) + (t0 // DAY + 3)) % 7
+        heat_num = np.zeros((7, 24))
+        heat_den = np.zeros((7, 24))
+        np.add.at(heat_num, weekday, hourly)
+        np.add.at(heat_den, weekday, capacity * n_rooms)
+        heatmap = ratio(heat_num, heat_den).tolist()
+
+        peak_day = int(np.argmax([r.peak for r in records]))
+        total_sessions = int(sessions.sum())
+        room_stats = []
+        for i, rid in enumerate(rooms):
+            n = int(sessions[i].sum())
+            occ = float(occupied[i].sum())
+            room_stats.append({
+                "room_id": int(rid),
+                "occupied_hours": round(occ / HOUR, 2),
+                "utilization": round(occ / float(capacity.sum()), 4) if capacity.sum() else 0,
+                "sessions": n,
+                "avg_session_minutes": round(float(seconds[i].sum()) / n / 60, 1) if n else None,
+            })
+        return {
+            "start": first_day.isoformat(),
+            "end": last_day.isoformat(),
+            "granularity": granularity,
+            "rooms": room_stats,
+            "overall": {
+                "occupied_hours": round(float(occupied.sum()) / HOUR, 2),
+                "utilization": round(float(occupied.sum() / total_capacity), 4) if total_capacity else 0,
+                "sessions": total_sessions,
+                "avg_session_minutes": round(float(seconds.sum()) / total_sessions / 60, 1) if total_sessions else None,
+                "peak_concurrent": records[peak_day].peak,
+                "peak_at": from_epoch(records[peak_day].peak_at).strftime(TIME_FMT),
+            },
+            "curve": curve,
+            "heatmap": heatmap,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {"cached_days": len(self._cache), "hits": self.cache_hits, "misses": self.cache_misses}
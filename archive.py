@@ -0,0 +1,211 @@
+"""冷热分离：把较早的已结账订单及其商品明细搬到 archive.db。
+
+热库 chess.db 只保留进行中和近期订单，开房/点单/结账只碰热库；
+历史和报表查询走临时视图 all_orders / all_order_products（main UNION ALL archive）。
+
+手动执行：python archive.py --days 180
+"""
+import os
+import time
+import logging
+import sqlite3
+import argparse
+import threading
+import datetime
+
+from init_db import add_derived_columns
+
+ARCHIVE_SCHEMA = "archive"
+
+# 归档库表结构与主库一致，但不带外键（rooms/products 只在主库）
+ARCHIVE_TABLES = {
+    "orders": """
+    CREATE TABLE IF NOT EXISTS archive.orders (
+        id INTEGER PRIMARY KEY,
+        order_number TEXT NOT NULL UNIQUE,
+        room_id INTEGER NOT NULL,
+        customer_id INTEGER,
+        start_time DATETIME NOT NULL,
+        end_time DATETIME,
+        total_hours REAL,
+        total_amount REAL,
+        product_total REAL DEFAULT 0,
+        payment_status TEXT DEFAULT 'unpaid',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    "order_products": """
+    CREATE TABLE IF NOT EXISTS archive.order_products (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER NOT NULL,
+        product_id INTEGER NOT NULL,
+        quantity INTEGER NOT NULL DEFAULT 1,
+        unit_price REAL NOT NULL,
+        total_price REAL NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+}
+ARCHIVE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_start_time ON orders(start_time)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_end_time ON orders(end_time)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_order_products_order_id ON order_products(order_id)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_start_ts ON orders(start_ts)",
+    "CREATE INDEX IF NOT EXISTS archive.idx_orders_end_ts ON orders(end_ts)",
+]
+
+
+def table_columns(conn, schema, table):
+    return [r[1] for r in conn.execute(f"PRAGMA {schema}.table_info('{table}')").fetchall()]
+
+
+def attach(conn, path=None):
+    """在连接上挂载归档库，同步表结构并创建 all_* 临时视图，返回视图使用的列。
+
+    path 为 None（未启用归档）时视图只覆盖主库，查询语句不用区分两种情况。
+    """
+    if path is None:
+        columns = {}
+        for table in ARCHIVE_TABLES:
+            columns[table] = ", ".join(table_columns(conn, "main", table))
+            conn.execute(f"CREATE TEMP VIEW IF NOT EXISTS all_{table} AS SELECT {columns[table]} FROM main.{table}")
+        return columns
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    attached = [r[1] for r in conn.execute("PRAGMA database_list").fetchall()]
+    if ARCHIVE_SCHEMA not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (path,))
+        conn.execute(f"PRAGMA {ARCHIVE_SCHEMA}.journal_mode=WAL")
+    for table, ddl in ARCHIVE_TABLES.items():
+        conn.execute(ddl)
+        # 派生整数列先单独补（已有的归档数据要回填），再同步其它列
+        add_derived_columns(conn, ARCHIVE_SCHEMA, [table])
+        # 主库后续迁移加的列，归档库跟着补上
+        have = set(table_columns(conn, ARCHIVE_SCHEMA, table))
+        for r in conn.execute(f"PRAGMA main.table_info('{table}')").fetchall():
+            if r[1] not in have:
+                conn.execute(f"ALTER TABLE {ARCHIVE_SCHEMA}.{table} ADD COLUMN {r[1]} {r[2]}")
+    for ddl in ARCHIVE_INDEXES:
+        conn.execute(ddl)
+    conn.commit()
+    columns = {}
+    for table in ARCHIVE_TABLES:
+        cols = ", ".join(table_columns(conn, "main", table))
+        columns[table] = cols
+        conn.execute(f"DROP VIEW IF EXISTS temp.all_{table}")
+        # 用 UNION ALL 避免去重排序；ORDER BY 会按索引归并两路。
+        # 归档每批先提交归档库再删主库，两次提交之间同一订单两边都有：归档这边跳过主库里还在的订单
+        # （比主库最小 id 还小的直接放行，其余按主键查一次），报表不会在这段时间里重复计算。语句开始时先取主库快照再取归档库快照，
+        # 主库已删除时归档库一定已提交，不会两边都没有。
+        order_id = "id" if table == "orders" else "order_id"
+        conn.execute(f"CREATE TEMP VIEW all_{table} AS "
+                     f"SELECT {cols} FROM main.{table} UNION ALL "
+                     f"SELECT {cols} FROM {ARCHIVE_SCHEMA}.{table} AS a "
+                     f"WHERE a.{order_id} < (SELECT IFNULL(MIN(id), 0) FROM main.orders) "
+                     f"OR NOT EXISTS (SELECT 1 FROM main.orders AS m WHERE m.id = a.{order_id})")
+    return columns
+
+
+def archive_paid_orders(conn, min_age_days, batch_size=5000, sleep=0.05, log=logging.info):
+    """把 end_time 早于 min_age_days 天的已结账订单分批搬到归档库，返回搬迁的订单数和明细数。
+
+    WAL 模式下跨库事务只在单库内原子，所以每批先提交归档库的写入，再删主库；
+    两次提交之间 all_* 视图只取主库那份（见 attach）。中途崩溃最多在归档库留下重复行，
+    视图同样不会重复计算，下次执行会先按 id 清掉再重新写入。
+    """
+    columns = attach(conn, _attached_path(conn))
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=min_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+    moved_orders = moved_lines = 0
+    started = time.time()
+    cur = conn.cursor()
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS _archive_ids (id INTEGER PRIMARY KEY)")
+    while True:
+        cur.execute("DELETE FROM temp._archive_ids")
+        cur.execute("INSERT INTO temp._archive_ids (id) SELECT id FROM main.orders "
+                    "WHERE payment_status = 'paid' AND end_time < ? ORDER BY id LIMIT ?", (cutoff, batch_size))
+        n = cur.rowcount
+        if n <= 0:
+            conn.commit()
+            break
+        try:
+            cur.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.order_products WHERE order_id IN (SELECT id FROM temp._archive_ids)")
+            cur.execute(f"DELETE FROM {ARCHIVE_SCHEMA}.orders WHERE id IN (SELECT id FROM temp._archive_ids)")
+            cur.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.orders ({columns['orders']}) "
+                        f"SELECT {columns['orders']} FROM main.orders WHERE id IN (SELECT id FROM temp._archive_ids)")
+            cur.execute(f"INSERT INTO {ARCHIVE_SCHEMA}.order_products ({columns['order_products']}) "
+                        f"SELECT {columns['order_products']} FROM main.order_products "
+                        f"WHERE order_id IN (SELECT id FROM temp._archive_ids)")
+            lines = cur.rowcount
+            conn.commit()
+            cur.execute("DELETE FROM main.order_products WHERE order_id IN (SELECT id FROM temp._archive_ids)")
+            cur.execute("DELETE FROM main.orders WHERE id IN (SELECT id FROM temp._archive_ids)")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        moved_orders += n
+        moved_lines += lines
+        log(f"归档 {moved_orders} 单 / {moved_lines} 条明细")
+        if sleep:
+            # 批次之间让出写锁，不阻塞收银
+            time.sleep(sleep)
+    return {"orders": moved_orders, "order_products": moved_lines, "cutoff": cutoff,
+            "seconds": round(time.time() - started, 2)}
+
+
+def _attached_path(conn):
+    for r in conn.execute("PRAGMA database_list").fetchall():
+        if r[1] == ARCHIVE_SCHEMA:
+            return r[2]
+    raise RuntimeError("归档库未挂载")
+
+
+def start_archive_thread(db, config, on_change=None, stop=None):
+    """后台定时归档线程。db 为 testapp.Database，使用独立连接避免占用请求连接。
+
+    on_change：有订单被归档后调用（用于让响应缓存失效）。
+    stop：threading.Event，置位后不再开始下一轮（正在进行的一轮会做完，停机时 join 返回的线程）。
+    """
+    interval = float(config.get("interval_hours", 24)) * 3600
+    stop = stop or threading.Event()
+
+    def loop():
+        while not stop.is_set():
+            conn = None
+            try:
+                conn = db.create_connection()
+                result = archive_paid_orders(conn, config.get("min_age_days", 180), config.get("batch_size", 5000))
+                if result["orders"]:
+                    logging.info("归档完成: %s", result)
+                    if on_change is not None:
+                        on_change()
+            except Exception as e:
+                logging.error("归档失败: %s", e)
+            finally:
+                if conn is not None:
+                    conn.close()
+            stop.wait(interval)
+
+    t = threading.Thread(target=loop, name="archive", daemon=True)
+    t.start()
+    return t
+
+
+def main(argv=None):
+    from config import DB_CONFIG, ARCHIVE_CONFIG
+    parser = argparse.ArgumentParser(description="归档较早的已结账订单")
+    parser.add_argument('--db', default=DB_CONFIG.get('filename'))
+    parser.add_argument('--archive', default=ARCHIVE_CONFIG.get('filename'))
+    parser.add_argument('--days', type=int, default=ARCHIVE_CONFIG.get('min_age_days', 180))
+    parser.add_argument('--batch-size', type=int, default=ARCHIVE_CONFIG.get('batch_size', 5000))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    conn = sqlite3.connect(args.db)
+    conn.execute("PRAGMA foreign_keys = ON;")
+    attach(conn, args.archive or os.path.join(os.path.dirname(args.db), "archive.db"))
+    print(archive_paid_orders(conn, args.days, args.batch_size, sleep=0))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
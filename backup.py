@@ -0,0 +1,180 @@
+"""在线备份：用 sqlite3 backup API 分批拷贝页面，不停服务、不长时间占锁。
+
+源连接先开一个读事务固定快照（WAL 模式下读事务不阻塞写入），
+这样其它连接在备份期间写库也不会让 backup 从头重来，得到的是一致快照。
+"""
+import os
+import time
+import logging
+import sqlite3
+import datetime
+import threading
+from collections import deque
+
+
+class BackupManager:
+    def __init__(self, sources, backup_dir, keep=7, pages_per_step=256, step_sleep=0.01,
+                 measure_stall=True, history_size=20):
+        # sources: [(名称, 数据库路径)]，例如 [("chess", ".../chess.db"), ("archive", ".../archive.db")]
+        self.sources = [(name, path) for name, path in sources if path]
+        self.backup_dir = backup_dir
+        self.keep = int(keep)
+        self.pages_per_step = int(pages_per_step)
+        self.step_sleep = float(step_sleep)
+        self.measure_stall = measure_stall
+        self.history = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def running(self):
+        return self._lock.locked()
+
+    def run(self):
+        """执行一次备份。已有备份在跑时返回 None。"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            os.makedirs(self.backup_dir, exist_ok=True)
+            ts = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+            started = time.time()
+            result = {"started_at": ts, "success": True, "files": []}
+            for name, path in self.sources:
+                if not os.path.exists(path):
+                    continue
+                try:
+                    result["files"].append(self.backup_one(name, path, ts))
+                except Exception as e:
+                    logging.exception(e)
+                    result["success"] = False
+                    result["files"].append({"name": name, "success": False, "error": str(e)})
+                self.rotate(name)
+            result["seconds"] = round(time.time() - started, 3)
+            self.history.append(result)
+            return result
+        finally:
+            self._lock.release()
+
+    def backup_one(self, name, path, ts):
+        final = os.path.join(self.backup_dir, f"{name}-{ts}.db")
+        part = final + ".part"
+        probe = _StallProbe(path) if self.measure_stall else None
+        steps = [0]
+
+        def progress(status, remaining, total):
+            steps[0] += 1
+            # backup() 的 sleep 参数只在 SQLITE_BUSY/LOCKED 重试时生效，批次之间要自己停一下，让收银写入插进来
+            if remaining > 0 and self.step_sleep > 0:
+                time.sleep(self.step_sleep)
+
+        src = sqlite3.connect(path, isolation_level=None)
+        dst = sqlite3.connect(part)
+        started = time.time()
+        try:
+            # 固定读快照，避免其它连接写入导致 backup 重新开始
+            src.execute("BEGIN")
+            src.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            if probe:
+                probe.start()
+            src.backup(dst, pages=self.pages_per_step, progress=progress, sleep=self.step_sleep)
+            src.execute("COMMIT")
+            copied = time.time() - started
+            # 快照保存为单文件，不带 -wal
+            dst.execute("PRAGMA journal_mode=DELETE").fetchone()
+            check = dst.execute("PRAGMA integrity_check").fetchone()[0]
+        except Exception:
+            dst.close()
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+        finally:
+            if probe:
+                probe.stop()
+            src.close()
+            dst.close()
+        if check != "ok":
+            os.remove(part)
+            raise RuntimeError(f"备份校验失败: {check}")
+        os.replace(part, final)
+        return {
+            "name": name,
+            "success": True,
+            "file": final,
+            "size": os.path.getsize(final),
+            "steps": steps[0],
+            "copy_seconds": round(copied, 3),
+            "seconds": round(time.time() - started, 3),
+            "integrity": check,
+            "max_write_stall_ms": probe.max_stall_ms() if probe else None,
+        }
+
+    def rotate(self, name):
+        prefix = name + "-"
+        files = sorted(f for f in os.listdir(self.backup_dir) if f.startswith(prefix) and f.endswith(".db"))
+        for f in (files[:-self.keep] if self.keep > 0 else []):
+            try:
+                os.remove(os.path.join(self.backup_dir, f))
+            except OSError as e:
+                logging.error("删除旧备份失败 %s: %s", f, e)
+
+    def snapshots(self):
+        if not os.path.isdir(self.backup_dir):
+            return []
+        return sorted((f for f in os.listdir(self.backup_dir) if f.endswith(".db")), reverse=True)
+
+    def start_scheduler(self, interval_hours):
+        interval = float(interval_hours) * 3600
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    result = self.run()
+                    if result is not None:
+                        logging.info("定时备份完成: %s 秒, 成功=%s", result["seconds"], result["success"])
+                except Exception as e:
+                    logging.error("定时备份失败: %s", e)
+
+        t = threading.Thread(target=loop, name="backup", daemon=True)
+        t.start()
+        return t
+
+    def stop(self, timeout=0):
+        """停止定时备份；timeout > 0 时等正在进行的备份完成，返回是否已空闲。"""
+        self._stop.set()
+        if timeout and self._lock.acquire(timeout=timeout):
+            self._lock.release()
+        return not self.running()
+
+
+class _StallProbe:
+    """备份期间不断做一次空写事务，记录最长等待时间，用来衡量备份对收银写入的影响。"""
+
+    def __init__(self, path, interval=0.02):
+        self.path = path
+        self.interval = interval
+        self.worst = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="backup-probe", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        conn = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        try:
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("COMMIT")
+                self.worst = max(self.worst, time.perf_counter() - t0)
+                self._stop.wait(self.interval)
+        finally:
+            conn.close()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def max_stall_ms(self):
+        return round(self.worst * 1000, 3)
@@ -0,0 +1,85 @@
+"""批量接口：一个 HTTP 请求里执行多个 API 调用（POST /api/batch）。
+
+前端刷新总览时会连发 rooms / orders / products / overview 等一串小请求，
+在小主机上每个请求的 HTTP 解析、中间件、压缩开销占了延迟的大头。
+子请求直接在进程内按 Flask 的 URL 表分发给视图函数，不走 before/after_request 钩子（外层请求已经执行过），
+视图自身的缓存、请求合并装饰器照常生效。结果按提交顺序返回，JSON 响应体原样拼进结果，不重新解析。
+"""
+import json
+import logging
+
+from flask import request
+from werkzeug.exceptions import HTTPException, NotFound
+from werkzeug.test import EnvironBuilder
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_requests(payload, max_requests=20, prefix='/api/', forbidden=('/api/batch',)):
+    """校验请求体，返回 [(method, path, body)]。格式：{"requests": [{"method", "path", "body"}]} 或直接是列表。"""
+    items = payload.get('requests') if isinstance(payload, dict) else payload
+    if not isinstance(items, list) or not items:
+        raise BatchError("requests 必须是非空列表")
+    if len(items) > max_requests:
+        raise BatchError(f"一次最多 {max_requests} 个子请求")
+    parsed = []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f"第 {i + 1} 个子请求缺少 path")
+        method = str(item.get('method') or 'GET').upper()
+        path = item['path']
+        route = path.split('?', 1)[0]
+        if not route.startswith(prefix) or route.rstrip('/') in forbidden:
+            raise BatchError(f"不支持的子请求路径: {path}")
+        parsed.append((method, path, item.get('body')))
+    return parsed
+
+
+def dispatch(app, method, path, body=None, environ_base=None, headers=None, exclude_endpoints=()):
+    """在进程内执行一个子请求，返回 (状态码, mimetype, 响应字节)。
+
+    exclude_endpoints：不能通过批量接口访问的视图（如前端页面的兜底路由），按 404 处理。
+    """
+    builder = EnvironBuilder(path=path, method=method, json=body if method not in READ_METHODS else None,
+                             headers=headers, environ_base=environ_base)
+    try:
+        environ = builder.get_environ()
+    finally:
+        builder.close()
+    with app.request_context(environ):
+        try:
+            if request.url_rule is not None and request.url_rule.endpoint in exclude_endpoints:
+                raise NotFound()
+            rv = app.dispatch_request()
+        except HTTPException as e:
+            rv = app.handle_user_exception(e)
+        except Exception as e:
+            logging.exception(e)
+            rv = app.response_class(json.dumps({"success": False, "error": str(e)}), status=500,
+                                    mimetype='application/json')
+        resp = app.make_response(rv)
+        resp.direct_passthrough = False     # 文件响应也读成字节
+        if resp.status_code >= 400 and resp.mimetype != 'application/json':
+            # 路由不存在、方法不允许等 HTTP 错误：统一成接口的错误格式
+            return resp.status_code, 'application/json', json.dumps(
+                {"success": False, "error": resp.status}, ensure_ascii=False).encode()
+        return resp.status_code, resp.mimetype, resp.get_data()
+
+
+def encode_results(results):
+    """[(状态码, mimetype, 响应字节)] -> {"success": true, "results": [{"status", "body"}]} 的字节。
+
+    JSON 响应体直接拼接（视图输出本身就是合法 JSON），其它类型作为字符串。
+    """
+    parts = []
+    for status, mimetype, data in results:
+        if mimetype == 'application/json' and data:
+            body = data
+        else:
+            body = json.dumps(data.decode('utf-8', 'replace')).encode()
+        parts.append(b'{"status":%d,"body":%s}' % (status, body))
+    return b'{"success":true,"results":[' + b','.join(parts) + b']}'
@@ -0,0 +1,105 @@
+"""多进程部署时进程内缓存的一致性：按表的共享变更计数器。
+
+change_counters 表每张业务表一行，触发器在该表每次插入/更新/删除时把计数加一，
+和业务写入在同一个事务里提交，所以计数变化与数据变化同时对其它进程可见。
+
+每个进程记住上次看到的计数，请求开始时先查 PRAGMA data_version（本连接之外有提交才会变，几乎没有开销），
+变了才读计数器，找出被其它进程改过的表，回调对应的失效函数（清响应缓存、重载会员/预约索引）。
+读计数在读数据之前，之后再有提交会在下一次检查时发现，不会漏掉。
+
+data_version 对同一进程里其它线程的连接也会变，本进程的写入已经写穿到缓存和索引，不能再当作外部改动。
+所以写事务先拿写锁并同步（begin_write），提交前在锁内读一次计数：此时的增量全部来自本事务，
+提交成功后直接记为已见（commit），兄弟连接检查时就不会回调。
+"""
+import threading
+
+TRACKED_TABLES = ("rooms", "orders", "order_products", "products", "customers", "reservations")
+
+
+def install(conn):
+    """创建计数器表和触发器（幂等）。"""
+    conn.execute("CREATE TABLE IF NOT EXISTS change_counters (name TEXT PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)")
+    for table in TRACKED_TABLES:
+        conn.execute("INSERT OR IGNORE INTO change_counters (name, version) VALUES (?, 0)", (table,))
+        for op in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_version AFTER {op} ON {table}
+                BEGIN UPDATE change_counters SET version = version + 1 WHERE name = '{table}'; END
+            """)
+    conn.commit()
+
+
+class ChangeTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._seen = None
+        self._listeners = []      # (tables, fn)
+        self.polls = 0
+        self.reads = 0
+        self.changes = {}
+        self.local_commits = {}
+
+    def on_change(self, tables, fn):
+        """tables 中任一张表被改动时调用 fn(changed_tables)。"""
+        self._listeners.append((frozenset(tables), fn))
+
+    def _counters(self, conn):
+        return dict(conn.execute("SELECT name, version FROM change_counters").fetchall())
+
+    def poll(self, conn, force=False):
+        """检查其它连接的提交，返回变化的表集合。conn 用当前线程自己的连接（data_version 按连接计）。"""
+        self.polls += 1
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if not force and getattr(self._local, 'data_version', None) == version:
+            return set()
+        self._local.data_version = version
+        self.reads += 1
+        counters = self._counters(conn)
+        with self._lock:
+            if self._seen is None:
+                # 第一次只记基线：启动时的全量加载已经包含了此前的所有改动
+                self._seen = counters
+                return set()
+            # 多个线程并发检查时计数只进不退，同一次改动只回调一次
+            changed = {t for t, v in counters.items() if v > self._seen.get(t, -1)}
+            for t in changed:
+                self._seen[t] = counters[t]
+                self.changes[t] = self.changes.get(t, 0) + 1
+        if changed:
+            for tables, fn in self._listeners:
+                hit = tables & changed
+                if hit:
+                    fn(hit)
+        return changed
+
+    def begin_write(self, conn):
+        """在写锁内（BEGIN IMMEDIATE 之后）调用：先处理其它进程已提交的改动，本事务之后的计数增量都算本进程的。"""
+        self.poll(conn, force=True)
+        self._local.writing = True
+
+    def commit(self, conn, commit):
+        """提交当前线程的事务。begin_write() 开始的事务提交前读计数，提交成功后记为已见，不触发回调。"""
+        if not getattr(self._local, 'writing', False):
+            return commit()
+        self._local.writing = False
+        counters = self._counters(conn)
+        # 提交和记为已见放在同一把锁里：兄弟线程不会在两者之间读到新计数而误当作外部改动
+        with self._lock:
+            commit()
+            if self._seen is None:
+                return
+            for t, v in counters.items():
+                if v > self._seen.get(t, -1):
+                    self._seen[t] = v
+                    self.local_commits[t] = self.local_commits.get(t, 0) + 1
+
+    def discard(self):
+        """当前线程的事务回滚了。"""
+        self._local.writing = False
+
+    def stats(self):
+        with self._lock:
+            return {"polls": self.polls, "counter_reads": self.reads, "changes": dict(self.changes),
+                    "local_commits": dict(self.local_commits),
+                    "counters": dict(self._seen or {})}
@@ -0,0 +1,159 @@
+import zlib
+
+from flask import request, current_app
+
+try:
+    import brotli  # 可选依赖：未安装时只提供 gzip
+except ImportError:
+    brotli = None
+
+DEFAULT_MIMETYPES = ('application/json', 'text/html', 'text/css', 'text/plain', 'application/javascript')
+
+
+def no_compress(f):
+    """标记某个视图函数不做响应压缩（放在 @app.route 下面）。"""
+    f._no_compress = True
+    return f
+
+
+def parse_accept_encoding(header):
+    """解析 Accept-Encoding，返回 {编码: q值}，q=0 的编码视为不接受。"""
+    result = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        result[name.strip().lower()] = q
+    return result
+
+
+class _GzipCompressor:
+    def __init__(self, level):
+        # wbits=31 输出带 gzip 头的流
+        self._c = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._c.compress(data)
+
+    def flush(self):
+        return self._c.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._c.flush(zlib.Z_FINISH)
+
+
+class _BrotliCompressor:
+    def __init__(self, quality):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._c.process(data)
+
+    def flush(self):
+        return self._c.flush()
+
+    def finish(self):
+        return self._c.finish()
+
+
+class Compress:
+    """按 Accept-Encoding 协商的响应压缩（gzip / br），支持流式响应和按接口关闭。"""
+
+    def __init__(self, app=None, config=None):
+        config = config or {}
+        self.enabled = config.get('enabled', True)
+        self.min_size = int(config.get('min_size', 1024))
+        self.gzip_level = int(config.get('gzip_level', 5))
+        self.brotli_quality = int(config.get('brotli_quality', 4))
+        self.mimetypes = set(config.get('mimetypes', DEFAULT_MIMETYPES))
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.after_request(self.after_request)
+
+    def choose_encoding(self, header):
+        accepted = parse_accept_encoding(header)
+        star = accepted.get('*', 0)
+        candidates = []
+        if brotli is not None:
+            candidates.append('br')
+        candidates.append('gzip')
+        best, best_q = None, 0
+        for enc in candidates:
+            q = accepted.get(enc, star)
+            if q > best_q:
+                best, best_q = enc, q
+        return best
+
+    def new_compressor(self, encoding):
+        if encoding == 'br':
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level)
+
+    def compress_bytes(self, data, encoding):
+        c = self.new_compressor(encoding)
+        return c.compress(data) + c.finish()
+
+    def should_compress(self, response):
+        if not self.enabled:
+            return False
+        view = current_app.view_functions.get(request.endpoint)
+        if view is not None and getattr(view, '_no_compress', False):
+            return False
+        if response.status_code < 200 or response.status_code in (204, 304):
+            return False
+        if response.direct_passthrough or 'Content-Encoding' in response.headers:
+            return False
+        if response.mimetype not in self.mimetypes:
+            return False
+        if request.method == 'HEAD':
+            return False
+        return True
+
+    def after_request(self, response):
+        if not self.should_compress(response):
+            return response
+        encoding = self.choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None:
+            return response
+        if response.is_streamed:
+            response.response = self._stream(response.response, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < self.min_size:
+                return response
+            entry = getattr(response, 'cache_entry', None)
+            if entry is not None:
+                # 响应缓存的条目：压缩结果也缓存下来，命中时不再重复压缩
+                response.set_data(entry.variant(encoding, lambda body: self.compress_bytes(body, encoding)))
+            else:
+                response.set_data(self.compress_bytes(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _stream(self, chunks, encoding):
+        # 每个块压缩后立即 flush，保证客户端能边收边解
+        c = self.new_compressor(encoding)
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                out = c.compress(chunk) + c.flush()
+                if out:
+                    yield out
+            yield c.finish()
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
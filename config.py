@@ -13,5 +13,133 @@ SERVER_CONFIG = {
     "port": 5003,
     "debug": False,
     "open_browser": True,
-    "use_waitress": True
-}
\ No newline at end of file
+    "use_waitress": True,
+    "threads": 4,           # 每个进程的 Waitress 工作线程数
+    "workers": 1,           # >1 时启用多进程模式（共享监听端口，各进程缓存靠 change_counters 保持一致）
+    "warm_up": True,        # 启动预热：检查迁移、读入数据库文件、预先执行首页查询，完成后 /api/ready 才返回 200
+    "warm_file_mb": 64,     # 预热时最多读入的数据库文件大小（进系统文件缓存）
+    "ready_timeout": 30,    # 等待就绪再打开浏览器的最长秒数
+    "drain_timeout": 10     # 停机（Ctrl+C / SIGTERM / 关闭窗口）时等待进行中请求完成的最长秒数
+}
+
+# 响应压缩（按 Accept-Encoding 协商 gzip / br；br 需要安装 brotli）
+COMPRESSION_CONFIG = {
+    "enabled": True,
+    "min_size": 1024,       # 小于该字节数的响应不压缩
+    "gzip_level": 5,        # 1-9，越大越省流量、越耗 CPU
+    "brotli_quality": 4     # 0-11
+}
+
+
+# 冷热分离：较早的已结账订单定期搬到归档库，历史/报表查询通过 all_orders 视图合并读取
+ARCHIVE_CONFIG = {
+    "enabled": True,
+    "filename": None,        # None 表示与 chess.db 同目录的 archive.db
+    "min_age_days": 180,     # 结账超过多少天的订单归档
+    "batch_size": 5000,      # 每批搬迁的订单数
+    "interval_hours": 24     # 后台归档间隔
+}
+
+# 在线备份（sqlite3 backup API，分批拷贝页面，备份期间不阻塞收银）
+BACKUP_CONFIG = {
+    "enabled": True,
+    "dir": None,             # None 表示与 chess.db 同目录下的 backups 子目录
+    "interval_hours": 6,     # 定时备份间隔
+    "keep": 7,               # 每个库保留最近几份快照
+    "pages_per_step": 256,   # 每步拷贝页数
+    "step_sleep": 0.01,      # 每步之间休眠秒数
+    "measure_stall": True    # 备份期间测量写入最长等待时间
+}
+
+# 订单号生成器：daily = ORD-日期-当日序号（默认，多进程安全）；time = ORD-时间有序 ID（单进程）
+ORDER_NUMBER_CONFIG = {
+    "generator": "daily",
+    "prefix": "ORD"
+}
+
+# 响应缓存：写接口提交后按表精确失效
+CACHE_CONFIG = {
+    "enabled": True,                    # 热点 GET 接口（房间、商品、订单列表）的响应缓存
+    "max_bytes": 16 * 1024 * 1024,      # 含压缩后的副本
+    "max_entries": 1024
+}
+
+# 请求合并：同时到达的相同只读请求只查一次库
+SINGLE_FLIGHT_CONFIG = {
+    "enabled": True,
+    "timeout": 5.0          # follower 最多等待 leader 的秒数，超时后自己查询
+}
+
+# 入座率分析（/api/analytics/occupancy，需要 numpy）
+ANALYTICS_CONFIG = {
+    "max_days": 1096,           # 单次查询最多天数
+    "max_session_hours": 48,    # 单次开房最长时长，决定往前多扫描多久的订单
+    "cache_days": 3660          # 缓存多少天已结束日期的结果
+}
+
+# 预约
+RESERVATION_CONFIG = {
+    "walkin_guard_minutes": 60,     # 房间在此时间内有预约时不允许散客开房
+    "no_show_minutes": 30,          # 预约开始后超过此时间未到店，不再占用房间
+    "open_hold_minutes": 30,        # 房间正在使用时，此时间内开始的预约视为冲突
+    "max_days_ahead": 90            # 最多提前多少天预约
+}
+
+# 数据库维护：窗口内且最近 idle_seconds 秒没有请求时执行；jobs 中可覆盖各任务的参数
+MAINTENANCE_CONFIG = {
+    "enabled": True,
+    "window": "03:00-06:00",        # 默认时间窗口，跨午夜可写 "23:00-06:00"
+    "idle_seconds": 120,
+    "check_interval_seconds": 60,
+    "jobs": {
+        "optimize": {"every_hours": 24, "budget_seconds": 30},
+        "checkpoint": {"every_hours": 1, "budget_seconds": 10, "wal_mb": 64, "window": None},   # WAL 超过 wal_mb 时截断，不限窗口
+        "vacuum": {"every_hours": 24, "budget_seconds": 60, "max_pages": 20000, "migrate_budget_seconds": 600},
+        "quick_check": {"every_hours": 168, "budget_seconds": 120}
+    }
+}
+
+# 报表只读副本：日报和分析查询走内存中的数据库副本（占用与 chess.db 相当的内存）
+REPLICA_CONFIG = {
+    "enabled": False,
+    "interval_seconds": 5           # 检查主库变化的间隔，也是副本最多落后的时间
+}
+
+# 全文检索：后台线程定期把积压的改动写进索引，检索请求只顺手处理一小批
+SEARCH_CONFIG = {
+    "sync_interval_seconds": 2,     # 后台同步间隔
+    "request_sync_rows": 50         # 每次检索前最多同步的行数（0 为不同步，只靠后台线程）
+}
+
+# 批量接口 /api/batch
+BATCH_CONFIG = {
+    "max_requests": 20              # 一次最多的子请求数
+}
+
+# 结构化日志：访问日志、审计日志写 JSON Lines（后台线程写文件，按大小轮转）；dir 为空时写到数据库目录下的 logs
+LOG_CONFIG = {
+    "access_log": True,
+    "audit_log": True,
+    "dir": None,
+    "max_bytes": 10 * 1024 * 1024,  # 单个文件上限，超过后轮转
+    "backup_count": 5               # 保留的历史文件个数
+}
+
+# 诊断接口（/api/debug/*）：只允许本机访问，有开销的默认关闭
+DEBUG_CONFIG = {
+    "profile_enabled": False,       # /api/debug/profile 采样分析
+    "max_profile_seconds": 60,
+    "profile_interval_ms": 5,
+    "slow_queries_enabled": True,   # /api/debug/slow-queries（仅本机）
+    "slow_query_ms": 50,            # 执行+取数超过该毫秒数记为慢查询；None 关闭计时
+    "slow_query_log_size": 200,
+    "slow_query_explain": True,     # 每种慢语句首次出现时抓取 EXPLAIN QUERY PLAN
+    "cache_stats_enabled": True,    # /api/debug/cache、/api/debug/single-flight 统计（仅本机）
+    "traces_enabled": False,        # 请求追踪：响应头 X-Trace-Id，/api/debug/traces 查看，日志目录 traces.jsonl（OTLP/JSON）
+    "trace_sample_rate": 1.0,       # 头部采样：记录的请求比例（请求头 traceparent 标记已采样的总是记录）
+    "trace_tail_ms": 100,           # 尾部采样：只保留不少于该毫秒数或 5xx 的 trace
+    "trace_keep": 200,              # 内存中保留的 trace 条数
+    "trace_export": True,           # 保留的 trace 是否写文件
+    "memory_enabled": False,        # /api/debug/memory（tracemalloc）
+    "memory_trace_frames": 1
+}
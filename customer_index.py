@@ -0,0 +1,156 @@
+"""会员快速查找：手机号 / 姓名 / 拼音首字母的内存前缀索引（有序数组 + bisect）。
+
+启动时从 customers 表整体加载，之后由新建、修改会员接口提交后按 id 重读写穿维护，查询不访问数据库。
+手机号同时建了反转索引，输入尾号（如后四位）也能查到。
+"""
+import bisect
+import threading
+
+try:
+    from pypinyin import lazy_pinyin, Style  # 可选依赖：多音字和二级汉字更准确
+except ImportError:
+    lazy_pinyin = None
+
+# GB2312 一级汉字按拼音排序，用区位码区间即可得到声母（无 I/U/V 开头）
+_GB2312_INITIALS = [
+    (45217, 'a'), (45253, 'b'), (45761, 'c'), (46318, 'd'), (46826, 'e'), (47010, 'f'),
+    (47297, 'g'), (47614, 'h'), (48119, 'j'), (49062, 'k'), (49324, 'l'), (49896, 'm'),
+    (50371, 'n'), (50614, 'o'), (50622, 'p'), (50906, 'q'), (51387, 'r'), (51446, 's'),
+    (52218, 't'), (52698, 'w'), (52980, 'x'), (53689, 'y'), (54481, 'z'),
+]
+_GB2312_CODES = [c for c, _ in _GB2312_INITIALS]
+_GB2312_END = 55289
+
+
+def _initial(ch):
+    if ch.isascii():
+        return ch.lower() if ch.isalnum() else ''
+    try:
+        raw = ch.encode('gb2312')
+    except UnicodeEncodeError:
+        return ''
+    if len(raw) != 2:
+        return ''
+    code = raw[0] * 256 + raw[1]
+    if code < _GB2312_CODES[0] or code > _GB2312_END:
+        return ''
+    return _GB2312_INITIALS[bisect.bisect_right(_GB2312_CODES, code) - 1][1]
+
+
+def pinyin_initials(name):
+    """'张三丰' -> 'zsf'；非汉字的字母数字原样保留（小写）。"""
+    if not name:
+        return ''
+    if lazy_pinyin is not None:
+        return ''.join(p[0] for p in lazy_pinyin(name, style=Style.FIRST_LETTER, errors='default') if p).lower()
+    return ''.join(_initial(ch) for ch in name)
+
+
+def normalize_phone(phone):
+    return ''.join(ch for ch in str(phone or '') if ch.isdigit())
+
+
+def normalize_name(name):
+    return ''.join(str(name or '').split()).lower()
+
+
+class CustomerIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = []      # 有序的 (key, customer_id)
+        self._customers = {}    # customer_id -> dict
+
+    def _keys(self, c):
+        keys = set()
+        phone = normalize_phone(c.get('phone'))
+        if phone:
+            keys.add('p:' + phone)
+            keys.add('r:' + phone[::-1])
+        name = normalize_name(c.get('name'))
+        if name:
+            keys.add('n:' + name)
+            initials = pinyin_initials(name)
+            if initials:
+                keys.add('n:' + initials)
+        return keys
+
+    def load(self, rows):
+        entries = []
+        customers = {}
+        for r in rows:
+            c = dict(r)
+            customers[c['id']] = c
+            entries.extend((k, c['id']) for k in self._keys(c))
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._customers = customers
+
+    def _remove_locked(self, customer_id):
+        old = self._customers.pop(customer_id, None)
+        if old is None:
+            return
+        for k in self._keys(old):
+            i = bisect.bisect_left(self._entries, (k, customer_id))
+            if i < len(self._entries) and self._entries[i] == (k, customer_id):
+                del self._entries[i]
+
+    def upsert(self, customer):
+        c = dict(customer)
+        with self._lock:
+            self._remove_locked(c['id'])
+            self._customers[c['id']] = c
+            for k in self._keys(c):
+                bisect.insort(self._entries, (k, c['id']))
+
+    def refresh(self, customer_id, fetch):
+        """写库提交后调用：在索引锁内用 fetch(customer_id) 重新读这一行再更新索引（行已删除时 fetch 返回 None）。
+
+        并发修改同一会员时，各请求的刷新按锁排队，最后一次刷新读到的一定是最后提交的数据，
+        不会出现先提交的旧数据后写进索引。
+        """
+        with self._lock:
+            row = fetch(customer_id)
+            if row is None:
+                self._remove_locked(customer_id)
+            else:
+                self.upsert(row)
+
+    def reload(self, fetch_all):
+        """整体重新加载，读库也在索引锁内，避免旧快照覆盖同时写穿的新数据。"""
+        with self._lock:
+            self.load(fetch_all())
+
+    def remove(self, customer_id):
+        with self._lock:
+            self._remove_locked(customer_id)
+
+    def _prefix_ids(self, key, limit, seen, out):
+        i = bisect.bisect_left(self._entries, (key,))
+        n = len(self._entries)
+        while i < n and len(out) < limit:
+            k, cid = self._entries[i]
+            if not k.startswith(key):
+                break
+            if cid not in seen:
+                seen.add(cid)
+                out.append(cid)
+            i += 1
+
+    def search(self, q, limit=10):
+        q = normalize_name(q)
+        if not q:
+            return []
+        seen, ids = set(), []
+        with self._lock:
+            digits = normalize_phone(q)
+            if digits and digits == q:
+                # 纯数字：先按手机号前缀，再按尾号
+                self._prefix_ids('p:' + digits, limit, seen, ids)
+                self._prefix_ids('r:' + digits[::-1], limit, seen, ids)
+            else:
+                self._prefix_ids('n:' + q, limit, seen, ids)
+            return [dict(self._customers[cid]) for cid in ids]
+
+    def __len__(self):
+        return len(self._customers)
@@ -0,0 +1,268 @@
+"""FTS5 全文检索：订单、会员、商品、房间。
+
+unicode61 分词器会把连续的汉字当成一个词，搜不到“三丰”“红牛”这种片段；
+trigram 分词器又不支持少于 3 个字的查询。所以写入索引前用 segment() 把每个汉字切成独立的词，
+查询时把输入转成短语查询，任意长度的中文片段、手机号/订单号前缀都能走索引，不做 LIKE 扫描。
+
+分词在 Python 里做：触发器只把改动的行记进 fts_pending（纯 SQL，任何连接写库都不受影响），
+sync() 把这些行分词后写入 FTS 表，所以别的程序写入的数据也会被检索到：启动时和后台线程
+（start_sync_thread）处理积压，检索请求只顺手处理一小批，不会在请求线程里长时间占用写锁。
+snippet 里的原文先做 HTML 转义再加 <mark>，前端可以直接用 innerHTML 展示。
+
+订单文档（房间、会员、商品名）在开单和点单时生成，反映下单当时的信息；
+订单只会被归档任务从主库删除，所以 orders 上没有删除触发器，归档后的订单仍可检索。
+"""
+import re
+import html
+import logging
+import sqlite3
+import threading
+
+_CJK = '\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff'
+_CJK_CHAR = re.compile(f'([{_CJK}])')
+_SPACES = re.compile(r'\s+')
+_TOKEN = re.compile(f'[{_CJK}]|[^\\W_]+')
+# 展示时汉字与中文标点之间的空格都去掉
+_WIDE = _CJK + '\u3000-\u303f\uff00-\uffef'
+_JOINED = re.compile(f'([{_WIDE}](?:</mark>)?) ((?:<mark>)?[{_WIDE}])')
+# snippet() 先用控制字符标出命中位置，转义原文之后再换成 <mark>
+_MARK_OPEN, _MARK_CLOSE = '\x02', '\x03'
+
+TYPES = ('order', 'customer', 'product', 'room')
+
+FTS_TABLES = {
+    "orders_fts": "CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5(order_number, room, customer, products)",
+    "customers_fts": "CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(name, phone)",
+    "products_fts": "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(name, category)",
+    "rooms_fts": "CREATE VIRTUAL TABLE IF NOT EXISTS rooms_fts USING fts5(name, room_number, room_type, description)",
+}
+
+# 待更新的索引行：触发器只记下 (类型, id)，由 sync() 在 Python 里分词后写入 FTS 表
+PENDING_TABLE = """CREATE TABLE IF NOT EXISTS fts_pending (
+    kind TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (kind, id)
+) WITHOUT ROWID"""
+
+# 类型 -> (FTS 表, 列, 源数据查询, 各列是否分词)。源数据查询返回 id 和各列原文
+_SOURCES = {
+    "order": ("orders_fts", ("order_number", "room", "customer", "products"), """
+        SELECT o.id, o.order_number,
+               (SELECT IFNULL(r.name,'') || ' ' || IFNULL(r.room_number,'') || ' ' || IFNULL(r.description,'')
+                FROM rooms r WHERE r.id = o.room_id),
+               (SELECT IFNULL(c.name,'') || ' ' || IFNULL(c.phone,'') FROM customers c WHERE c.id = o.customer_id),
+               (SELECT group_concat(p.name, '，') FROM all_order_products op
+                JOIN products p ON p.id = op.product_id WHERE op.order_id = o.id)
+        FROM all_orders o WHERE o.id IN ({ids})""", (False, True, True, True)),
+    "customer": ("customers_fts", ("name", "phone"),
+                 "SELECT id, name, phone FROM customers WHERE id IN ({ids})", (True, False)),
+    "product": ("products_fts", ("name", "category"),
+                "SELECT id, name, category FROM products WHERE id IN ({ids})", (True, True)),
+    "room": ("rooms_fts", ("name", "room_number", "room_type", "description"),
+             "SELECT id, name, room_number, room_type, description FROM rooms WHERE id IN ({ids})", (True, True, True, True)),
+}
+
+# 新建 FTS 表时把现有数据全部排进队列
+_BACKFILL = {
+    "orders_fts": "INSERT OR IGNORE INTO fts_pending (kind, id) SELECT 'order', id FROM all_orders",
+    "customers_fts": "INSERT OR IGNORE INTO fts_pending (kind, id) SELECT 'customer', id FROM customers",
+    "products_fts": "INSERT OR IGNORE INTO fts_pending (kind, id) SELECT 'product', id FROM products",
+    "rooms_fts": "INSERT OR IGNORE INTO fts_pending (kind, id) SELECT 'room', id FROM rooms",
+}
+
+
+def _enqueue_trigger(name, event, table, kind, ref):
+    return (f"CREATE TRIGGER IF NOT EXISTS {name} AFTER {event} ON {table} BEGIN "
+            f"INSERT OR IGNORE INTO fts_pending (kind, id) VALUES ('{kind}', {ref}); END")
+
+
+# 触发器是纯 SQL，不依赖本程序注册的函数：sqlite3 命令行、数据库浏览器、脚本写库都不受影响
+FTS_TRIGGERS = [
+    # 会员
+    _enqueue_trigger("customers_fts_ai", "INSERT", "customers", "customer", "NEW.id"),
+    _enqueue_trigger("customers_fts_au", "UPDATE OF name, phone", "customers", "customer", "NEW.id"),
+    _enqueue_trigger("customers_fts_ad", "DELETE", "customers", "customer", "OLD.id"),
+    # 商品
+    _enqueue_trigger("products_fts_ai", "INSERT", "products", "product", "NEW.id"),
+    _enqueue_trigger("products_fts_au", "UPDATE OF name, category", "products", "product", "NEW.id"),
+    _enqueue_trigger("products_fts_ad", "DELETE", "products", "product", "OLD.id"),
+    # 房间
+    _enqueue_trigger("rooms_fts_ai", "INSERT", "rooms", "room", "NEW.id"),
+    _enqueue_trigger("rooms_fts_au", "UPDATE OF name, room_number, room_type, description", "rooms", "room", "NEW.id"),
+    _enqueue_trigger("rooms_fts_ad", "DELETE", "rooms", "room", "OLD.id"),
+    # 订单：开单、换房/换会员、点单时重建该订单的文档
+    _enqueue_trigger("orders_fts_ai", "INSERT", "orders", "order", "NEW.id"),
+    _enqueue_trigger("orders_fts_au", "UPDATE OF room_id, customer_id", "orders", "order", "NEW.id"),
+    _enqueue_trigger("order_products_fts_ai", "INSERT", "order_products", "order", "NEW.order_id"),
+]
+
+
+def segment(text):
+    """把汉字切成独立的词：'VIP8大包' -> 'VIP8 大 包'。"""
+    if text is None:
+        return None
+    return _SPACES.sub(' ', _CJK_CHAR.sub(r' \1 ', str(text))).strip()
+
+
+def desegment(text):
+    """去掉 segment 在汉字之间加的空格（用于 snippet 展示）。"""
+    if not text:
+        return text
+    prev = None
+    while prev != text:
+        prev, text = text, _JOINED.sub(r'\1\2', text)
+    return text
+
+
+def highlight(snippet):
+    """snippet() 的结果转成 HTML：原文转义，命中部分包上 <mark>，再去掉分词加的空格。"""
+    if snippet is None:
+        return None
+    text = html.escape(snippet, quote=False).replace(_MARK_OPEN, '<mark>').replace(_MARK_CLOSE, '</mark>')
+    return desegment(text)
+
+
+def drop_legacy_triggers(conn):
+    """删掉旧版调用 Python 函数 fts_segment 的触发器（没有注册该函数的连接写这些表会报错），由 ensure_fts 重建。"""
+    names = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%fts_segment%'").fetchall()]
+    for name in names:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+    return names
+
+
+def ensure_fts(conn):
+    """创建 FTS 表、待更新队列和触发器，新建的表用现有数据回填。SQLite 未编译 FTS5 时返回 False。
+
+    conn 需挂载好 all_orders 视图（archive.attach）。
+    """
+    try:
+        drop_legacy_triggers(conn)
+        existing = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+        conn.execute(PENDING_TABLE)
+        for name, ddl in FTS_TABLES.items():
+            conn.execute(ddl)
+            if name not in existing:
+                conn.execute(_BACKFILL[name])
+        for ddl in FTS_TRIGGERS:
+            conn.execute(ddl)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        logging.warning("全文检索不可用: %s", e)
+        return False
+    sync(conn)
+    return True
+
+
+def sync(conn, batch=500, limit=None):
+    """把 fts_pending 里的行分词后写入 FTS 表（源数据已删除的只删索引），返回处理的行数。
+
+    每批一个短事务，limit 为本次最多处理的行数；写库繁忙时放弃本次同步（后台线程下一轮再做）。
+    """
+    done = 0
+    try:
+        while limit is None or done < limit:
+            size = batch if limit is None else min(batch, limit - done)
+            pending = conn.execute("SELECT kind, id FROM fts_pending LIMIT ?", (size,)).fetchall()
+            if not pending:
+                return done
+            by_kind = {}
+            for kind, id_ in pending:
+                by_kind.setdefault(kind, []).append(id_)
+            for kind, ids in by_kind.items():
+                marks = ",".join("?" * len(ids))
+                if kind in _SOURCES:
+                    table, columns, sql, segmented = _SOURCES[kind]
+                    conn.execute(f"DELETE FROM {table} WHERE rowid IN ({marks})", ids)
+                    rows = [(r[0], *(segment(v) if seg else v for v, seg in zip(r[1:], segmented)))
+                            for r in conn.execute(sql.format(ids=marks), ids).fetchall()]
+                    conn.executemany(f"INSERT INTO {table} (rowid, {', '.join(columns)}) "
+                                     f"VALUES (?, {', '.join('?' * len(columns))})", rows)
+                conn.execute(f"DELETE FROM fts_pending WHERE kind = ? AND id IN ({marks})", [kind, *ids])
+            conn.commit()
+            done += len(pending)
+        return done
+    except sqlite3.OperationalError as e:
+        conn.rollback()
+        logging.warning("全文检索索引同步失败: %s", e)
+        return done
+
+
+def start_sync_thread(db, interval=2.0, stop=None):
+    """后台同步线程：每 interval 秒把积压的改动写进索引。db 为 testapp.Database，使用独立连接。"""
+    stop = stop or threading.Event()
+
+    def loop():
+        conn = None
+        try:
+            conn = db.create_connection()
+            while not stop.is_set():
+                try:
+                    sync(conn)
+                except Exception as e:
+                    logging.error("全文检索后台同步失败: %s", e)
+                stop.wait(interval)
+        finally:
+            if conn is not None:
+                conn.close()
+
+    t = threading.Thread(target=loop, name="fts-sync", daemon=True)
+    t.start()
+    return t
+
+
+def build_query(q):
+    """把用户输入转成 FTS5 查询：空白分隔的每一段是一个短语（末尾前缀匹配），段之间为 AND。"""
+    phrases = []
+    for term in (q or '').split():
+        tokens = _TOKEN.findall(term)
+        if tokens:
+            phrases.append('"' + ' '.join(tokens) + '"*')
+    return ' AND '.join(phrases)
+
+
+_HIT_SQL = {
+    "order": "SELECT 'order' AS type, rowid AS id, rank, snippet(orders_fts, -1, char(2), char(3), '…', 12) AS snippet "
+             "FROM orders_fts WHERE orders_fts MATCH :q",
+    "customer": "SELECT 'customer' AS type, rowid AS id, rank, snippet(customers_fts, -1, char(2), char(3), '…', 12) AS snippet "
+                "FROM customers_fts WHERE customers_fts MATCH :q",
+    "product": "SELECT 'product' AS type, rowid AS id, rank, snippet(products_fts, -1, char(2), char(3), '…', 12) AS snippet "
+               "FROM products_fts WHERE products_fts MATCH :q",
+    "room": "SELECT 'room' AS type, rowid AS id, rank, snippet(rooms_fts, -1, char(2), char(3), '…', 12) AS snippet "
+            "FROM rooms_fts WHERE rooms_fts MATCH :q",
+}
+
+_DETAIL_SQL = {
+    "order": "SELECT id, order_number, room_id, customer_id, start_time, end_time, total_amount, payment_status "
+             "FROM all_orders WHERE id IN ({ids})",
+    "customer": "SELECT id, name, phone, member_level FROM customers WHERE id IN ({ids})",
+    "product": "SELECT id, name, price, category, status FROM products WHERE id IN ({ids})",
+    "room": "SELECT id, name, room_number, room_type, status, description FROM rooms WHERE id IN ({ids})",
+}
+
+
+def search(cur, q, types=TYPES, limit=20, offset=0):
+    """跨表检索，按 bm25 相关度统一排序并分页。返回 (hits, total)。"""
+    match = build_query(q)
+    types = [t for t in types if t in _HIT_SQL]
+    if not match or not types:
+        return [], 0
+    union = " UNION ALL ".join(_HIT_SQL[t] for t in types)
+    cur.execute(f"SELECT COUNT(*) FROM ({union})", {"q": match})
+    total = cur.fetchone()[0]
+    cur.execute(f"SELECT * FROM ({union}) ORDER BY rank LIMIT :limit OFFSET :offset",
+                {"q": match, "limit": limit, "offset": offset})
+    hits = [{"type": r[0], "id": r[1], "score": round(-r[2], 4), "snippet": highlight(r[3])} for r in cur.fetchall()]
+    # 逐类型批量补全展示字段
+    by_type = {}
+    for h in hits:
+        by_type.setdefault(h["type"], []).append(h["id"])
+    details = {}
+    for t, ids in by_type.items():
+        cur.execute(_DETAIL_SQL[t].format(ids=",".join("?" * len(ids))), ids)
+        for r in cur.fetchall():
+            details[(t, r[0])] = dict(r)
+    for h in hits:
+        h["data"] = details.get((h["type"], h["id"]))
+    return hits, total
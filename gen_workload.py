@@ -0,0 +1,194 @@
+"""生成合成历史数据，用于压测和容量评估。
+
+用法示例：
+    python gen_workload.py --db data/bench.db --days 1095 --orders-per-day 1000 --rooms 150
+会生成约三年、百万级订单及其商品明细。已有数据不会被删除，新数据追加在后面。
+--db 默认是营业库旁边的 bench.db，不会写进营业库。
+
+同一房间的场次不重叠：到店时没有空房的订单直接放弃（记入 skipped），房间数要和每日订单数匹配。
+"""
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import datetime
+
+from config import DB_CONFIG
+import init_db
+
+# 一天内各小时的开房权重：下午开始上客，晚上 19-22 点为高峰，凌晨收尾
+HOUR_WEIGHTS = [
+    3, 2, 1, 0.5, 0.2, 0.1, 0.1, 0.2, 0.5, 1, 2, 3,
+    4, 6, 8, 8, 7, 7, 9, 12, 14, 13, 10, 6,
+]
+# 周末客流系数（周一=0）
+WEEKDAY_FACTOR = [0.8, 0.8, 0.85, 0.9, 1.1, 1.4, 1.3]
+
+ROOM_TYPES = [('小包', 20), ('中包', 25), ('大包', 30), ('豪包', 45)]
+PRODUCT_CATEGORIES = {
+    '饮料': (3, 15),
+    '零食': (3, 20),
+    '香烟': (15, 60),
+    '茶水': (10, 50),
+}
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗郑梁谢宋唐许韩冯邓曹彭曾肖田董袁潘于蒋蔡余杜叶程苏魏吕丁任沈姚卢姜崔钟谭陆汪范金石廖贾夏韦付方白邹孟熊秦邱江尹薛闫段雷侯龙史陶黎贺顾毛郝龚邵万钱严覃武戴莫孔向汤'
+GIVEN = '伟芳娜秀英敏静丽强磊军洋勇艳杰娟涛明超秀兰霞平刚桂英华建国志红梅玉兰飞鹏辉斌宇浩凯'
+FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def ensure_rooms(cur, rng, count):
+    cur.execute("SELECT COUNT(1) FROM rooms")
+    have = cur.fetchone()[0]
+    rows = []
+    for i in range(have, count):
+        rtype, price = rng.choice(ROOM_TYPES)
+        number = f"R{i + 1:03d}"
+        rows.append((number, number, rtype, price))
+    cur.executemany("INSERT INTO rooms (name, room_number, room_type, price_per_hour) VALUES (?,?,?,?)", rows)
+    cur.execute("SELECT id, price_per_hour FROM rooms ORDER BY id")
+    return [(r[0], float(r[1] or 0)) for r in cur.fetchall()]
+
+
+def ensure_products(cur, rng, count):
+    cur.execute("SELECT COUNT(1) FROM products")
+    have = cur.fetchone()[0]
+    rows = []
+    cats = list(PRODUCT_CATEGORIES)
+    for i in range(have, count):
+        cat = rng.choice(cats)
+        lo, hi = PRODUCT_CATEGORIES[cat]
+        rows.append((f"{cat}{i + 1}", rng.randint(lo, hi), 1000, cat))
+    cur.executemany("INSERT INTO products (name, price, stock, category) VALUES (?,?,?,?)", rows)
+    cur.execute("SELECT id, price FROM products WHERE status = 'active' ORDER BY id")
+    return [(r[0], float(r[1] or 0)) for r in cur.fetchall()]
+
+
+def ensure_customers(cur, rng, count):
+    cur.execute("SELECT COUNT(1) FROM customers")
+    have = cur.fetchone()[0]
+    rows = []
+    for i in range(have, count):
+        name = rng.choice(SURNAMES) + ''.join(rng.choice(GIVEN) for _ in range(rng.randint(1, 2)))
+        # 用序号保证手机号唯一
+        phone = f"1{rng.choice('3578')}{i:09d}"
+        rows.append((name, phone))
+    cur.executemany("INSERT OR IGNORE INTO customers (name, phone) VALUES (?,?)", rows)
+    cur.execute("SELECT id FROM customers ORDER BY id")
+    return [r[0] for r in cur.fetchall()]
+
+
+def session_hours(rng):
+    # 对数正态分布：大部分 2-5 小时，少量通宵
+    return min(12.0, max(0.5, rng.lognormvariate(1.1, 0.45)))
+
+
+def generate(db_path, days, orders_per_day, rooms=20, products=60, customers=5000,
+             member_ratio=0.4, seed=None, batch_days=30, log=print):
+    init_db.ensure_initialized(db_path)
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    # 批量导入期间放宽持久性要求
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    cur = conn.cursor()
+    room_rows = ensure_rooms(cur, rng, rooms)
+    product_rows = ensure_products(cur, rng, products)
+    customer_ids = ensure_customers(cur, rng, customers)
+    conn.commit()
+
+    cur.execute("SELECT IFNULL(MAX(id),0) FROM orders")
+    next_order_id = cur.fetchone()[0] + 1
+    # 每个房间空出来的时间（接着已有订单往后排）；有未结订单的房间，新场次要在它开始前结束
+    free_at = {room_id: datetime.datetime.min for room_id, _ in room_rows}
+    cur.execute("SELECT room_id, MAX(end_time) FROM orders WHERE end_time IS NOT NULL GROUP BY room_id")
+    for room_id, end_time in cur.fetchall():
+        free_at[room_id] = datetime.datetime.strptime(end_time[:19], FMT)
+    cur.execute("SELECT room_id, MIN(start_time) FROM orders WHERE payment_status = 'unpaid' GROUP BY room_id")
+    busy_from = {room_id: datetime.datetime.strptime(start[:19], FMT) for room_id, start in cur.fetchall()}
+    hours = list(range(24))
+    today = datetime.date.today()
+    first_day = today - datetime.timedelta(days=days)
+    total_orders = 0
+    total_lines = 0
+    skipped = 0
+    started = time.time()
+    order_batch, line_batch = [], []
+
+    def flush():
+        cur.executemany("INSERT INTO orders (id, order_number, room_id, customer_id, start_time, end_time, total_hours, "
+                        "total_amount, product_total, payment_status, created_at, updated_at) "
+                        "VALUES (?,?,?,?,?,?,?,?,?,'paid',?,?)", order_batch)
+        cur.executemany("INSERT INTO order_products (order_id, product_id, quantity, unit_price, total_price, created_at) "
+                        "VALUES (?,?,?,?,?,?)", line_batch)
+        conn.commit()
+        order_batch.clear()
+        line_batch.clear()
+
+    for day_index in range(days):
+        day = first_day + datetime.timedelta(days=day_index)
+        expected = orders_per_day * WEEKDAY_FACTOR[day.weekday()]
+        n = max(0, int(rng.gauss(expected, expected * 0.1)))
+        day_start = datetime.datetime.combine(day, datetime.time())
+        starts = sorted(day_start + datetime.timedelta(hours=hour, seconds=rng.randrange(3600))
+                        for hour in rng.choices(hours, weights=HOUR_WEIGHTS, k=n))
+        for st in starts:
+            dur = session_hours(rng)
+            et = st + datetime.timedelta(hours=dur)
+            free = [r for r in room_rows if free_at[r[0]] <= st and et <= busy_from.get(r[0], datetime.datetime.max)]
+            if not free:
+                skipped += 1
+                continue
+            room_id, price = rng.choice(free)
+            free_at[room_id] = et
+            total_hours = round(dur, 1)
+            room_amount = round(total_hours * price, 2)
+            customer_id = rng.choice(customer_ids) if customer_ids and rng.random() < member_ratio else None
+            order_id = next_order_id
+            next_order_id += 1
+            product_total = 0.0
+            for _ in range(rng.choices((0, 1, 2, 3, 4, 5), weights=(20, 30, 25, 12, 8, 5))[0]):
+                pid, unit = rng.choice(product_rows)
+                qty = rng.choices((1, 2, 3, 4), weights=(60, 25, 10, 5))[0]
+                line_total = round(unit * qty, 2)
+                product_total += line_total
+                ts = (st + datetime.timedelta(seconds=rng.randrange(max(1, int(dur * 3600))))).strftime(FMT)
+                line_batch.append((order_id, pid, qty, unit, line_total, ts))
+            product_total = round(product_total, 2)
+            st_s, et_s = st.strftime(FMT), et.strftime(FMT)
+            order_batch.append((order_id, f"SYN-{order_id:08d}", room_id, customer_id, st_s, et_s, total_hours,
+                                round(room_amount + product_total, 2), product_total, st_s, et_s))
+            total_orders += 1
+        if (day_index + 1) % batch_days == 0:
+            total_lines += len(line_batch)
+            flush()
+            log(f"[{day}] orders={total_orders} elapsed={time.time() - started:.1f}s")
+    total_lines += len(line_batch)
+    flush()
+    conn.execute("ANALYZE")
+    conn.close()
+    return {"orders": total_orders, "order_products": total_lines, "skipped": skipped,
+            "seconds": round(time.time() - started, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成合成棋牌室历史数据")
+    parser.add_argument('--db', default=os.path.join(os.path.dirname(DB_CONFIG.get('filename')), 'bench.db'),
+                        help="目标 SQLite 文件（默认营业库旁边的 bench.db）")
+    parser.add_argument('--days', type=int, default=365, help="历史天数")
+    parser.add_argument('--orders-per-day', type=int, default=300, help="平均每日订单数")
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--products', type=int, default=60)
+    parser.add_argument('--customers', type=int, default=5000)
+    parser.add_argument('--member-ratio', type=float, default=0.4, help="会员订单占比")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+    result = generate(args.db, args.days, args.orders_per_day, rooms=args.rooms, products=args.products,
+                      customers=args.customers, member_ratio=args.member_ratio, seed=args.seed,
+                      log=lambda m: print(m, file=sys.stderr))
+    print(result)
+
+
+if __name__ == "__main__":
+    main()
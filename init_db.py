@@ -1,6 +1,31 @@
 import sqlite3
 import os
 
+import fulltext
+import coherence
+
+# 由 TEXT 时间、REAL 金额派生的整数列：时间为秒数（strftime('%s')，按 UTC 解释本地时间，只用于区间和差值），
+# 金额为分。(列名, 来源列, 表达式)，普通 INTEGER 列由触发器在写入时填好，读的时候不再逐行换算；
+# 接口仍输出原来的字符串和小数。归档库由 archive.attach 补上同样的列，搬迁时连值一起复制。
+DERIVED_COLUMNS = {
+    "orders": [
+        ("start_ts", "start_time", "CAST(strftime('%s', start_time) AS INTEGER)"),
+        ("end_ts", "end_time", "CAST(strftime('%s', end_time) AS INTEGER)"),
+        ("total_cents", "total_amount", "CAST(round(total_amount * 100) AS INTEGER)"),
+        ("product_cents", "product_total", "CAST(round(product_total * 100) AS INTEGER)"),
+    ],
+    "order_products": [
+        ("unit_cents", "unit_price", "CAST(round(unit_price * 100) AS INTEGER)"),
+        ("total_cents", "total_price", "CAST(round(total_price * 100) AS INTEGER)"),
+    ],
+    "products": [
+        ("price_cents", "price", "CAST(round(price * 100) AS INTEGER)"),
+    ],
+    "rooms": [
+        ("price_cents", "price_per_hour", "CAST(round(price_per_hour * 100) AS INTEGER)"),
+    ],
+}
+
 def create_tables(conn):
     cur = conn.cursor()
     # 启用外键
@@ -71,6 +96,51 @@ def create_tables(conn):
         FOREIGN KEY (product_id) REFERENCES products(id)
     );
     """)
+    # 订单号每日计数器（见 order_numbers.DailyCounterGenerator）
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS order_counters (
+        day TEXT PRIMARY KEY,
+        value INTEGER NOT NULL DEFAULT 0
+    );
+    """)
+    # 维护任务上次执行时间（见 maintenance.py）
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS maintenance_runs (
+        job TEXT PRIMARY KEY,
+        last_run REAL NOT NULL
+    );
+    """)
+    # 预约：status 为 booked / cancelled / fulfilled，到店开房后记录 order_id
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reservations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        room_id INTEGER NOT NULL,
+        customer_id INTEGER,
+        contact_name TEXT,
+        contact_phone TEXT,
+        start_time DATETIME NOT NULL,
+        end_time DATETIME NOT NULL,
+        status TEXT DEFAULT 'booked',
+        order_id INTEGER,
+        note TEXT DEFAULT '',
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (room_id) REFERENCES rooms(id),
+        FOREIGN KEY (customer_id) REFERENCES customers(id)
+    );
+    """)
+    conn.commit()
+
+def create_indexes(conn):
+    cur = conn.cursor()
+    # 历史列表按 start_time 倒序、报表按 end_time 取区间、明细按 order_id 汇总
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_start_time ON orders(start_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_end_time ON orders(end_time)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_order_products_order_id ON order_products(order_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reservations_start_time ON reservations(start_time)")
+    # 报表、分析按整数时间取区间
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_start_ts ON orders(start_ts)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_end_ts ON orders(end_ts)")
     conn.commit()
 
 def add_column_if_missing(conn, table, column_name, column_def):
@@ -81,6 +151,45 @@ def add_column_if_missing(conn, table, column_name, column_def):
         cur.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
         conn.commit()
 
+def add_derived_columns(conn, schema="main", tables=None):
+    """补上 DERIVED_COLUMNS 中缺少的列，并为已有数据回填一次。"""
+    for table in tables or DERIVED_COLUMNS:
+        columns = DERIVED_COLUMNS[table]
+        have = {r[1] for r in conn.execute(f"PRAGMA {schema}.table_info('{table}')").fetchall()}
+        if not have:
+            continue
+        missing = [name for name, _, _ in columns if name not in have]
+        for name in missing:
+            conn.execute(f"ALTER TABLE {schema}.{table} ADD COLUMN {name} INTEGER")
+        if missing:
+            sets = ", ".join(f"{name} = {expr}" for name, _, expr in columns)
+            conn.execute(f"UPDATE {schema}.{table} SET {sets}")
+    conn.commit()
+
+def create_derived_triggers(conn):
+    """插入和改动来源列后重算派生列（只改派生列，不会再次触发自身或全文索引触发器）。"""
+    for table, columns in DERIVED_COLUMNS.items():
+        sets = ", ".join(f"{name} = {expr}" for name, _, expr in columns)
+        sources = ", ".join(source for _, source, _ in columns)
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_derived_ai AFTER INSERT ON {table} BEGIN
+            UPDATE {table} SET {sets} WHERE id = NEW.id;
+        END""")
+        conn.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_derived_au AFTER UPDATE OF {sources} ON {table} BEGIN
+            UPDATE {table} SET {sets} WHERE id = NEW.id;
+        END""")
+    conn.commit()
+
+def missing_schema(conn):
+    """就绪检查用：返回缺少的表、派生列和触发器，空列表表示迁移都已完成。"""
+    tables = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+    triggers = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'").fetchall()}
+    missing = [f"table {t}" for t in coherence.TRACKED_TABLES + ("change_counters",) if t not in tables]
+    for table, columns in DERIVED_COLUMNS.items():
+        have = {r[1] for r in conn.execute(f"PRAGMA table_info('{table}')").fetchall()}
+        missing += [f"column {table}.{name}" for name, _, _ in columns if name not in have]
+        missing += [f"trigger {table}_derived_{op}" for op in ("ai", "au") if f"{table}_derived_{op}" not in triggers]
+    return missing
+
 def insert_initial_data(conn):
     cur = conn.cursor()
     # 检查 rooms 是否已有数据
@@ -115,10 +224,21 @@ def ensure_initialized(db_path):
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row
+    # 旧版全文检索触发器调用 Python 函数 fts_segment，写库前先删掉（testapp 启动时由 fulltext.ensure_fts 重建）
+    fulltext.drop_legacy_triggers(conn)
+    # 新库直接使用增量 vacuum（已有数据库由 maintenance 的 vacuum 任务迁移），必须在建表前设置
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL;")
+    # WAL：读不阻塞写，在线备份和报表查询不会卡住收银
+    conn.execute("PRAGMA journal_mode=WAL;")
     create_tables(conn)
     # 对已有数据库做兼容性检查：缺少则添加
     add_column_if_missing(conn, "rooms", "name", "name TEXT")
     add_column_if_missing(conn, "rooms", "description", "description TEXT DEFAULT ''")
     # 其它表或列的兼容性迁移可按需添加
+    add_derived_columns(conn)
+    create_derived_triggers(conn)
+    create_indexes(conn)
+    # 多进程部署时各进程靠表级变更计数器让缓存失效（见 coherence.py）
+    coherence.install(conn)
     insert_initial_data(conn)
     conn.close()
\ No newline at end of file
@@ -0,0 +1,344 @@
+"""多线程 HTTP 压测：模拟晚高峰多台终端同时开房/点单/结账/刷新看板/查报表。
+
+先启动服务（python testapp.py），再运行：
+    python loadtest.py --threads 16 --duration 60 --output result.json
+结果为 JSON：吞吐量、各操作 p50/p95/p99 延迟（毫秒）、错误率。
+压测只点单、结账自己开出的订单；服务上已有进行中订单时默认拒绝运行（见 --allow-active）。
+
+并发正确性检查（同一房间 50 个并发开房、同一订单 50 个并发结账，必须各只成功一次）：
+    python loadtest.py --race 50
+"""
+import sys
+import json
+import math
+import gzip
+import time
+import random
+import argparse
+import datetime
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from config import SERVER_CONFIG
+
+DEFAULT_MIX = "open=1,add=4,close=1,board=6,report=1"
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    unknown = set(mix) - set(Worker.OPS)
+    if unknown:
+        raise ValueError(f"未知操作: {', '.join(sorted(unknown))}")
+    return mix
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.rejected = {}
+
+    def record(self, op, seconds, outcome):
+        with self.lock:
+            self.latencies.setdefault(op, []).append(seconds * 1000.0)
+            if outcome == 'error':
+                self.errors[op] = self.errors.get(op, 0) + 1
+            elif outcome == 'rejected':
+                self.rejected[op] = self.rejected.get(op, 0) + 1
+
+    def summary(self, elapsed):
+        ops = {}
+        all_lat = []
+        total_errors = 0
+        for op, lat in sorted(self.latencies.items()):
+            lat.sort()
+            all_lat.extend(lat)
+            errors = self.errors.get(op, 0)
+            total_errors += errors
+            ops[op] = {
+                "count": len(lat),
+                "errors": errors,
+                "rejected": self.rejected.get(op, 0),
+                "error_rate": round(errors / len(lat), 4) if lat else 0,
+                "p50_ms": round(percentile(lat, 50), 2),
+                "p95_ms": round(percentile(lat, 95), 2),
+                "p99_ms": round(percentile(lat, 99), 2),
+                "max_ms": round(lat[-1], 2),
+                "mean_ms": round(sum(lat) / len(lat), 2),
+            }
+        all_lat.sort()
+        total = len(all_lat)
+        return {
+            "elapsed_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0,
+            "errors": total_errors,
+            "error_rate": round(total_errors / total, 4) if total else 0,
+            "p50_ms": round(percentile(all_lat, 50), 2) if total else None,
+            "p95_ms": round(percentile(all_lat, 95), 2) if total else None,
+            "p99_ms": round(percentile(all_lat, 99), 2) if total else None,
+            "ops": ops,
+        }
+
+
+class SharedState:
+    """所有线程共享的进行中订单池（只有压测自己开出的订单），模拟多台终端操作同一批房间。"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.open_orders = []
+        self.product_ids = []
+
+    def add_order(self, order_number):
+        with self.lock:
+            self.open_orders.append(order_number)
+
+    def pick_order(self, rng):
+        with self.lock:
+            return rng.choice(self.open_orders) if self.open_orders else None
+
+    def take_order(self, rng):
+        with self.lock:
+            if not self.open_orders:
+                return None
+            return self.open_orders.pop(rng.randrange(len(self.open_orders)))
+
+
+class Worker(threading.Thread):
+    OPS = ('open', 'add', 'close', 'board', 'report')
+
+    def __init__(self, host, port, mix, state, stats, deadline, seed=None, use_gzip=False):
+        super().__init__(daemon=True)
+        self.host, self.port = host, port
+        self.names = list(mix)
+        self.weights = [mix[n] for n in self.names]
+        self.state, self.stats, self.deadline = state, stats, deadline
+        self.rng = random.Random(seed)
+        self.use_gzip = use_gzip
+        self.conn = None
+
+    def request(self, method, path, body=None):
+        headers = {"Connection": "keep-alive"}
+        if self.use_gzip:
+            headers["Accept-Encoding"] = "gzip"
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers["Content-Type"] = "application/json"
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, path, body=payload, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # 服务端关闭了长连接时重连一次
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        if resp.getheader('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        try:
+            parsed = json.loads(data) if data else {}
+        except ValueError:
+            parsed = {}
+        return resp.status, parsed
+
+    def timed(self, op, method, path, body=None):
+        t0 = time.perf_counter()
+        try:
+            status, parsed = self.request(method, path, body)
+        except Exception:
+            self.stats.record(op, time.perf_counter() - t0, 'error')
+            return None
+        elapsed = time.perf_counter() - t0
+        if status >= 500:
+            outcome = 'error'
+        elif status >= 400 or not parsed.get('success', True):
+            # 房间已被占用、订单已结账等业务拒绝，不算错误
+            outcome = 'rejected'
+        else:
+            outcome = 'ok'
+        self.stats.record(op, elapsed, outcome)
+        return parsed if outcome == 'ok' else None
+
+    def op_open(self):
+        avail = self.timed('board', 'GET', '/api/rooms/available')
+        if not avail or not avail.get('data'):
+            return
+        room = self.rng.choice(avail['data'])
+        res = self.timed('open', 'POST', f"/api/rooms/{room['id']}/open", {})
+        if res and res.get('order_number'):
+            self.state.add_order(res['order_number'])
+
+    def op_add(self):
+        order_number = self.state.pick_order(self.rng)
+        if not order_number or not self.state.product_ids:
+            return self.op_open()
+        body = {"product_id": self.rng.choice(self.state.product_ids), "quantity": self.rng.randint(1, 3)}
+        self.timed('add', 'POST', f"/api/orders/{order_number}/products", body)
+
+    def op_close(self):
+        order_number = self.state.take_order(self.rng)
+        if not order_number:
+            return self.op_open()
+        self.timed('close', 'POST', f"/api/orders/{order_number}/close")
+
+    def op_board(self):
+        # 对应前端看板刷新
+        self.timed('board', 'GET', '/api/rooms')
+        self.timed('board', 'GET', '/api/orders?active=1')
+
+    def op_report(self):
+        day = datetime.date.today() - datetime.timedelta(days=self.rng.randrange(365))
+        self.timed('report', 'GET', f"/api/report/daily?date={day:%Y-%m-%d}")
+        self.timed('report', 'GET', '/api/orders')
+
+    def run(self):
+        while time.time() < self.deadline:
+            op = self.rng.choices(self.names, weights=self.weights)[0]
+            getattr(self, 'op_' + op)()
+        if self.conn is not None:
+            self.conn.close()
+
+
+def run_load(url, threads=8, duration=30.0, mix=DEFAULT_MIX, seed=None, use_gzip=False, cleanup=True,
+             allow_active=False):
+    """压测只点单、结账自己开出的订单。服务上已有进行中订单（可能是真实顾客）时默认拒绝运行，
+    allow_active=True 时照常运行，但不碰这些订单。"""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    mix = parse_mix(mix) if isinstance(mix, str) else mix
+    state, stats = SharedState(), Stats()
+    bootstrap = Worker(host, port, mix, state, Stats(), 0)
+    _, active = bootstrap.request('GET', '/api/orders?active=1')
+    existing = len(active.get('data') or [])
+    if existing and not allow_active:
+        raise RuntimeError(f"已有 {existing} 张进行中订单，可能是真实顾客；请对测试库压测，或加 --allow-active（不会碰这些订单）")
+    _, products = bootstrap.request('GET', '/api/products')
+    state.product_ids = [p['id'] for p in products.get('data') or []]
+
+    started = time.time()
+    deadline = started + duration
+    workers = [Worker(host, port, mix, state, stats, deadline, seed=None if seed is None else seed + i,
+                      use_gzip=use_gzip) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.time() - started
+    result = stats.summary(elapsed)
+    result.update({"url": url, "threads": threads, "mix": mix})
+    if cleanup:
+        # 结掉压测中开出的订单，房间恢复可用
+        for order_number in list(state.open_orders):
+            bootstrap.request('POST', f"/api/orders/{order_number}/close")
+    return result
+
+
+def _fire_together(host, port, parallel, method, path, body=None):
+    """parallel 个线程在同一时刻发出同一个请求，返回 [(status, json)]。"""
+    barrier = threading.Barrier(parallel)
+    results = [None] * parallel
+
+    def one(i):
+        w = Worker(host, port, {}, None, None, 0)
+        w.conn = http.client.HTTPConnection(host, port, timeout=30)
+        w.conn.connect()
+        barrier.wait()
+        try:
+            results[i] = w.request(method, path, body)
+        except Exception as e:
+            results[i] = (0, {"error": str(e)})
+        finally:
+            w.conn.close()
+
+    threads = [threading.Thread(target=one, args=(i,)) for i in range(parallel)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def _tally(results):
+    ok = [r for r in results if 200 <= r[0] < 300 and r[1].get('success')]
+    errors = [r for r in results if r[0] == 0 or r[0] >= 500]
+    return {"requests": len(results), "succeeded": len(ok), "rejected": len(results) - len(ok) - len(errors),
+            "conflicts": sum(1 for r in results if r[0] == 409), "errors": len(errors)}, ok
+
+
+def run_race(url, parallel=50):
+    """同一房间并发开房、同一订单并发结账，检查状态转换恰好发生一次。"""
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    probe = Worker(host, port, {}, None, None, 0)
+    _, avail = probe.request('GET', '/api/rooms/available')
+    if not avail.get('data'):
+        raise RuntimeError("没有空闲房间，无法测试")
+    room_id = avail['data'][0]['id']
+    open_stats, opened = _tally(_fire_together(host, port, parallel, 'POST', f"/api/rooms/{room_id}/open", {}))
+    result = {"url": url, "parallel": parallel, "room_id": room_id, "open": open_stats}
+    if opened:
+        order_number = opened[0][1]['order_number']
+        close_stats, _ = _tally(_fire_together(host, port, parallel, 'POST', f"/api/orders/{order_number}/close"))
+        result["order_number"] = order_number
+        result["close"] = close_stats
+    _, active = probe.request('GET', '/api/orders?active=1')
+    result["unpaid_orders_for_room"] = sum(1 for o in active.get('data') or [] if o['room_id'] == room_id)
+    # 没抢到的请求都应该是 409 冲突，而不是 5xx 或其它错误
+    close_stats = result.get("close", {})
+    result["exactly_once"] = (open_stats["succeeded"] == 1 and open_stats["conflicts"] == parallel - 1
+                              and close_stats.get("succeeded") == 1 and close_stats.get("conflicts") == parallel - 1
+                              and result["unpaid_orders_for_room"] == 0)
+    return result
+
+
+def main(argv=None):
+    default_url = f"http://{SERVER_CONFIG.get('host', '127.0.0.1')}:{SERVER_CONFIG.get('port', 5003)}"
+    parser = argparse.ArgumentParser(description="棋牌室订单系统 HTTP 压测")
+    parser.add_argument('--url', default=default_url)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help="持续秒数")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="操作权重，如 open=1,add=4,close=1,board=6,report=1")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--gzip', action='store_true', help="请求压缩响应")
+    parser.add_argument('--no-cleanup', action='store_true', help="结束后不结账压测开出的剩余订单")
+    parser.add_argument('--allow-active', action='store_true', help="服务上已有进行中订单时也运行（只操作压测自己开的订单）")
+    parser.add_argument('--output', help="结果 JSON 写入文件（默认输出到 stdout）")
+    parser.add_argument('--race', type=int, metavar='N', help="改为并发正确性检查：N 个请求同时开同一房间、结同一订单")
+    args = parser.parse_args(argv)
+    if args.race:
+        result = run_race(args.url, args.race)
+    else:
+        result = run_load(args.url, threads=args.threads, duration=args.duration, mix=args.mix,
+                          seed=args.seed, use_gzip=args.gzip, cleanup=not args.no_cleanup,
+                          allow_active=args.allow_active)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+    if args.race and not result["exactly_once"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+"""后台数据库维护：PRAGMA optimize、WAL checkpoint、增量 vacuum、quick_check。
+
+每个任务有执行间隔、可选的时间窗口（如凌晨 03:00-06:00）和时间预算；
+只有在窗口内、且最近 idle_seconds 秒没有业务请求时才会执行，避免和收银抢锁。
+时间预算用 progress handler 实现：超时后 SQLite 中断当前语句（事务回滚，数据不受影响）。
+"""
+import os
+import time
+import logging
+import sqlite3
+import datetime
+import threading
+from collections import deque
+
+DEFAULT_JOBS = {
+    "optimize": {"every_hours": 24, "budget_seconds": 30},
+    "checkpoint": {"every_hours": 1, "budget_seconds": 10, "wal_mb": 64, "window": None},
+    "vacuum": {"every_hours": 24, "budget_seconds": 60, "max_pages": 20000, "migrate_budget_seconds": 600},
+    "quick_check": {"every_hours": 168, "budget_seconds": 120},
+}
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def parse_window(text):
+    """'03:00-06:00' -> ((3, 0), (6, 0))；None 表示任何时间。"""
+    if not text:
+        return None
+    start, end = text.split('-')
+    def hm(s):
+        h, m = s.strip().split(':')
+        return int(h), int(m)
+    return hm(start), hm(end)
+
+
+def in_window(window, now):
+    if window is None:
+        return True
+    cur = (now.hour, now.minute)
+    start, end = window
+    if start <= end:
+        return start <= cur < end
+    return cur >= start or cur < end      # 跨午夜
+
+
+def _budget(conn, seconds):
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, 1000)
+    return deadline
+
+
+def _run_budgeted(conn, sql, seconds, script=False):
+    _budget(conn, seconds)
+    try:
+        if script:
+            # incremental_vacuum 每 step 只释放一页，而 execute() 对不返回列的语句只 step 一次
+            conn.executescript(sql)
+            return []
+        return conn.execute(sql).fetchall()
+    except sqlite3.OperationalError as e:
+        if 'interrupt' in str(e):
+            raise BudgetExceeded(f"超出时间预算 {seconds}s") from e
+        raise
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def job_optimize(conn, path, opts):
+    # analysis_limit 限制每个索引的采样行数，ANALYZE 不会扫描整张大表
+    conn.execute("PRAGMA analysis_limit = 1000")
+    _run_budgeted(conn, "PRAGMA optimize", opts["budget_seconds"])
+    return {}
+
+
+def job_checkpoint(conn, path, opts):
+    wal = path + "-wal"
+    size = os.path.getsize(wal) if os.path.exists(wal) else 0
+    if size < opts.get("wal_mb", 64) * 1024 * 1024:
+        return {"skipped": True, "wal_bytes": size}
+    # TRUNCATE 需要等读事务结束，busy_timeout 即等待上限
+    conn.execute(f"PRAGMA busy_timeout = {int(opts['budget_seconds'] * 1000)}")
+    busy, log_frames, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+    return {"wal_bytes": size, "busy": busy, "log_frames": log_frames, "checkpointed": checkpointed,
+            "wal_bytes_after": os.path.getsize(wal) if os.path.exists(wal) else 0}
+
+
+def job_vacuum(conn, path, opts):
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    result = {}
+    if mode != 2:
+        # 迁移：auto_vacuum 改为 INCREMENTAL 需要整库 VACUUM 一次
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        _run_budgeted(conn, "VACUUM", opts.get("migrate_budget_seconds", 600))
+        result["migrated"] = conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    pages = min(free, int(opts.get("max_pages", 20000)))
+    if pages:
+        _run_budgeted(conn, f"PRAGMA incremental_vacuum({pages})", opts["budget_seconds"], script=True)
+    result.update({"freelist_before": free, "freelist_after": conn.execute("PRAGMA freelist_count").fetchone()[0]})
+    return result
+
+
+def job_quick_check(conn, path, opts):
+    rows = _run_budgeted(conn, "PRAGMA quick_check(20)", opts["budget_seconds"])
+    problems = [r[0] for r in rows if r[0] != 'ok']
+    if problems:
+        logging.error("quick_check 发现问题 %s: %s", path, problems)
+    return {"ok": not problems, "problems": problems}
+
+
+JOB_FUNCS = {
+    "optimize": job_optimize,
+    "checkpoint": job_checkpoint,
+    "vacuum": job_vacuum,
+    "quick_check": job_quick_check,
+}
+
+
+class MaintenanceScheduler:
+    def __init__(self, sources, config=None, idle_seconds_fn=None, history_size=100):
+        """sources: [(名称, 路径)]；idle_seconds_fn() 返回距离上次业务请求的秒数。"""
+        config = config or {}
+        self.sources = sources
+        self.window = parse_window(config.get("window", "03:00-06:00"))
+        self.idle_seconds = float(config.get("idle_seconds", 120))
+        self.check_interval = float(config.get("check_interval_seconds", 60))
+        self.idle_seconds_fn = idle_seconds_fn
+        self.jobs = {}
+        for name, defaults in DEFAULT_JOBS.items():
+            opts = dict(defaults)
+            opts.update((config.get("jobs") or {}).get(name, {}))
+            if opts.get("enabled", True):
+                opts["window"] = parse_window(opts["window"]) if "window" in opts else self.window
+                self.jobs[name] = opts
+        self.history = deque(maxlen=history_size)
+        self.metrics = {name: {"runs": 0, "failures": 0, "budget_exceeded": 0, "skipped_busy": 0,
+                               "total_ms": 0.0, "last_run": None, "last_ms": None, "last_ok": None}
+                        for name in self.jobs}
+        self._last_run = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _connect(self, path):
+        return sqlite3.connect(path, timeout=5, isolation_level=None)
+
+    @property
+    def _state_path(self):
+        return self.sources[0][1] if self.sources else None
+
+    def load_state(self):
+        """从主库 maintenance_runs 表读取各任务上次执行时间，重启后不会立即重跑周任务。"""
+        try:
+            conn = self._connect(self._state_path)
+            try:
+                self._last_run.update(conn.execute("SELECT job, last_run FROM maintenance_runs").fetchall())
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning("读取维护记录失败: %s", e)
+
+    def _save_state(self, name, ts):
+        try:
+            conn = self._connect(self._state_path)
+            try:
+                conn.execute("INSERT OR REPLACE INTO maintenance_runs (job, last_run) VALUES (?, ?)", (name, ts))
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logging.warning("保存维护记录失败: %s", e)
+
+    def run_job(self, name):
+        """对所有库执行一次任务（忽略时间窗口和空闲判断）。已有任务在执行时返回 None。"""
+        if name not in self.jobs:
+            raise ValueError(f"未知的维护任务: {name}")
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            return [self._run_one(name, db_name, path) for db_name, path in self.sources
+                    if path and os.path.exists(path)]
+        finally:
+            self._last_run[name] = time.time()
+            self._save_state(name, self._last_run[name])
+            self._lock.release()
+
+    def _run_one(self, name, db_name, path):
+        opts = self.jobs[name]
+        started = time.perf_counter()
+        entry = {"job": name, "db": db_name, "started": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        m = self.metrics[name]
+        conn = None
+        try:
+            conn = self._connect(path)
+            entry["result"] = JOB_FUNCS[name](conn, path, opts)
+            entry["ok"] = True
+        except BudgetExceeded as e:
+            entry.update(ok=False, error=str(e))
+            m["budget_exceeded"] += 1
+        except Exception as e:
+            entry.update(ok=False, error=str(e))
+            logging.error("维护任务 %s (%s) 失败: %s", name, db_name, e)
+        finally:
+            if conn is not None:
+                conn.close()
+        ms = round((time.perf_counter() - started) * 1000, 1)
+        entry["ms"] = ms
+        m["runs"] += 1
+        m["failures"] += 0 if entry["ok"] else 1
+        m["total_ms"] = round(m["total_ms"] + ms, 1)
+        m.update(last_run=entry["started"], last_ms=ms, last_ok=entry["ok"])
+        self.history.append(entry)
+        return entry
+
+    def due_jobs(self, now=None):
+        now = now or datetime.datetime.now()
+        ts = time.time()
+        return [name for name, opts in self.jobs.items()
+                if ts - self._last_run.get(name, 0) >= float(opts["every_hours"]) * 3600
+                and in_window(opts["window"], now)]
+
+    def tick(self):
+        for name in self.due_jobs():
+            if self.idle_seconds_fn is not None and self.idle_seconds_fn() < self.idle_seconds:
+                self.metrics[name]["skipped_busy"] += 1
+                continue
+            self.run_job(name)
+
+    def start(self):
+        self.load_state()
+
+        def loop():
+            while not self._stop.wait(self.check_interval):
+                try:
+                    self.tick()
+                except Exception as e:
+                    logging.error("维护调度失败: %s", e)
+
+        t = threading.Thread(target=loop, name="maintenance", daemon=True)
+        t.start()
+        return t
+
+    def stop(self, timeout=0):
+        """停止调度；timeout > 0 时等正在执行的任务完成，返回是否已空闲。"""
+        self._stop.set()
+        if timeout and self._lock.acquire(timeout=timeout):
+            self._lock.release()
+        return not self._lock.locked()
+
+    def status(self):
+        return {"running": self._lock.locked(), "jobs": {
+            name: dict(self.metrics[name], every_hours=opts["every_hours"], budget_seconds=opts["budget_seconds"])
+            for name, opts in self.jobs.items()}, "history": list(self.history)}
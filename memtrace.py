@@ -0,0 +1,89 @@
+"""tracemalloc 封装：按代码行统计的内存占用排行、与基线快照的差异、单次调用的峰值内存。
+
+tracemalloc 开启后每次分配都要记录调用栈，有明显开销，只在排查时通过 /api/debug/memory 打开。
+"""
+import tracemalloc
+import threading
+
+# 这些文件自身的分配不计入排行
+_IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _stat_rows(stats, n):
+    return [{
+        "where": str(s.traceback[0]) if s.traceback else "?",
+        "size_kb": round(s.size / 1024, 1),
+        "count": s.count,
+    } for s in stats[:n]]
+
+
+def _diff_rows(stats, n):
+    return [{
+        "where": str(s.traceback[0]) if s.traceback else "?",
+        "size_kb": round(s.size / 1024, 1),
+        "size_diff_kb": round(s.size_diff / 1024, 1),
+        "count_diff": s.count_diff,
+    } for s in stats[:n]]
+
+
+class MemoryTracer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._baseline = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, nframes=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(nframes)
+
+    def stop(self):
+        with self._lock:
+            self._baseline = None
+        tracemalloc.stop()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(_IGNORED)
+
+    def set_baseline(self):
+        snap = self._snapshot()
+        with self._lock:
+            self._baseline = snap
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "current_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "overhead_kb": round(tracemalloc.get_tracemalloc_memory() / 1024, 1),
+            "has_baseline": self._baseline is not None,
+        }
+
+    def report(self, top_n=20, key_type="lineno"):
+        """当前占用排行；有基线时附带与基线的差异（用于确认长时间运行没有泄漏）。"""
+        snap = self._snapshot()
+        data = self.status()
+        data["top"] = _stat_rows(snap.statistics(key_type), top_n)
+        with self._lock:
+            baseline = self._baseline
+        if baseline is not None:
+            data["diff"] = _diff_rows(snap.compare_to(baseline, key_type), top_n)
+        return data
+
+    def measure(self, fn):
+        """执行 fn，返回 (结果, 执行期间相对开始时的峰值增量字节数)。峰值是全进程的，测量时应避免并发请求。"""
+        with self._lock:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            result = fn()
+            after, peak = tracemalloc.get_traced_memory()
+        return result, {"peak_kb": round((peak - before) / 1024, 1),
+                        "retained_kb": round((after - before) / 1024, 1)}
@@ -0,0 +1,103 @@
+"""房间、订单、订单明细、商品的 __slots__ 领域对象。
+
+原来每行数据要经过 sqlite3.Row -> dict(row) -> serialize_row 复制的 dict 三份，才交给 jsonify。
+这里按 FIELDS 的列顺序查询，用元组直接构造对象（没有 __dict__），再逐字段拼接成 JSON 文本，
+中间不产生 dict。
+"""
+import json
+import datetime
+
+_encode_str = json.encoder.encode_basestring_ascii
+
+
+def _encode_value(v):
+    if v is None:
+        return 'null'
+    t = type(v)
+    if t is str:
+        return _encode_str(v)
+    if t is int:
+        return int.__repr__(v)
+    if t is float:
+        return float.__repr__(v) if v - v == 0 else json.dumps(v)
+    if isinstance(v, (bytes, bytearray)):
+        return _encode_str(v.decode())
+    if isinstance(v, (datetime.datetime, datetime.date)):
+        return _encode_str(v.strftime("%Y-%m-%d %H:%M:%S"))
+    return json.dumps(v, ensure_ascii=True)
+
+
+class Model:
+    __slots__ = ()
+    FIELDS = ()
+    _JSON_KEYS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._JSON_KEYS = tuple(_encode_str(f) + ':' for f in cls.FIELDS)
+
+    def __init__(self, *values):
+        for name, v in zip(self.FIELDS, values):
+            setattr(self, name, v)
+
+    @classmethod
+    def columns(cls, alias=None):
+        """SELECT 列表，顺序与 FIELDS 一致。"""
+        if alias:
+            return ", ".join(f"{alias}.{f}" for f in cls.FIELDS)
+        return ", ".join(cls.FIELDS)
+
+    @classmethod
+    def from_row(cls, row):
+        return None if row is None else cls(*row)
+
+    @classmethod
+    def from_rows(cls, rows):
+        return [cls(*r) for r in rows]
+
+    def to_dict(self):
+        return {f: getattr(self, f) for f in self.FIELDS}
+
+    def to_json(self):
+        return '{' + ','.join(k + _encode_value(getattr(self, f)) for k, f in zip(self._JSON_KEYS, self.FIELDS)) + '}'
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{f}={getattr(self, f)!r}' for f in self.FIELDS)})"
+
+
+class Room(Model):
+    FIELDS = ('id', 'name', 'room_number', 'room_type', 'price_per_hour', 'status', 'description',
+              'created_at', 'updated_at')
+    __slots__ = FIELDS
+
+
+class Order(Model):
+    FIELDS = ('id', 'order_number', 'room_id', 'customer_id', 'start_time', 'end_time', 'total_hours',
+              'total_amount', 'product_total', 'payment_status', 'created_at', 'updated_at')
+    __slots__ = FIELDS
+
+
+class OrderLine(Model):
+    """订单明细，带上商品名称和分类。"""
+    FIELDS = ('id', 'order_id', 'product_id', 'quantity', 'unit_price', 'total_price', 'name', 'category')
+    __slots__ = FIELDS
+
+
+class Product(Model):
+    FIELDS = ('id', 'name', 'price', 'stock', 'category', 'status', 'created_at', 'updated_at')
+    __slots__ = FIELDS
+
+
+def encode(obj):
+    """把 Model / 列表 / dict / 标量编码成 JSON 文本，Model 直接拼接不转 dict。"""
+    if isinstance(obj, Model):
+        return obj.to_json()
+    if isinstance(obj, (list, tuple)):
+        return '[' + ','.join(encode(x) for x in obj) + ']'
+    if isinstance(obj, dict):
+        return '{' + ','.join(_encode_str(str(k)) + ':' + encode(v) for k, v in obj.items()) + '}'
+    if obj is True:
+        return 'true'
+    if obj is False:
+        return 'false'
+    return _encode_value(obj)
@@ -0,0 +1,111 @@
+"""低开销采样分析器：定时遍历 sys._current_frames()，统计所有线程（包括 Waitress 工作线程）的调用栈。
+
+输出 collapsed stacks（可直接喂给 flamegraph.pl / speedscope）以及按自身时间、累计时间排序的函数列表。
+"""
+import os
+import sys
+import time
+import threading
+from collections import Counter
+
+# 空闲线程的栈顶：在等锁、等 socket、等任务队列，统计进去只会淹没真正的热点
+IDLE_LEAVES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('wasyncore.py', 'poll'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('queue.py', 'get'),
+}
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    def __init__(self, interval=0.005, include_idle=False, max_depth=128):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self.sampling_seconds = 0.0
+        self.wall_seconds = 0.0
+        self._labels = {}
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = _frame_label(code)
+        return label
+
+    def _is_idle(self, frame):
+        code = frame.f_code
+        return (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES
+
+    def sample_once(self, names, own_ident):
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            if not self.include_idle and self._is_idle(frame):
+                continue
+            stack = []
+            depth = 0
+            while frame is not None and depth < self.max_depth:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+                depth += 1
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """在当前线程里采样 seconds 秒（阻塞）。"""
+        own = threading.get_ident()
+        started = time.perf_counter()
+        deadline = started + seconds
+        while True:
+            t0 = time.perf_counter()
+            if t0 >= deadline:
+                break
+            names = {t.ident: t.name for t in threading.enumerate()}
+            self.sample_once(names, own)
+            t1 = time.perf_counter()
+            self.sampling_seconds += t1 - t0
+            time.sleep(max(0.0, self.interval - (t1 - t0)))
+        self.wall_seconds = time.perf_counter() - started
+        return self
+
+    def collapsed(self):
+        """flamegraph 的 collapsed 格式：每行 '线程;外层;...;内层 次数'。"""
+        return "\n".join(f"{';'.join(stack)} {n}" for stack, n in self.stacks.most_common())
+
+    def top(self, n=30):
+        self_counts = Counter()
+        total_counts = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack[-1]] += count
+            # 递归函数在一个样本里只算一次累计时间
+            for label in set(stack[1:]):
+                total_counts[label] += count
+        observed = sum(self.stacks.values()) or 1
+
+        def rows(counter):
+            return [{"function": label, "samples": c, "percent": round(100.0 * c / observed, 2)}
+                    for label, c in counter.most_common(n)]
+
+        return {"self": rows(self_counts), "total": rows(total_counts)}
+
+    def summary(self, top_n=30):
+        return {
+            "samples": self.samples,
+            "stack_samples": sum(self.stacks.values()),
+            "interval_ms": round(self.interval * 1000, 3),
+            "wall_seconds": round(self.wall_seconds, 3),
+            # 采样线程本身占用的时间比例，即分析器开销的上限
+            "overhead_percent": round(100.0 * self.sampling_seconds / self.wall_seconds, 3) if self.wall_seconds else 0,
+            "top": self.top(top_n),
+        }
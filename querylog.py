@@ -0,0 +1,168 @@
+"""慢查询日志：统计每条 SQL 的执行+取数耗时，超过阈值的记录到环形缓冲区并写日志。
+
+每种语句第一次变慢时在同一连接上跑一次 EXPLAIN QUERY PLAN 并缓存。
+参数只记录形状（类型），不记录值，避免手机号等信息进日志。
+"""
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque, OrderedDict
+
+
+def params_shape(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: type(v).__name__ for k, v in params.items()}
+    try:
+        return [type(v).__name__ for v in params]
+    except TypeError:
+        return type(params).__name__
+
+
+class QueryLog:
+    def __init__(self, threshold_ms=50, capacity=200, explain=True, max_plans=500):
+        self.threshold = threshold_ms / 1000.0
+        self.explain = explain
+        self.entries = deque(maxlen=capacity)
+        self.plans = OrderedDict()
+        self.max_plans = max_plans
+        self.slow = 0
+        self._lock = threading.Lock()
+        # 总数按线程计：每个线程一个 [计数]，只有所属线程会改，快查询不用拿全局锁
+        self._local = threading.local()
+        self._counters = []
+
+    @property
+    def total(self):
+        with self._lock:
+            counters = list(self._counters)
+        return sum(c[0] for c in counters)
+
+    def record(self, conn, sql, params, elapsed, rows):
+        counter = getattr(self._local, 'counter', None)
+        if counter is None:
+            counter = self._local.counter = [0]
+            with self._lock:
+                self._counters.append(counter)
+        counter[0] += 1
+        if elapsed < self.threshold:
+            return
+        plan = self.plan_for(conn, sql, params) if self.explain else None
+        entry = {
+            "at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "ms": round(elapsed * 1000, 3),
+            "sql": " ".join(sql.split()),
+            "params": params_shape(params),
+            "rows": rows,
+            "plan": plan,
+            "thread": threading.current_thread().name,
+        }
+        with self._lock:
+            self.slow += 1
+            self.entries.append(entry)
+        logging.warning("慢查询 %.1f ms rows=%s: %s", entry["ms"], rows, entry["sql"][:300])
+
+    def plan_for(self, conn, sql, params):
+        with self._lock:
+            if sql in self.plans:
+                self.plans.move_to_end(sql)
+                return self.plans[sql]
+        head = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else ''
+        if head not in ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE'):
+            return None
+        try:
+            # 用普通游标执行，不会再进入计时
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params if params is not None else ()).fetchall()
+            plan = [r[3] for r in rows]
+        except sqlite3.Error as e:
+            plan = [f"EXPLAIN 失败: {e}"]
+        with self._lock:
+            self.plans[sql] = plan
+            while len(self.plans) > self.max_plans:
+                self.plans.popitem(last=False)
+        return plan
+
+    def snapshot(self, limit=None):
+        with self._lock:
+            entries = list(self.entries)
+            slow = self.slow
+        total = self.total
+        entries.reverse()
+        if limit:
+            entries = entries[:limit]
+        return {"threshold_ms": round(self.threshold * 1000, 3), "total_queries": total,
+                "slow_queries": slow, "entries": entries}
+
+
+class TimedCursor(sqlite3.Cursor):
+    """计时游标。SELECT 类语句的耗时包含取数，在 fetchone/fetchall 或下一次 execute 时结算。
+
+    recorders 为若干带 record(conn, sql, params, elapsed, rows) 方法的对象（慢查询日志、请求追踪）。
+    """
+
+    def __init__(self, conn, *recorders):
+        super().__init__(conn)
+        self._recorders = recorders
+        self._pending = None
+
+    def _record(self, sql, params, elapsed, rows):
+        for r in self._recorders:
+            r.record(self.connection, sql, params, elapsed, rows)
+
+    def _finish(self):
+        p = self._pending
+        if p is not None:
+            self._pending = None
+            self._record(p[0], p[1], p[2], p[3])
+
+    def execute(self, sql, params=()):
+        self._finish()
+        t0 = time.perf_counter()
+        super().execute(sql, params)
+        elapsed = time.perf_counter() - t0
+        if self.description is None:
+            self._record(sql, params, elapsed, self.rowcount)
+        else:
+            self._pending = [sql, params, elapsed, 0]
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        self._finish()
+        t0 = time.perf_counter()
+        super().executemany(sql, seq_of_params)
+        self._record(sql, None, time.perf_counter() - t0, self.rowcount)
+        return self
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - t0
+            self._pending[3] += 1 if row is not None else 0
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - t0
+            self._pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        rows = super().fetchall()
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - t0
+            self._pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def close(self):
+        self._finish()
+        super().close()
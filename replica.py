@@ -0,0 +1,139 @@
+"""报表只读副本：用 backup API 把 chess.db 复制到内存库，报表和分析查询走副本，不碰收银用的文件和锁。
+
+后台线程定期查看源库的 PRAGMA data_version（其它连接提交后会变化），有变化才重新复制；
+新副本建好后整体替换旧副本，正在执行的查询继续用旧副本，不会读到一半被换掉。
+归档库很少写入，直接以文件形式挂到副本上，不复制进内存。
+
+副本最多落后 max_lag_seconds（默认为刷新间隔）；未就绪时 reader() 回退到主库。
+"""
+import time
+import logging
+import sqlite3
+import threading
+import contextlib
+
+
+class ReadReplica:
+    def __init__(self, path, setup=None, interval=5.0):
+        """setup(conn)：新副本连接建好后调用（注册函数、挂载归档库、建视图）。"""
+        self.path = path
+        self.setup = setup
+        self.interval = interval
+        self._current = None        # (conn, lock, built_at)
+        self._swap_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._source = None
+        self._data_version = None
+        self._stop = threading.Event()
+        self.refreshes = 0
+        self.skipped = 0
+        self.reads = 0
+        self.fallbacks = 0
+        self.last_refresh_ms = None
+
+    @property
+    def ready(self):
+        return self._current is not None
+
+    @property
+    def max_lag_seconds(self):
+        return self.interval
+
+    def _changed(self):
+        if self._source is None:
+            self._source = sqlite3.connect(self.path, check_same_thread=False)
+        version = self._source.execute("PRAGMA data_version").fetchone()[0]
+        changed = version != self._data_version
+        self._data_version = version
+        return changed
+
+    def refresh(self, force=False):
+        """源库有变化时重建副本，返回是否重建。"""
+        with self._refresh_lock:
+            if not self._changed() and not force and self.ready:
+                self.skipped += 1
+                return False
+            started = time.perf_counter()
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            # 用同一条源连接做 backup：复制期间它持有读快照，WAL 模式下不阻塞写入
+            self._source.backup(conn)
+            conn.row_factory = sqlite3.Row
+            if self.setup is not None:
+                self.setup(conn)
+            with self._swap_lock:
+                old, self._current = self._current, (conn, threading.Lock(), time.time())
+            if old is not None:
+                # 旧副本可能还有查询在用，等它们结束后再关闭
+                with old[1]:
+                    old[0].close()
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - started) * 1000, 1)
+            return True
+
+    @contextlib.contextmanager
+    def reader(self, fallback):
+        """with replica.reader(db.cursor) as cur: ... 在副本上查询；副本未就绪时用 fallback() 得到主库游标。
+
+        同一个副本连接上的查询串行执行（sqlite3 模块的语句缓存不支持多线程同时使用一个连接）。
+        """
+        while True:
+            with self._swap_lock:
+                current = self._current
+            if current is None:
+                self.fallbacks += 1
+                yield fallback()
+                return
+            conn, lock, _ = current
+            with lock:
+                # 取到副本和拿到它的锁之间 refresh() 可能已经换上新副本并关闭了旧的，此时换新副本重来
+                if self._current is not current:
+                    continue
+                self.reads += 1
+                cur = conn.cursor()
+                try:
+                    yield cur
+                finally:
+                    cur.close()
+                return
+
+    def start(self):
+        def loop():
+            while True:
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.error("刷新只读副本失败: %s", e)
+                if self._stop.wait(self.interval):
+                    return
+
+        t = threading.Thread(target=loop, name="replica", daemon=True)
+        t.start()
+        return t
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self):
+        """停机时调用：停止刷新并关闭副本和源库连接（等正在执行的报表查询结束）。"""
+        self._stop.set()
+        with self._refresh_lock:
+            with self._swap_lock:
+                current, self._current = self._current, None
+            if current is not None:
+                with current[1]:
+                    current[0].close()
+            if self._source is not None:
+                self._source.close()
+                self._source = None
+
+    def stats(self):
+        current = self._current
+        return {
+            "ready": current is not None,
+            "age_seconds": round(time.time() - current[2], 1) if current else None,
+            "refreshes": self.refreshes,
+            "skipped_unchanged": self.skipped,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+            "last_refresh_ms": self.last_refresh_ms,
+        }
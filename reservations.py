@@ -0,0 +1,196 @@
+"""预约冲突索引：每个房间一个按开始时间排序的预约区间列表，加上各房间进行中订单的开始时间。
+
+同一房间的有效预约互不重叠，按开始时间有序时结束时间也有序，
+用 bisect 找到第一个开始时间不早于查询结束时间的位置，向前检查结束时间即可，重叠查询 O(log n)。
+
+启动时从 reservations / orders 表加载，之后由预约、开房、结账接口写穿维护，冲突判断不查库。
+检查和登记在同一把锁里完成：先在索引里占位，数据库写入成功后确认，失败则撤销，
+并发预约同一时段、预约与开房同时发生都只会有一个成功。
+"""
+import bisect
+import datetime
+import itertools
+import threading
+
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+
+def parse_time(value):
+    if isinstance(value, datetime.datetime):
+        return value
+    for fmt in (TIME_FMT, "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M"):
+        try:
+            return datetime.datetime.strptime(str(value), fmt)
+        except ValueError:
+            continue
+    raise ValueError(f"时间格式错误: {value}")
+
+
+class ReservationIndex:
+    def __init__(self, walkin_guard_minutes=60, no_show_minutes=30, open_hold_minutes=30):
+        # 开房时，未来 walkin_guard 分钟内有预约则不允许散客开房
+        self.walkin_guard = datetime.timedelta(minutes=walkin_guard_minutes)
+        # 预约开始后超过 no_show 分钟未到店，不再占用房间
+        self.no_show = datetime.timedelta(minutes=no_show_minutes)
+        # 房间正在使用时，open_hold 分钟内开始的预约视为冲突
+        self.open_hold = datetime.timedelta(minutes=open_hold_minutes)
+        self._lock = threading.Lock()
+        self._rooms = {}        # room_id -> 有序的 (start, end, reservation_id)
+        self._by_id = {}        # reservation_id -> (room_id, start, end)
+        self._open = {}         # room_id -> 进行中订单的开始时间
+        self._opening = set()   # begin_open 登记了、还没提交的房间
+        self._tokens = itertools.count(-1, -1)
+        self._pruned = datetime.datetime.min
+
+    def load(self, reservations, open_orders):
+        """reservations: (id, room_id, start_time, end_time) 的有效预约；open_orders: (room_id, start_time)。
+
+        重新加载（其它进程改了数据）时保留本进程尚未提交的预约占位和开房登记。
+        """
+        rooms, by_id = {}, {}
+        for rid, room_id, start, end in reservations:
+            start, end = parse_time(start), parse_time(end)
+            rooms.setdefault(room_id, []).append((start, end, rid))
+            by_id[rid] = (room_id, start, end)
+        opened = {room_id: parse_time(start) for room_id, start in open_orders}
+        with self._lock:
+            for rid, (room_id, start, end) in self._by_id.items():
+                if rid < 0:
+                    rooms.setdefault(room_id, []).append((start, end, rid))
+                    by_id[rid] = (room_id, start, end)
+            for room_id in self._opening:
+                opened.setdefault(room_id, self._open[room_id])
+            for entries in rooms.values():
+                entries.sort()
+            self._rooms, self._by_id, self._open = rooms, by_id, opened
+
+    def _overlaps_locked(self, room_id, start, end, exclude_id=None):
+        entries = self._rooms.get(room_id)
+        if not entries:
+            return []
+        i = bisect.bisect_left(entries, (end,))
+        found = []
+        while i > 0:
+            i -= 1
+            s, e, rid = entries[i]
+            if e <= start:
+                break
+            if rid != exclude_id:
+                found.append((s, e, rid))
+        found.reverse()
+        return found
+
+    def _conflicts_locked(self, room_id, start, end, now, exclude_id=None):
+        conflicts = []
+        for s, e, rid in self._overlaps_locked(room_id, start, end, exclude_id):
+            if rid < 0:
+                # 占位中的预约（尚未写入数据库）同样算冲突
+                conflicts.append({"type": "pending"})
+            else:
+                conflicts.append({"type": "reservation", "reservation_id": rid,
+                                  "start_time": s.strftime(TIME_FMT), "end_time": e.strftime(TIME_FMT)})
+        opened = self._open.get(room_id)
+        if opened is not None and start < now + self.open_hold:
+            conflicts.append({"type": "open_order", "start_time": opened.strftime(TIME_FMT)})
+        return conflicts
+
+    def conflicts(self, room_id, start, end, now=None, exclude_id=None):
+        now = now or datetime.datetime.now()
+        with self._lock:
+            return self._conflicts_locked(room_id, start, end, now, exclude_id)
+
+    def free_rooms(self, room_ids, start, end, now=None):
+        now = now or datetime.datetime.now()
+        with self._lock:
+            return [r for r in room_ids if not self._conflicts_locked(r, start, end, now)]
+
+    def reserve(self, room_id, start, end, now=None):
+        """检查冲突并占位。返回 (token, conflicts)，有冲突时 token 为 None。"""
+        now = now or datetime.datetime.now()
+        with self._lock:
+            if now - self._pruned > datetime.timedelta(hours=1):
+                self._prune_locked(now - datetime.timedelta(days=1))
+                self._pruned = now
+            conflicts = self._conflicts_locked(room_id, start, end, now)
+            if conflicts:
+                return None, conflicts
+            token = next(self._tokens)
+            bisect.insort(self._rooms.setdefault(room_id, []), (start, end, token))
+            self._by_id[token] = (room_id, start, end)
+            return token, []
+
+    def confirm(self, token, reservation_id):
+        with self._lock:
+            room_id, start, end = self._remove_locked(token)
+            bisect.insort(self._rooms.setdefault(room_id, []), (start, end, reservation_id))
+            self._by_id[reservation_id] = (room_id, start, end)
+
+    def remove(self, reservation_id):
+        """取消、履约或撤销占位。"""
+        with self._lock:
+            if reservation_id in self._by_id:
+                self._remove_locked(reservation_id)
+
+    def _remove_locked(self, rid):
+        room_id, start, end = self._by_id.pop(rid)
+        entries = self._rooms[room_id]
+        i = bisect.bisect_left(entries, (start, end, rid))
+        if i < len(entries) and entries[i] == (start, end, rid):
+            del entries[i]
+        else:
+            entries.remove((start, end, rid))
+        return room_id, start, end
+
+    def walkin_blockers(self, room_id, now, reservation_id=None):
+        """散客开房前检查：即将开始或正在进行（未超过爽约时限）的其它预约。"""
+        with self._lock:
+            return self._walkin_blockers_locked(room_id, now, reservation_id)
+
+    def _walkin_blockers_locked(self, room_id, now, reservation_id):
+        return [{"reservation_id": rid, "start_time": s.strftime(TIME_FMT), "end_time": e.strftime(TIME_FMT)}
+                for s, e, rid in self._overlaps_locked(room_id, now, now + self.walkin_guard, reservation_id)
+                if now < s + self.no_show]
+
+    def begin_open(self, room_id, now, reservation_id=None):
+        """开房前检查并登记进行中订单。返回 (blockers, registered)，开房失败时用 registered 调 abort_open。"""
+        with self._lock:
+            blockers = self._walkin_blockers_locked(room_id, now, reservation_id)
+            if blockers:
+                return blockers, False
+            if room_id in self._open:
+                return [], False
+            self._open[room_id] = now
+            self._opening.add(room_id)
+            return [], True
+
+    def opened(self, room_id, start):
+        """开房已提交。"""
+        with self._lock:
+            self._open[room_id] = start
+            self._opening.discard(room_id)
+
+    def abort_open(self, room_id, registered):
+        if registered:
+            with self._lock:
+                self._open.pop(room_id, None)
+                self._opening.discard(room_id)
+
+    def close(self, room_id):
+        with self._lock:
+            self._open.pop(room_id, None)
+
+    def _prune_locked(self, before):
+        """丢弃结束时间早于 before 的预约（只影响内存，不改数据库）。"""
+        for room_id, entries in self._rooms.items():
+            keep = []
+            for x in entries:
+                if x[1] >= before or x[2] < 0:
+                    keep.append(x)
+                else:
+                    self._by_id.pop(x[2], None)
+            self._rooms[room_id] = keep
+
+    def stats(self):
+        with self._lock:
+            return {"reservations": sum(1 for k in self._by_id if k > 0),
+                    "rooms_in_use": len(self._open)}
@@ -0,0 +1,138 @@
+"""热点 GET 接口的响应缓存：缓存编码好的 JSON 字节（以及压缩后的字节），命中时只查一次字典。
+
+缓存键 = 路径 + 查询参数 + 所依赖各表的版本号。写接口提交事务后调用 bump(表名...)：
+版本号加一，并立即删除依赖这些表的条目。读接口在查库之前取版本号，
+如果查库期间有写入提交，put() 发现版本已变就不缓存，避免把旧数据存到新版本下。
+容量按字节数和条目数做 LRU 淘汰。
+"""
+import threading
+from collections import OrderedDict
+
+
+class CacheEntry:
+    __slots__ = ('key', 'tables', 'body', 'variants', 'size', '_cache')
+
+    def __init__(self, cache, key, tables, body):
+        self._cache = cache
+        self.key = key
+        self.tables = tables
+        self.body = body
+        self.variants = {}
+        self.size = len(body)
+
+    def variant(self, encoding, make):
+        """取压缩后的响应体，第一次用到时生成并计入缓存大小。"""
+        data = self.variants.get(encoding)
+        if data is None:
+            data = make(self.body)
+            self._cache._add_variant(self, encoding, data)
+        return data
+
+
+class ResponseCache:
+    def __init__(self, max_bytes=16 * 1024 * 1024, max_entries=1024, enabled=True):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._versions = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_puts = 0
+
+    def versions(self, tables):
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in tables)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, tables, versions, body):
+        """key 中已包含 versions；versions 是查库前取到的版本号。"""
+        if not self.enabled or len(body) > self.max_bytes:
+            return None
+        with self._lock:
+            if tuple(self._versions.get(t, 0) for t in tables) != versions:
+                self.stale_puts += 1
+                return None
+            old = self._entries.get(key)
+            if old is not None:
+                self._drop_locked(old)
+            entry = CacheEntry(self, key, tables, body)
+            self._entries[key] = entry
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            self.bytes += entry.size
+            self._evict_locked()
+            return entry
+
+    def bump(self, *tables):
+        """表数据已提交变更：版本号加一并删除依赖它们的缓存。"""
+        with self._lock:
+            for t in tables:
+                self._versions[t] = self._versions.get(t, 0) + 1
+                for key in list(self._by_table.get(t, ())):
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        self._drop_locked(entry)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            for entry in list(self._entries.values()):
+                self._drop_locked(entry)
+
+    def _add_variant(self, entry, encoding, data):
+        with self._lock:
+            if encoding in entry.variants:
+                return
+            entry.variants[encoding] = data
+            entry.size += len(data)
+            if self._entries.get(entry.key) is entry:
+                self.bytes += len(data)
+                self._evict_locked()
+
+    def _drop_locked(self, entry):
+        if self._entries.get(entry.key) is not entry:
+            return
+        del self._entries[entry.key]
+        self.bytes -= entry.size
+        for t in entry.tables:
+            keys = self._by_table.get(t)
+            if keys is not None:
+                keys.discard(entry.key)
+
+    def _evict_locked(self):
+        while self._entries and (self.bytes > self.max_bytes or len(self._entries) > self.max_entries):
+            _, entry = next(iter(self._entries.items()))
+            self._drop_locked(entry)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "stale_puts": self.stale_puts,
+                "versions": dict(self._versions),
+            }
@@ -0,0 +1,220 @@
+"""优雅停机：Ctrl+C、SIGTERM、关闭控制台窗口时，先让进行中的请求（比如正在结账的事务）做完再退出。
+
+1. 信号处理函数只起一个停机线程，不在信号处理里做耗时工作；
+2. 停机线程开始排空：新请求直接返回 503 + Retry-After（仍然 accept，客户端马上拿到答复，不会卡在
+   监听队列里等到连接被重置）；
+3. 等进行中的请求结束（最多 drain_timeout 秒，响应写完才算结束），然后打断主线程的服务循环；
+4. 主线程从 server.run() 返回后调用 cleanup()（见 run()），按注册顺序执行清理步骤
+   （停后台任务、关连接、WAL checkpoint、写完日志），下次启动不用做 WAL 恢复。
+
+停机过程中再按一次 Ctrl+C 不再等待，直接结束服务循环（Waitress 自己最多再等 5 秒工作线程，清理步骤照常执行）。
+Windows 关闭控制台窗口不走 signal 模块，用 SetConsoleCtrlHandler 接收，系统只给约 5 秒。
+"""
+import sys
+import time
+import signal
+import logging
+import threading
+import _thread
+
+_REJECT_BODY = '{"success":false,"error":"服务正在关闭"}'.encode('utf-8')
+
+
+class RequestDrain:
+    """WSGI 中间件：统计进行中的请求，开始排空后拒绝新请求。"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.draining = False
+        self.rejected = 0
+        self._inflight = 0
+        self._cond = threading.Condition()
+
+    @property
+    def inflight(self):
+        return self._inflight
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            accept = not self.draining
+            if accept:
+                self._inflight += 1
+            else:
+                self.rejected += 1
+        if not accept:
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'application/json'), ('Content-Length', str(len(_REJECT_BODY))),
+                ('Retry-After', '5')])
+            return [_REJECT_BODY]
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        return _DrainBody(body, self._done)
+
+    def _done(self):
+        with self._cond:
+            self._inflight -= 1
+            self._cond.notify_all()
+
+    def drain(self, timeout):
+        """开始拒绝新请求，等进行中的请求结束，返回是否在超时前全部结束。"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self.draining = True
+            while self._inflight > 0:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(left)
+        return True
+
+
+class _DrainBody:
+    """响应体取完或 close() 时（以先到者为准）结束计数。"""
+
+    def __init__(self, body, done):
+        self.body = body
+        self._done = done
+        self._finished = False
+
+    def __iter__(self):
+        for chunk in self.body:
+            yield chunk
+        self._finish()
+
+    def _finish(self):
+        if not self._finished:
+            self._finished = True
+            self._done()
+
+    def close(self):
+        try:
+            close = getattr(self.body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()
+
+
+class GracefulShutdown:
+    def __init__(self, drain, drain_timeout=10.0):
+        self.drain = drain
+        self.drain_timeout = drain_timeout
+        self.requested = threading.Event()
+        self.finished = threading.Event()
+        self.results = []
+        self._steps = []
+        self._flush = None
+        self._console_handler = None
+
+    def add_step(self, name, fn):
+        """清理步骤，cleanup() 时按注册顺序执行；fn 的返回值记入 results。"""
+        self._steps.append((name, fn))
+
+    def install(self, flush=None):
+        """安装信号处理，只能在主线程调用。flush(timeout)：等已生成的响应发送完（在停机线程里调用）。"""
+        self._flush = flush
+        for name in ('SIGINT', 'SIGTERM', 'SIGBREAK', 'SIGHUP'):
+            sig = getattr(signal, name, None)
+            if sig is not None:
+                signal.signal(sig, self._on_signal)
+        if sys.platform.startswith('win'):
+            self._install_console_handler()
+
+    def _on_signal(self, signum, frame):
+        if self.requested.is_set():
+            # 排空结束后停机线程用 SIGINT 打断主线程，或者用户又按了一次 Ctrl+C：结束服务循环。
+            # 其它信号（多进程模式下主进程转发的 SIGTERM）不打断正在进行的排空。
+            if signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            return
+        self.request(signal.Signals(signum).name)
+
+    def request(self, reason, drain_timeout=None):
+        """开始停机（可从任意线程调用，重复调用无效）。"""
+        if self.requested.is_set():
+            return
+        self.requested.set()
+        logging.info("收到 %s，开始停机：不再接受新请求，等待进行中的请求完成", reason)
+        timeout = self.drain_timeout if drain_timeout is None else drain_timeout
+        threading.Thread(target=self._drain_then_interrupt, args=(timeout,), name="shutdown", daemon=True).start()
+
+    def _drain_then_interrupt(self, timeout):
+        started = time.monotonic()
+        if self.drain.drain(timeout):
+            logging.info("进行中的请求已处理完（%.2f 秒）", time.monotonic() - started)
+        else:
+            logging.warning("等待 %.0f 秒后仍有 %d 个请求未完成，强制停止", timeout, self.drain.inflight)
+        if self._flush is not None:
+            # 响应体交给服务器后还在发送缓冲里，关连接前等它发完
+            self._flush(max(1.0, timeout - (time.monotonic() - started)))
+        _thread.interrupt_main()
+
+    def run(self, serve):
+        """在主线程执行服务循环 serve()，返回后执行 cleanup()。
+
+        排空结束后用 KeyboardInterrupt 打断服务循环是正常停机，这里吃掉，不打印 traceback，进程正常退出（返回码 0）。
+        没有请求停机时的 KeyboardInterrupt（没装信号处理）照常抛出。
+        """
+        try:
+            serve()
+        except KeyboardInterrupt:
+            if not self.requested.is_set():
+                raise
+        finally:
+            self.cleanup()
+
+    def cleanup(self):
+        """主线程退出服务循环后调用：依次执行清理步骤，单步失败不影响后面的步骤。"""
+        for name, fn in self._steps:
+            started = time.perf_counter()
+            try:
+                result = fn()
+                ok = True
+            except Exception as e:
+                logging.exception(e)
+                result, ok = str(e), False
+            ms = round((time.perf_counter() - started) * 1000, 1)
+            self.results.append({"step": name, "ok": ok, "ms": ms, "result": result})
+            if ok:
+                logging.info("停机清理 %s 完成（%.1f ms）%s", name, ms, "" if result in (None, True) else result)
+        self.finished.set()
+        return self.results
+
+    def _install_console_handler(self):
+        import ctypes
+        from ctypes import wintypes
+        close_events = (2, 5, 6)    # CTRL_CLOSE_EVENT / CTRL_LOGOFF_EVENT / CTRL_SHUTDOWN_EVENT
+
+        @ctypes.WINFUNCTYPE(wintypes.BOOL, wintypes.DWORD)
+        def handler(event):
+            if event not in close_events:
+                return False        # Ctrl+C / Ctrl+Break 交给 signal 模块
+            # 处理函数返回后系统就会结束进程，在这里等清理做完（系统总共只给约 5 秒）
+            self.request("关闭控制台窗口", drain_timeout=min(self.drain_timeout, 2.5))
+            self.finished.wait(4.5)
+            return True
+
+        ctypes.windll.kernel32.SetConsoleCtrlHandler(handler, True)
+        self._console_handler = handler     # 保持引用，避免回调被回收
+
+
+
+def waitress_flush(server):
+    """create_server 返回的服务器对应的 flush(timeout)：等所有连接的发送缓冲清空，返回是否已清空。"""
+    # 单个 socket 时返回的是 TcpWSGIServer（_map），多个时是 MultiSocketServer（map），两者是同一个连接表
+    dispatchers = getattr(server, 'map', None)
+    if dispatchers is None:
+        dispatchers = server._map
+
+    def flush(timeout):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not any(getattr(d, 'total_outbufs_len', 0) for d in list(dispatchers.values())):
+                return True
+            time.sleep(0.05)
+        return False
+
+    return flush
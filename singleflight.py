@@ -0,0 +1,77 @@
+"""请求合并（single-flight）：同一个键同时只计算一次，并发到达的相同请求等待并共享结果。
+
+交班时多个终端同时刷新，相同的读请求会在不同 Waitress 线程上并行查库；
+合并后只有第一个请求（leader）真正执行，其余请求（follower）等它完成。
+follower 等待超过 timeout 秒就自己计算，不会被卡住的 leader 拖住。
+"""
+import threading
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self, default_timeout=5.0):
+        self.default_timeout = default_timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.max_waiters = 0
+
+    def do(self, key, fn, timeout=None):
+        """返回 (结果, 是否共享了别人的结果)。leader 抛出的异常会让等待中的 follower 也失败。"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                call.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, call.waiters)
+        if leader:
+            try:
+                call.result = fn()
+                return call.result, False
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.event.set()
+        if not call.event.wait(self.default_timeout if timeout is None else timeout):
+            with self._lock:
+                self.timeouts += 1
+            return fn(), False
+        if call.error is not None:
+            raise RuntimeError(f"合并请求的计算失败: {call.error}") from call.error
+        return call.result, True
+
+    def stats(self):
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "in_flight": len(self._calls),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": round(self.coalesced / total, 4) if total else 0,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "max_waiters": self.max_waiters,
+                "default_timeout": self.default_timeout,
+            }
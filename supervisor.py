@@ -0,0 +1,122 @@
+"""多进程模式：主进程监听端口，启动 N 个工作进程共享同一个监听 socket，各自运行 Waitress。
+
+单进程时 GIL 限制了 JSON 编码、报表计算这类 CPU 密集的工作；多个进程各有自己的解释器，
+连接由内核分给空闲的进程，所有进程用同一个 WAL 模式的 chess.db。
+
+监听 socket 在主进程创建后传给子进程（spawn 方式，Windows 和 Linux 都可用，不依赖 SO_REUSEPORT）；
+工作进程异常退出时主进程会重新拉起，短时间内反复退出则放慢重启。
+"""
+import os
+import time
+import signal
+import socket
+import logging
+import threading
+import multiprocessing
+import multiprocessing.connection
+
+
+def create_listener(host, port, backlog=1024):
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.setblocking(False)
+    return sock
+
+
+def _watch_parent():
+    """主进程退出（包括被强制结束）后工作进程跟着退出，不留下占着端口的孤儿进程。"""
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        multiprocessing.connection.wait([parent.sentinel])
+        os._exit(0)
+
+
+def _worker_main(target, sock, args):
+    threading.Thread(target=_watch_parent, name="watch-parent", daemon=True).start()
+    target(sock, *args)
+
+
+class Supervisor:
+    def __init__(self, target, sock, workers=2, args=(), restart_delay=1.0, max_restart_delay=30.0, stop_timeout=10.0):
+        """target(sock, *args) 是工作进程入口，需要是模块级函数（子进程重新导入该模块后调用）。
+
+        stop_timeout：停止时等工作进程自行退出（处理完进行中的请求）的秒数，超时强制结束。
+        """
+        self.target = target
+        self.sock = sock
+        self.workers = workers
+        self.args = args
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.stop_timeout = stop_timeout
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs = []
+        self._delay = restart_delay
+        self._stopping = False
+        self.restarts = 0
+
+    def _spawn(self, slot):
+        p = self._ctx.Process(target=_worker_main, args=(self.target, self.sock, tuple(self.args)),
+                              name=f"worker-{slot}", daemon=True)
+        p.start()
+        logging.info("工作进程 %s 已启动 (pid %s)", p.name, p.pid)
+        return p
+
+    def start(self):
+        self._procs = [self._spawn(i) for i in range(self.workers)]
+
+    def check(self):
+        """重新拉起已退出的工作进程，返回重启的个数。"""
+        restarted = 0
+        for i, p in enumerate(self._procs):
+            if p.is_alive() or self._stopping:
+                continue
+            logging.error("工作进程 %s 退出 (exitcode %s)，%.0f 秒后重启", p.name, p.exitcode, self._delay)
+            time.sleep(self._delay)
+            self._delay = min(self._delay * 2, self.max_restart_delay)
+            self._procs[i] = self._spawn(i)
+            self.restarts += 1
+            restarted += 1
+        if not restarted:
+            self._delay = self.restart_delay
+        return restarted
+
+    def run(self, interval=1.0):
+        """启动工作进程并守护，直到 Ctrl+C、SIGTERM 或 stop()。
+
+        调用方已经装了 SIGTERM 处理（如优雅停机）时沿用调用方的，它负责让这里收到 KeyboardInterrupt。
+        """
+        if signal.getsignal(signal.SIGTERM) in (signal.SIG_DFL, None):
+            signal.signal(signal.SIGTERM, lambda signum, frame: self._interrupt())
+        self.start()
+        try:
+            while not self._stopping:
+                time.sleep(interval)
+                self.check()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop(self.stop_timeout)
+
+    def _interrupt(self):
+        self._stopping = True
+        raise KeyboardInterrupt
+
+    def stop(self, timeout=10):
+        """通知工作进程退出（SIGTERM，工作进程会先处理完进行中的请求），最多等 timeout 秒，之后强制结束。"""
+        self._stopping = True
+        for p in self._procs:
+            if p.is_alive():
+                p.terminate()
+        deadline = time.monotonic() + timeout
+        for p in self._procs:
+            p.join(max(0.0, deadline - time.monotonic()))
+        for p in self._procs:
+            if p.is_alive():
+                logging.warning("工作进程 %s 未在 %.0f 秒内退出，强制结束", p.name, timeout)
+                p.kill()
+                p.join(1)
+        self.sock.close()
+
+    def status(self):
+        return {"workers": [{"name": p.name, "pid": p.pid, "alive": p.is_alive()} for p in self._procs],
+                "restarts": self.restarts}
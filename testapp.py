@@ -2,17 +2,45 @@ import os
 import sys
 import sqlite3
 import datetime
-import uuid
+import calendar
 import threading
 import webbrowser
 import time
 import logging
+import functools
+import weakref
+import multiprocessing
+import contextlib
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g
 from flask_cors import CORS
 
-from config import DB_CONFIG, SERVER_CONFIG, BASE_DIR
+from config import DB_CONFIG, SERVER_CONFIG, BASE_DIR, COMPRESSION_CONFIG, ARCHIVE_CONFIG, BACKUP_CONFIG, ORDER_NUMBER_CONFIG, DEBUG_CONFIG, CACHE_CONFIG, SINGLE_FLIGHT_CONFIG, ANALYTICS_CONFIG, RESERVATION_CONFIG, MAINTENANCE_CONFIG, REPLICA_CONFIG, BATCH_CONFIG, LOG_CONFIG, SEARCH_CONFIG
 import init_db
+import coherence
+import archive
+import order_numbers
+import fulltext
+import analytics
+import batch
+from backup import BackupManager
+from maintenance import MaintenanceScheduler
+from supervisor import Supervisor, create_listener
+from coherence import ChangeTracker
+from replica import ReadReplica
+from customer_index import CustomerIndex
+from reservations import ReservationIndex, parse_time
+from profiler import SamplingProfiler
+from memtrace import MemoryTracer
+from compression import Compress, no_compress
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from querylog import QueryLog, TimedCursor
+from accesslog import StructuredLog
+from tracing import Tracer
+from shutdown import RequestDrain, GracefulShutdown, waitress_flush
+import models
+from models import Room, Order, OrderLine, Product
 
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 
@@ -28,47 +56,266 @@ DB_PATH = DB_CONFIG.get("filename") or DB_PATH
 if getattr(sys, 'frozen', False):
     DB_PATH = os.path.join(os.path.dirname(sys.executable), "data", "chess.db")
 
+# 归档库默认与主库同目录
+ARCHIVE_PATH = (ARCHIVE_CONFIG.get("filename") or os.path.join(os.path.dirname(DB_PATH), "archive.db")) if ARCHIVE_CONFIG.get("enabled") else None
+
+# 访问/审计日志（后台线程写文件）；多进程模式下工作进程各写各的文件
+_process_name = multiprocessing.current_process().name
+structured_log = StructuredLog(LOG_CONFIG.get("dir") or os.path.join(os.path.dirname(DB_PATH), "logs"), LOG_CONFIG,
+                               suffix="" if _process_name == "MainProcess" else "-" + _process_name)
+
 # 确保数据库已初始化
 init_db.ensure_initialized(DB_PATH)
 
 app = Flask(__name__, static_folder=os.path.join(_base_dir, "static"))
 CORS(app)
+Compress(app, COMPRESSION_CONFIG)
+
+# 请求追踪（诊断用，默认关闭）：保留下来的 trace 以 OTLP/JSON 写到日志目录的 traces.jsonl
+_trace_log = structured_log.add_stream("traces", timestamp=False) if DEBUG_CONFIG.get('traces_enabled') and DEBUG_CONFIG.get('trace_export', True) else None
+tracer = Tracer(
+    enabled=DEBUG_CONFIG.get('traces_enabled', False),
+    sample_rate=DEBUG_CONFIG.get('trace_sample_rate', 1.0),
+    tail_ms=DEBUG_CONFIG.get('trace_tail_ms', 100),
+    keep=DEBUG_CONFIG.get('trace_keep', 200),
+    export=(lambda otlp: _trace_log.info("trace", extra={"fields": otlp})) if _trace_log else None,
+)
+tracer.init_app(app)
+# 优雅停机：最外层统计进行中的请求，停机时先等它们处理完、新请求返回 503
+request_drain = RequestDrain(app.wsgi_app)
+app.wsgi_app = request_drain
+
+TIME_FMT = "%Y-%m-%d %H:%M:%S"
+
+def to_epoch(dt):
+    """本地时间 -> 与 orders.start_ts / end_ts 一致的整数秒（按 UTC 解释，只用于比较和差值）。"""
+    return calendar.timegm(dt.timetuple())
+
+def billing_hours(start_ts, end_ts):
+    """计费时长（小时，保留 1 位），参数为整数秒。开房中预览和结账共用，结账时注册为 SQL 函数 bill_hours。"""
+    if start_ts is None or end_ts is None:
+        return 0.0
+    return round((end_ts - start_ts)/3600, 1)
+
+def money(x):
+    """金额保留两位（与 Python round 一致），注册为 SQL 函数 money。"""
+    return round(float(x or 0), 2)
+
+def audit(event, **fields):
+    """记一条审计日志（带客户端 IP）；订单号同时记到本次请求的访问日志里。"""
+    if fields.get('order_number'):
+        g.order_number = fields['order_number']
+    structured_log.audit(event, ip=request.remote_addr, **fields)
+
+class _ConnHolder:
+    """放在线程局部变量里；线程结束时被回收，连接随之交还给 Database。"""
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn):
+        self.conn = conn
 
 class Database:
-    def __init__(self, path):
+    """每个线程一个连接：各请求的事务互不干扰，一个线程回滚不会撤销别的线程未提交的写入。
+
+    线程结束后连接回到空闲列表，新线程优先复用（Flask 开发服务器每个请求一个新线程），
+    空闲连接超过 max_idle 的直接关闭，不会随请求数一直增加。
+    """
+
+    def __init__(self, path, archive_path=None, query_log=None, tracer=None, max_idle=4):
         self.path = path
-        self.conn = self.create_connection()
+        self.archive_path = archive_path
+        self.query_log = query_log
+        self.tracer = tracer
+        self.change_tracker = None
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conns = []
+        self._idle = []
 
     def create_connection(self):
         conn = sqlite3.connect(self.path, check_same_thread=False)
         conn.row_factory = sqlite3.Row
         conn.execute("PRAGMA foreign_keys = ON;")
+        self.setup_connection(conn)
         return conn
 
+    def setup_connection(self, conn):
+        """注册 SQL 函数、挂载归档库。只读副本的内存连接也用它，查询语句两边通用。"""
+        conn.create_function("bill_hours", 2, billing_hours, deterministic=True)
+        conn.create_function("money", 1, money, deterministic=True)
+        # 挂载归档库并建立 all_orders / all_order_products 视图
+        archive.attach(conn, self.archive_path)
+
+    @property
+    def conn(self):
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self.create_connection()
+                with self._lock:
+                    self._conns.append(conn)
+            holder = self._local.holder = _ConnHolder(conn)
+            weakref.finalize(holder, self._release, conn).atexit = False
+        return holder.conn
+
+    def _release(self, conn):
+        # 线程已结束（在回收它的线程里调用）：回滚残留事务后放回空闲列表，放不下就关闭
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            if conn not in self._conns:
+                return      # close_all() 已经关掉了
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._conns.remove(conn)
+        conn.close()
+
     def cursor(self):
-        if self.conn is None:
-            self.conn = self.create_connection()
-        return self.conn.cursor()
+        # 慢查询日志和当前请求的 trace（如果在追踪）都通过计时游标记录每条 SQL
+        trace = self.tracer.current() if self.tracer is not None else None
+        if trace is None:
+            if self.query_log is None:
+                return self.conn.cursor()
+            return self.conn.cursor(lambda conn: TimedCursor(conn, self.query_log))
+        recorders = (self.query_log, trace) if self.query_log is not None else (trace,)
+        return self.conn.cursor(lambda conn: TimedCursor(conn, *recorders))
+
+    def _commit(self):
+        if self.change_tracker is not None:
+            self.change_tracker.commit(self.conn, self.conn.commit)
+        else:
+            self.conn.commit()
 
     def commit(self):
         try:
-            self.conn.commit()
+            if self.tracer is not None:
+                with self.tracer.span("db.commit"):
+                    self._commit()
+                return
+            self._commit()
         except Exception as e:
             logging.error("DB commit failed: %s", e)
 
     def rollback(self):
+        if self.change_tracker is not None:
+            self.change_tracker.discard()
         try:
             self.conn.rollback()
         except Exception as e:
             logging.error("DB rollback failed: %s", e)
 
-db = Database(DB_PATH)
+    def close_all(self):
+        with self._lock:
+            conns, self._conns = self._conns, []
+            self._idle = []
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception as e:
+                logging.error("DB close failed: %s", e)
+
+query_log = QueryLog(
+    threshold_ms=DEBUG_CONFIG.get('slow_query_ms', 50),
+    capacity=DEBUG_CONFIG.get('slow_query_log_size', 200),
+    explain=DEBUG_CONFIG.get('slow_query_explain', True),
+) if DEBUG_CONFIG.get('slow_query_ms') is not None else None
+db = Database(DB_PATH, ARCHIVE_PATH, query_log, tracer, max_idle=SERVER_CONFIG.get('threads', 4))
+# 多进程模式（SERVER_CONFIG.workers > 1）：每个工作进程有自己的缓存和索引，靠共享变更计数器保持一致
+WORKERS = max(1, int(SERVER_CONFIG.get('workers', 1)))
+MULTI_PROCESS = WORKERS > 1
+change_tracker = ChangeTracker()
+change_tracker.poll(db.conn)
+db.change_tracker = change_tracker
+order_number_generator = order_numbers.create_generator(ORDER_NUMBER_CONFIG)
+response_cache = ResponseCache(
+    max_bytes=CACHE_CONFIG.get('max_bytes', 16 * 1024 * 1024),
+    max_entries=CACHE_CONFIG.get('max_entries', 1024),
+    enabled=CACHE_CONFIG.get('enabled', True),
+)
+# 报表只读副本：报表和分析查询走内存副本，不和收银抢主库的锁
+replica = ReadReplica(DB_PATH, setup=db.setup_connection,
+                      interval=REPLICA_CONFIG.get('interval_seconds', 5)) if REPLICA_CONFIG.get('enabled') else None
+occupancy = analytics.OccupancyAnalytics(
+    max_session_hours=ANALYTICS_CONFIG.get('max_session_hours', 48),
+    cache_days=ANALYTICS_CONFIG.get('cache_days', 3660),
+    settle_seconds=replica.max_lag_seconds if replica else 0,
+)
+single_flight = SingleFlight(SINGLE_FLIGHT_CONFIG.get('timeout', 5.0)) if SINGLE_FLIGHT_CONFIG.get('enabled', True) else None
+fulltext_enabled = fulltext.ensure_fts(db.conn)
+
+def report_cursor():
+    """with report_cursor() as cur: 报表查询的游标，启用只读副本时走副本。"""
+    if replica is None:
+        return contextlib.nullcontext(db.cursor())
+    return replica.reader(db.cursor)
+
+# 会员查找索引：启动时全量加载，新建/修改会员时写穿
+customer_index = CustomerIndex()
+
+def load_customer_index():
+    customer_index.reload(lambda: db.cursor().execute("SELECT id, name, phone, member_level FROM customers").fetchall())
+
+def fetch_customer(customer_id):
+    row = db.cursor().execute("SELECT id, name, phone, member_level FROM customers WHERE id = ?", (customer_id,)).fetchone()
+    return row_to_dict(row) if row else None
+
+load_customer_index()
+
+# 预约冲突索引：启动时加载有效预约和进行中订单，预约/开房/结账时写穿
+reservation_index = ReservationIndex(
+    walkin_guard_minutes=RESERVATION_CONFIG.get('walkin_guard_minutes', 60),
+    no_show_minutes=RESERVATION_CONFIG.get('no_show_minutes', 30),
+    open_hold_minutes=RESERVATION_CONFIG.get('open_hold_minutes', 30),
+)
 
+def load_reservation_index():
+    reservation_index.load(
+        [tuple(r) for r in db.cursor().execute(
+            "SELECT id, room_id, start_time, end_time FROM reservations WHERE status = 'booked' AND end_time >= ?",
+            ((datetime.datetime.now() - datetime.timedelta(days=1)).strftime("%Y-%m-%d %H:%M:%S"),)).fetchall()],
+        [tuple(r) for r in db.cursor().execute("SELECT room_id, start_time FROM orders WHERE payment_status = 'unpaid'").fetchall()],
+    )
+
+load_reservation_index()
+
+# 其它进程改过的表：让本进程的响应缓存失效，重新加载受影响的索引。
+# 本进程的写入经 lock_for_write() 记账，不会触发重载（已经写穿到索引）
+change_tracker.on_change(coherence.TRACKED_TABLES, lambda tables: response_cache.bump(*tables))
+change_tracker.on_change(('customers',), lambda tables: load_customer_index())
+change_tracker.on_change(('reservations', 'orders'), lambda tables: load_reservation_index())
+
+def lock_for_write():
+    """多进程模式：先拿数据库写锁（BEGIN IMMEDIATE）再同步其它进程的改动。
+
+    随后的索引检查和写入都在这把锁里，其它进程的预约/开房只能排在后面，冲突判断仍然原子。
+    提交时本事务的计数变化记为本进程的改动，同进程其它线程不会因此重载会员/预约索引。单进程时不做任何事。
+    """
+    if MULTI_PROCESS:
+        db.conn.execute("BEGIN IMMEDIATE")
+        change_tracker.begin_write(db.conn)
+
+backups = BackupManager(
+    [("chess", DB_PATH), ("archive", ARCHIVE_PATH)],
+    BACKUP_CONFIG.get("dir") or os.path.join(os.path.dirname(DB_PATH), "backups"),
+    keep=BACKUP_CONFIG.get("keep", 7),
+    pages_per_step=BACKUP_CONFIG.get("pages_per_step", 256),
+    step_sleep=BACKUP_CONFIG.get("step_sleep", 0.01),
+    measure_stall=BACKUP_CONFIG.get("measure_stall", True),
+)
+
+@tracer.traced("serialize.row_to_dict", aggregate=True)
 def row_to_dict(row):
     if row is None:
         return None
     return {k: (v if not isinstance(v, (bytes, bytearray)) else v.decode()) for k, v in dict(row).items()}
 
+@tracer.traced("serialize.serialize_row", aggregate=True)
 def serialize_row(r):
     if isinstance(r, dict):
         out = {}
@@ -80,13 +327,86 @@ def serialize_row(r):
         return out
     return r
 
+def fetch_models(cls, sql, params=()):
+    """查询结果直接构造成 __slots__ 对象，不经过 sqlite3.Row 和 dict。"""
+    cur = db.cursor()
+    cur.row_factory = None
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    with tracer.span("serialize.models", model=cls.__name__, rows=len(rows)):
+        return cls.from_rows(rows)
+
+def json_response(payload, status=200):
+    with tracer.span("serialize.encode") as span:
+        body = models.encode(payload)
+        span.set(chars=len(body))
+    return app.response_class(body, status=status, mimetype='application/json')
+
+def _run_view(f, args, kwargs):
+    resp = app.make_response(f(*args, **kwargs))
+    return resp.status_code, list(resp.headers), resp.get_data()
+
+def _shared_call(key, compute, timeout=None):
+    """相同 key 的并发请求只执行一次 compute，其余等待并共享结果。返回 (结果, 是否共享)。"""
+    if single_flight is None:
+        return compute(), False
+    return single_flight.do(key, compute, timeout)
+
+def _build_response(status, headers, body, shared):
+    resp = app.response_class(body, status=status, headers=headers)
+    if shared:
+        resp.headers['X-Coalesced'] = '1'
+    return resp
+
+def coalesced(*tables, timeout=None):
+    """不缓存的只读 GET 接口：只合并同时到达的相同请求。
+    tables 为接口读取的表，key 带上它们的版本号：写入提交之后到达的请求不会拿到提交前开始的查询结果。"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            versions = response_cache.versions(tables)
+            key = ('coalesce', request.path, tuple(sorted(request.args.items(multi=True))), versions)
+            (status, headers, body), shared = _shared_call(key, lambda: _run_view(f, args, kwargs), timeout)
+            return _build_response(status, headers, body, shared)
+        return wrapper
+    return decorator
+
+def cached_json(*tables, timeout=None):
+    """缓存 GET 接口 200 响应的字节；tables 为接口读取的表，写接口提交后 response_cache.bump() 失效。
+    未命中时相同的并发请求合并为一次查库，timeout 为等待 leader 的秒数。"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            versions = response_cache.versions(tables)
+            key = (request.path, tuple(sorted(request.args.items(multi=True))), versions)
+            entry = response_cache.get(key) if response_cache.enabled else None
+            if entry is not None:
+                resp = app.response_class(entry.body, mimetype='application/json')
+                resp.cache_entry = entry
+                resp.headers['X-Cache'] = 'HIT'
+                return resp
+
+            def compute():
+                status, headers, body = _run_view(f, args, kwargs)
+                # 批量请求的读快照可能早于 versions，查到的结果不能记在新版本号下
+                entry = response_cache.put(key, tables, versions, body) if status == 200 and not g.get('read_snapshot') else None
+                return status, headers, body, entry
+
+            (status, headers, body, entry), shared = _shared_call(key, compute, timeout)
+            resp = _build_response(status, headers, body, shared)
+            if entry is not None:
+                resp.cache_entry = entry
+            resp.headers['X-Cache'] = 'MISS'
+            return resp
+        return wrapper
+    return decorator
+
 # ---------- Rooms endpoints ----------
 @app.route('/api/rooms', methods=['GET'])
+@cached_json('rooms')
 def get_rooms():
-    cur = db.cursor()
-    cur.execute("SELECT * FROM rooms ORDER BY id")
-    rows = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-    return jsonify({"success": True, "data": rows})
+    rooms = fetch_models(Room, f"SELECT {Room.columns()} FROM rooms ORDER BY id")
+    return json_response({"success": True, "data": rooms})
 
 @app.route('/api/rooms', methods=['POST'])
 def create_room():
@@ -98,6 +418,8 @@ def create_room():
         cur.execute("INSERT INTO rooms (name, room_number, room_type, price_per_hour, status, description) VALUES (?,?,?,?,?,?)",
                     (data.get('name'), data.get('room_number', None), data.get('room_type', ''), data.get('price_per_hour', 0), data.get('status','available'), data.get('description','')))
         db.commit()
+        response_cache.bump('rooms')
+        audit("room.create", room_id=cur.lastrowid, name=data.get('name'), price_per_hour=data.get('price_per_hour', 0))
         return jsonify({"success": True, "room_id": cur.lastrowid})
     except Exception as e:
         db.rollback()
@@ -106,19 +428,19 @@ def create_room():
 
 @app.route('/api/rooms/<int:room_id>', methods=['GET'])
 def get_room(room_id):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM rooms WHERE id = ?", (room_id,))
-    row = cur.fetchone()
-    if not row:
+    rooms = fetch_models(Room, f"SELECT {Room.columns()} FROM rooms WHERE id = ?", (room_id,))
+    if not rooms:
         return jsonify({"success": False, "error": "房间不存在"}), 404
-    return jsonify({"success": True, "data": serialize_row(row_to_dict(row))})
+    return json_response({"success": True, "data": rooms[0]})
+
+ROOM_FIELDS = ('name','room_number','room_type','price_per_hour','status','description')
 
 @app.route('/api/rooms/<int:room_id>', methods=['PUT'])
 def update_room(room_id):
     data = request.get_json(silent=True) or {}
     fields = []
     params = []
-    for k in ('name','room_number','room_type','price_per_hour','status','description'):
+    for k in ROOM_FIELDS:
         if k in data:
             fields.append(f"{k} = ?")
             params.append(data[k])
@@ -129,6 +451,8 @@ def update_room(room_id):
         cur = db.cursor()
         cur.execute(f"UPDATE rooms SET {', '.join(fields)} WHERE id = ?", tuple(params))
         db.commit()
+        response_cache.bump('rooms')
+        audit("room.update", room_id=room_id, changes={k: data[k] for k in data if k in ROOM_FIELDS})
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
@@ -139,46 +463,91 @@ def update_room(room_id):
 def delete_room(room_id):
     try:
         cur = db.cursor()
-        # 防止删除存在未结订单的房间
-        cur.execute("SELECT COUNT(*) as c FROM orders WHERE room_id = ? AND payment_status = 'unpaid'", (room_id,))
-        if cur.fetchone()["c"] > 0:
-            return jsonify({"success": False, "error": "存在未结订单，无法删除"}), 400
-        cur.execute("DELETE FROM rooms WHERE id = ?", (room_id,))
+        # 防止删除存在未结订单的房间：检查和删除在同一条语句里，和并发开房串行
+        cur.execute("""
+            DELETE FROM rooms WHERE id = ?
+            AND NOT EXISTS (SELECT 1 FROM orders WHERE room_id = rooms.id AND payment_status = 'unpaid')
+        """, (room_id,))
+        if cur.rowcount != 1:
+            db.rollback()
+            cur.execute("SELECT 1 FROM rooms WHERE id = ?", (room_id,))
+            if cur.fetchone():
+                return jsonify({"success": False, "error": "存在未结订单，无法删除"}), 400
         db.commit()
+        response_cache.bump('rooms')
+        audit("room.delete", room_id=room_id)
         return jsonify({"success": True})
+    except sqlite3.IntegrityError:
+        # 外键：预约记录、已结账的历史订单仍引用这个房间
+        db.rollback()
+        cur.execute("SELECT 1 FROM reservations WHERE room_id = ? LIMIT 1", (room_id,))
+        if cur.fetchone():
+            return jsonify({"success": False, "error": "房间有预约记录，无法删除"}), 409
+        return jsonify({"success": False, "error": "房间有历史订单，无法删除"}), 409
     except Exception as e:
         db.rollback()
         logging.exception(e)
         return jsonify({"success": False, "error": str(e)}), 500
 
 @app.route('/api/rooms/available', methods=['GET'])
+@cached_json('rooms')
 def get_available_rooms():
-    cur = db.cursor()
-    cur.execute("SELECT * FROM rooms WHERE status = 'available' ORDER BY id")
-    rows = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-    return jsonify({"success": True, "data": rows})
+    rooms = fetch_models(Room, f"SELECT {Room.columns()} FROM rooms WHERE status = 'available' ORDER BY id")
+    return json_response({"success": True, "data": rooms})
 
 @app.route('/api/rooms/<int:room_id>/open', methods=['POST'])
 def open_room(room_id):
     data = request.get_json(silent=True) or {}
     customer_id = data.get('customer_id')
-    start_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    order_number = f"ORD-{uuid.uuid4().hex[:8].upper()}"
+    try:
+        reservation_id = int(data['reservation_id']) if data.get('reservation_id') else None
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "reservation_id 错误"}), 400
+    now = datetime.datetime.now()
+    start_time = now.strftime("%Y-%m-%d %H:%M:%S")
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    # 先查预约索引（不访问数据库）：即将开始的其它预约会占用房间
+    blockers, registered = reservation_index.begin_open(room_id, now, reservation_id)
+    if blockers:
+        db.rollback()
+        return jsonify({"success": False, "error": "房间已被预约", "reservations": blockers}), 409
     try:
         cur = db.cursor()
-        cur.execute("SELECT status FROM rooms WHERE id = ?", (room_id,))
-        rr = cur.fetchone()
-        if not rr:
-            return jsonify({"success": False, "error": "房间不存在"}), 404
-        if rr["status"] != "available":
-            return jsonify({"success": False, "error": "房间不可用"}), 400
+        # 条件更新抢占房间：并发开同一间房只有一个请求能把 available 改成 occupied
+        cur.execute("UPDATE rooms SET status = 'occupied' WHERE id = ? AND status = 'available'", (room_id,))
+        if cur.rowcount != 1:
+            db.rollback()
+            reservation_index.abort_open(room_id, registered)
+            cur.execute("SELECT 1 FROM rooms WHERE id = ?", (room_id,))
+            if not cur.fetchone():
+                return jsonify({"success": False, "error": "房间不存在"}), 404
+            return jsonify({"success": False, "error": "房间不可用"}), 409
+        # 与插入订单在同一事务内取号，单调递增且不会撞号
+        order_number = order_number_generator.next(cur, now)
         cur.execute("INSERT INTO orders (order_number, room_id, customer_id, start_time, payment_status, product_total, total_amount) VALUES (?,?,?,?,?,?,?)",
                     (order_number, room_id, customer_id, start_time, 'unpaid', 0, 0))
-        cur.execute("UPDATE rooms SET status = 'occupied' WHERE id = ?", (room_id,))
+        if reservation_id:
+            # 预约到店：同一事务内把预约标记为已履约
+            cur.execute("UPDATE reservations SET status = 'fulfilled', order_id = ?, updated_at = ? WHERE id = ? AND room_id = ? AND status = 'booked'",
+                        (cur.lastrowid, start_time, reservation_id, room_id))
+            if cur.rowcount != 1:
+                db.rollback()
+                reservation_index.abort_open(room_id, registered)
+                return jsonify({"success": False, "error": "预约不存在或已失效"}), 400
         db.commit()
+        response_cache.bump('rooms', 'orders')
+        reservation_index.opened(room_id, now)
+        if reservation_id:
+            reservation_index.remove(reservation_id)
+        audit("room.open", room_id=room_id, order_number=order_number, customer_id=customer_id,
+              reservation_id=reservation_id, start_time=start_time)
         return jsonify({"success": True, "order_number": order_number})
     except Exception as e:
         db.rollback()
+        reservation_index.abort_open(room_id, registered)
         logging.exception(e)
         return jsonify({"success": False, "error": str(e)}), 500
 
@@ -186,13 +555,14 @@ def open_room(room_id):
 @app.route('/api/orders/room/<int:room_id>/current', methods=['GET'])
 def get_current_order_for_room(room_id):
     cur = db.cursor()
-    cur.execute("SELECT * FROM orders WHERE room_id = ? AND payment_status = 'unpaid' ORDER BY id DESC LIMIT 1", (room_id,))
+    cur.execute(f"SELECT {Order.columns()}, start_ts FROM orders WHERE room_id = ? AND payment_status = 'unpaid' ORDER BY id DESC LIMIT 1", (room_id,))
     row = cur.fetchone()
     if not row:
         return jsonify({"success": False, "error": "无进行中订单"}), 404
     order = row_to_dict(row)
+    start_ts = order.pop('start_ts')
     # 获取商品明细
-    cur.execute("""
+    order['products'] = fetch_models(OrderLine, """
         SELECT op.id, op.order_id, op.product_id, op.quantity, op.unit_price, op.total_price,
                p.name, p.category
         FROM order_products op
@@ -200,18 +570,11 @@ def get_current_order_for_room(room_id):
         WHERE op.order_id = ?
         ORDER BY op.id
     """, (order['id'],))
-    products = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-    order['products'] = products
-    # 计算商品合计
-    cur.execute("SELECT IFNULL(SUM(total_price),0) as product_total FROM order_products WHERE order_id = ?", (order['id'],))
-    product_total = float(cur.fetchone()["product_total"] or 0)
+    # 计算商品合计（按分求和，不累积浮点误差）
+    cur.execute("SELECT IFNULL(SUM(total_cents),0) as product_cents FROM order_products WHERE order_id = ?", (order['id'],))
+    product_total = cur.fetchone()["product_cents"] / 100
     # 当前房费（按开始时间到现在计算）
-    try:
-        st = datetime.datetime.strptime(order.get('start_time') or '', "%Y-%m-%d %H:%M:%S")
-    except Exception:
-        st = datetime.datetime.now()
-    diff = datetime.datetime.now() - st
-    total_hours = round(diff.total_seconds()/3600, 1)
+    total_hours = billing_hours(start_ts, to_epoch(datetime.datetime.now()))
     cur.execute("SELECT IFNULL(price_per_hour,0) as price_per_hour FROM rooms WHERE id = ?", (order['room_id'],))
     room = cur.fetchone()
     price_per_hour = float(room["price_per_hour"] if room and room["price_per_hour"] is not None else 0)
@@ -220,41 +583,319 @@ def get_current_order_for_room(room_id):
     order['current_room_hours'] = total_hours
     order['current_room_amount'] = room_amount
     order['current_grand_total'] = round(product_total + room_amount, 2)
-    return jsonify({"success": True, "data": serialize_row(order)})
+    return json_response({"success": True, "data": serialize_row(order)})
 
 @app.route('/api/orders', methods=['GET'])
+@cached_json('orders')
 def list_orders():
     active = request.args.get('active')
-    cur = db.cursor()
     if active and active in ('1','true','True'):
-        cur.execute("SELECT * FROM orders WHERE payment_status = 'unpaid' ORDER BY start_time DESC")
+        orders = fetch_models(Order, f"SELECT {Order.columns()} FROM orders WHERE payment_status = 'unpaid' ORDER BY start_time DESC")
     else:
-        cur.execute("SELECT * FROM orders ORDER BY start_time DESC LIMIT 500")
+        # 历史列表包含归档订单
+        orders = fetch_models(Order, f"SELECT {Order.columns()} FROM all_orders ORDER BY start_time DESC LIMIT 500")
+    return json_response({"success": True, "data": orders})
+
+# ---------- Search ----------
+@app.route('/api/search', methods=['GET'])
+def search_all():
+    if not fulltext_enabled:
+        return jsonify({"success": False, "error": "全文检索不可用（SQLite 未启用 FTS5）"}), 501
+    q = request.args.get('q', '').strip()
+    types = [t for t in request.args.get('type', ','.join(fulltext.TYPES)).split(',') if t in fulltext.TYPES]
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+        page_size = min(max(int(request.args.get('page_size', 20)), 1), 100)
+    except ValueError:
+        return jsonify({"success": False, "error": "参数错误"}), 400
+    if not q:
+        return jsonify({"success": True, "data": [], "total": 0, "page": page, "page_size": page_size})
+    sync_rows = SEARCH_CONFIG.get('request_sync_rows', 50)
+    if sync_rows and not db.conn.in_transaction:
+        # 顺手把最近的改动写进索引，只做一小批，积压由后台线程处理（批量接口的读快照里不做，不能提前结束快照）
+        fulltext.sync(db.conn, batch=sync_rows, limit=sync_rows)
+    try:
+        hits, total = fulltext.search(db.cursor(), q, types, page_size, (page - 1) * page_size)
+    except Exception as e:
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+    return jsonify({"success": True, "data": hits, "total": total, "page": page, "page_size": page_size})
+
+# ---------- Batch ----------
+@app.route('/api/batch', methods=['POST'])
+@no_compress    # 由各子接口缓存的字节拼接而成，整体压缩既用不上缓存的压缩结果，又要对大响应逐次压缩
+def batch_requests():
+    """{"requests": [{"method": "GET", "path": "/api/rooms"}, ...]}，结果按顺序返回。
+
+    连续的读请求在同一个读事务里执行，看到的是同一个数据库快照；写请求前结束快照，按顺序逐个执行。
+    """
+    try:
+        items = batch.parse_requests(request.get_json(silent=True), BATCH_CONFIG.get('max_requests', 20))
+    except batch.BatchError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    environ_base = {'REMOTE_ADDR': request.remote_addr}
+    results = []
+    g.read_snapshot = False
+    try:
+        for method, path, body in items:
+            read = method in batch.READ_METHODS
+            if read and not g.read_snapshot:
+                db.conn.execute("BEGIN")
+                g.read_snapshot = True
+            elif not read and g.read_snapshot:
+                db.rollback()
+                g.read_snapshot = False
+            with tracer.span("batch.sub_request", method=method, path=path):
+                results.append(batch.dispatch(app, method, path, body, environ_base, exclude_endpoints=('index', 'spa_fallback')))
+    finally:
+        if g.read_snapshot:
+            db.rollback()
+            g.read_snapshot = False
+    return app.response_class(batch.encode_results(results), mimetype='application/json')
+
+# ---------- Report ----------
+@app.route('/api/report/daily', methods=['GET'])
+@coalesced('orders')
+def daily_report():
+    date = request.args.get('date') or datetime.date.today().strftime("%Y-%m-%d")
+    try:
+        day = datetime.datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"success": False, "error": "日期格式错误"}), 400
+    start = to_epoch(day)
+    with report_cursor() as cur:
+        # 按结账时间统计当天营收（含归档订单），整数时间取区间、按分求和
+        cur.execute("""
+            SELECT COUNT(*) AS order_count, IFNULL(SUM(total_cents),0) AS total_cents,
+                   IFNULL(SUM(product_cents),0) AS product_cents
+            FROM all_orders
+            WHERE payment_status = 'paid' AND end_ts >= ? AND end_ts < ?
+        """, (start, start + 86400))
+        row = row_to_dict(cur.fetchone())
+    total_cents, product_cents = row.pop('total_cents'), row.pop('product_cents')
+    row['total_revenue'] = total_cents / 100
+    row['product_revenue'] = product_cents / 100
+    row['room_revenue'] = (total_cents - product_cents) / 100
+    row['date'] = date
+    return jsonify({"success": True, "data": row})
+
+# ---------- Reservations ----------
+def _reservation_slot(data):
+    start = parse_time(data.get('start_time') or data.get('start'))
+    end = parse_time(data.get('end_time') or data.get('end'))
+    if end <= start:
+        raise ValueError("结束时间必须晚于开始时间")
+    return start, end
+
+@app.route('/api/reservations', methods=['POST'])
+def create_reservation():
+    data = request.get_json(silent=True) or {}
+    try:
+        room_id = int(data['room_id'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"success": False, "error": "缺少 room_id"}), 400
+    try:
+        start, end = _reservation_slot(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    now = datetime.datetime.now()
+    if end <= now:
+        return jsonify({"success": False, "error": "预约时间已过"}), 400
+    if start > now + datetime.timedelta(days=RESERVATION_CONFIG.get('max_days_ahead', 90)):
+        return jsonify({"success": False, "error": "超出可预约的日期范围"}), 400
+    cur = db.cursor()
+    cur.execute("SELECT 1 FROM rooms WHERE id = ?", (room_id,))
+    if not cur.fetchone():
+        return jsonify({"success": False, "error": "房间不存在"}), 404
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    token, conflicts = reservation_index.reserve(room_id, start, end, now)
+    if token is None:
+        db.rollback()
+        return jsonify({"success": False, "error": "时间冲突", "conflicts": conflicts}), 409
+    try:
+        cur.execute("INSERT INTO reservations (room_id, customer_id, contact_name, contact_phone, start_time, end_time, note) VALUES (?,?,?,?,?,?,?)",
+                    (room_id, data.get('customer_id'), data.get('contact_name'), data.get('contact_phone'),
+                     start.strftime(TIME_FMT), end.strftime(TIME_FMT), data.get('note', '')))
+        reservation_id = cur.lastrowid
+        db.commit()
+        reservation_index.confirm(token, reservation_id)
+        audit("reservation.create", reservation_id=reservation_id, room_id=room_id,
+              start_time=start.strftime(TIME_FMT), end_time=end.strftime(TIME_FMT))
+        return jsonify({"success": True, "reservation_id": reservation_id})
+    except Exception as e:
+        db.rollback()
+        reservation_index.remove(token)
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/reservations', methods=['GET'])
+def list_reservations():
+    """?date=YYYY-MM-DD 或 ?from=&to=，可加 room_id、status（all 为全部）；默认列出未结束的有效预约。"""
+    where, params = [], []
+    try:
+        if request.args.get('date'):
+            day = datetime.datetime.strptime(request.args['date'], "%Y-%m-%d")
+            where.append("start_time < ? AND end_time > ?")
+            params += [(day + datetime.timedelta(days=1)).strftime(TIME_FMT), day.strftime(TIME_FMT)]
+        else:
+            if request.args.get('from'):
+                where.append("end_time > ?")
+                params.append(parse_time(request.args['from']).strftime(TIME_FMT))
+            if request.args.get('to'):
+                where.append("start_time < ?")
+                params.append(parse_time(request.args['to']).strftime(TIME_FMT))
+            if not params:
+                where.append("end_time > ?")
+                params.append(datetime.datetime.now().strftime(TIME_FMT))
+    except ValueError:
+        return jsonify({"success": False, "error": "日期格式错误"}), 400
+    if request.args.get('room_id'):
+        where.append("room_id = ?")
+        params.append(request.args.get('room_id'))
+    status = request.args.get('status', 'booked')
+    if status != 'all':
+        where.append("status = ?")
+        params.append(status)
+    cur = db.cursor()
+    cur.execute(f"SELECT * FROM reservations WHERE {' AND '.join(where)} ORDER BY start_time LIMIT 500", tuple(params))
     rows = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
     return jsonify({"success": True, "data": rows})
 
+@app.route('/api/reservations/<int:reservation_id>/cancel', methods=['POST'])
+def cancel_reservation(reservation_id):
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    try:
+        cur = db.cursor()
+        cur.execute("UPDATE reservations SET status = 'cancelled', updated_at = ? WHERE id = ? AND status = 'booked'",
+                    (datetime.datetime.now().strftime(TIME_FMT), reservation_id))
+        if cur.rowcount != 1:
+            db.rollback()
+            cur.execute("SELECT 1 FROM reservations WHERE id = ?", (reservation_id,))
+            if not cur.fetchone():
+                return jsonify({"success": False, "error": "预约不存在"}), 404
+            return jsonify({"success": False, "error": "预约已取消或已到店"}), 400
+        db.commit()
+        reservation_index.remove(reservation_id)
+        audit("reservation.cancel", reservation_id=reservation_id)
+        return jsonify({"success": True})
+    except Exception as e:
+        db.rollback()
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/rooms/free', methods=['GET'])
+def get_free_rooms():
+    """?start=&end= 时段内没有预约冲突的房间（停用等非 available/occupied 状态的房间不列出）。"""
+    try:
+        start, end = _reservation_slot(request.args)
+    except (TypeError, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    rooms = fetch_models(Room, f"SELECT {Room.columns()} FROM rooms WHERE status IN ('available', 'occupied') ORDER BY id")
+    free = set(reservation_index.free_rooms([r.id for r in rooms], start, end))
+    return json_response({"success": True, "data": [r for r in rooms if r.id in free]})
+
+# ---------- Analytics ----------
+@app.route('/api/analytics/occupancy', methods=['GET'])
+@coalesced('orders', 'rooms')
+def occupancy_analytics():
+    """?start=&end=（YYYY-MM-DD，默认最近 7 天）&granularity=hour|day&by_room=1"""
+    if not analytics.available():
+        return jsonify({"success": False, "error": "需要安装 numpy"}), 503
+    today = datetime.date.today()
+    try:
+        end = datetime.datetime.strptime(request.args['end'], "%Y-%m-%d").date() if request.args.get('end') else today
+        start = datetime.datetime.strptime(request.args['start'], "%Y-%m-%d").date() if request.args.get('start') else end - datetime.timedelta(days=6)
+    except ValueError:
+        return jsonify({"success": False, "error": "日期格式错误"}), 400
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('hour', 'day'):
+        return jsonify({"success": False, "error": "granularity 只能是 hour/day"}), 400
+    end = min(end, today)
+    if start > end:
+        return jsonify({"success": False, "error": "开始日期晚于结束日期"}), 400
+    if (end - start).days + 1 > ANALYTICS_CONFIG.get('max_days', 1096):
+        return jsonify({"success": False, "error": "日期范围过大"}), 400
+    try:
+        with report_cursor() as cur:
+            cur.row_factory = None
+            data = occupancy.occupancy(cur, start, end, granularity, request.args.get('by_room') in ('1', 'true'))
+        return jsonify({"success": True, "data": data})
+    except Exception as e:
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
 @app.route('/api/customers', methods=['POST'])
 def create_customer():
     data = request.get_json(silent=True) or {}
     if not data.get('name') or not data.get('phone'):
         return jsonify({"success": False, "error": "缺少 name 或 phone"}), 400
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     try:
         cur = db.cursor()
         cur.execute("INSERT INTO customers (name, phone) VALUES (?,?)", (data['name'], data['phone']))
+        customer_id = cur.lastrowid
+        db.commit()
+        customer_index.refresh(customer_id, fetch_customer)
+        return jsonify({"success": True, "customer_id": customer_id})
+    except Exception as e:
+        db.rollback()
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/api/customers/<int:customer_id>', methods=['PUT'])
+def update_customer(customer_id):
+    data = request.get_json(silent=True) or {}
+    fields = []
+    params = []
+    for k in ('name','phone','member_level'):
+        if k in data:
+            fields.append(f"{k} = ?")
+            params.append(data[k])
+    if not fields:
+        return jsonify({"success": False, "error": "没有可更新的字段"}), 400
+    params.append(customer_id)
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+    try:
+        cur = db.cursor()
+        cur.execute(f"UPDATE customers SET {', '.join(fields)}, updated_at = CURRENT_TIMESTAMP WHERE id = ?", tuple(params))
+        if cur.rowcount == 0:
+            db.rollback()
+            return jsonify({"success": False, "error": "会员不存在"}), 404
         db.commit()
-        return jsonify({"success": True, "customer_id": cur.lastrowid})
+        customer_index.refresh(customer_id, fetch_customer)
+        return jsonify({"success": True})
     except Exception as e:
         db.rollback()
         logging.exception(e)
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route('/api/customers/search', methods=['GET'])
+def search_customers():
+    q = request.args.get('q', '')
+    try:
+        limit = min(max(int(request.args.get('limit', 10)), 1), 50)
+    except ValueError:
+        limit = 10
+    return jsonify({"success": True, "data": customer_index.search(q, limit)})
+
 # ---------- Products CRUD ----------
 @app.route('/api/products', methods=['GET'])
+@cached_json('products')
 def get_products():
-    cur = db.cursor()
-    cur.execute("SELECT * FROM products WHERE status = 'active' ORDER BY id")
-    rows = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-    return jsonify({"success": True, "data": rows})
+    products = fetch_models(Product, f"SELECT {Product.columns()} FROM products WHERE status = 'active' ORDER BY id")
+    return json_response({"success": True, "data": products})
 
 @app.route('/api/products', methods=['POST'])
 def add_product():
@@ -266,6 +907,8 @@ def add_product():
         cur.execute("INSERT INTO products (name, price, stock, category, status) VALUES (?,?,?,?,?)",
                     (data['name'], data['price'], data.get('stock',0), data.get('category',''), 'active'))
         db.commit()
+        response_cache.bump('products')
+        audit("product.create", product_id=cur.lastrowid, name=data['name'], price=data['price'])
         return jsonify({"success": True, "product_id": cur.lastrowid})
     except Exception as e:
         db.rollback()
@@ -274,19 +917,19 @@ def add_product():
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
 def get_product(product_id):
-    cur = db.cursor()
-    cur.execute("SELECT * FROM products WHERE id = ?", (product_id,))
-    row = cur.fetchone()
-    if not row:
+    products = fetch_models(Product, f"SELECT {Product.columns()} FROM products WHERE id = ?", (product_id,))
+    if not products:
         return jsonify({"success": False, "error": "商品不存在"}), 404
-    return jsonify({"success": True, "data": serialize_row(row_to_dict(row))})
+    return json_response({"success": True, "data": products[0]})
+
+PRODUCT_FIELDS = ('name','price','stock','category','status')
 
 @app.route('/api/products/<int:product_id>', methods=['PUT'])
 def update_product(product_id):
     data = request.get_json(silent=True) or {}
     fields = []
     params = []
-    for k in ('name','price','stock','category','status'):
+    for k in PRODUCT_FIELDS:
         if k in data:
             fields.append(f"{k} = ?")
             params.append(data[k])
@@ -297,6 +940,8 @@ def update_product(product_id):
         cur = db.cursor()
         cur.execute(f"UPDATE products SET {', '.join(fields)} WHERE id = ?", tuple(params))
         db.commit()
+        response_cache.bump('products')
+        audit("product.update", product_id=product_id, changes={k: data[k] for k in data if k in PRODUCT_FIELDS})
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
@@ -310,6 +955,8 @@ def delete_product(product_id):
         cur = db.cursor()
         cur.execute("UPDATE products SET status = 'inactive' WHERE id = ?", (product_id,))
         db.commit()
+        response_cache.bump('products')
+        audit("product.delete", product_id=product_id)
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
@@ -324,25 +971,35 @@ def add_product_to_order(order_number):
     quantity = int(data.get('quantity',1))
     if not product_id or quantity <= 0:
         return jsonify({"success": False, "error": "参数错误"}), 400
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     try:
         cur = db.cursor()
-        cur.execute("SELECT id FROM orders WHERE order_number = ? AND payment_status = 'unpaid' LIMIT 1", (order_number,))
-        order = cur.fetchone()
-        if not order:
-            return jsonify({"success": False, "error": "进行中订单不存在"}), 404
-        order_id = order["id"]
-        cur.execute("SELECT id, price, stock FROM products WHERE id = ? AND status = 'active' LIMIT 1", (product_id,))
-        product = cur.fetchone()
-        if not product:
+        # 订单是否未结账在写事务内判断：与并发结账串行，已结账的订单不会再被加商品
+        cur.execute("""
+            INSERT INTO order_products (order_id, product_id, quantity, unit_price, total_price)
+            SELECT o.id, p.id, ?, p.price, (p.price_cents * ?) / 100.0
+            FROM orders o, products p
+            WHERE o.order_number = ? AND o.payment_status = 'unpaid' AND p.id = ? AND p.status = 'active'
+            RETURNING order_id, unit_price, total_price
+        """, (quantity, quantity, order_number, product_id))
+        line = cur.fetchone()
+        if not line:
+            db.rollback()
+            cur.execute("SELECT 1 FROM orders WHERE order_number = ? AND payment_status = 'unpaid'", (order_number,))
+            if not cur.fetchone():
+                return jsonify({"success": False, "error": "进行中订单不存在"}), 404
             return jsonify({"success": False, "error": "商品不存在"}), 404
-        unit_price = float(product["price"])
-        total_price = round(unit_price * quantity, 2)
-        cur.execute("INSERT INTO order_products (order_id, product_id, quantity, unit_price, total_price) VALUES (?,?,?,?,?)",
-                    (order_id, product_id, quantity, unit_price, total_price))
-        # 更新 orders.product_total
-        cur.execute("UPDATE orders SET product_total = (SELECT IFNULL(SUM(total_price),0) FROM order_products WHERE order_id = ?) WHERE id = ?",
+        order_id = line["order_id"]
+        # 更新 orders.product_total：按分求和，与结账时的算法一致
+        cur.execute("UPDATE orders SET product_total = (SELECT IFNULL(SUM(total_cents),0) FROM order_products WHERE order_id = ?) / 100.0 WHERE id = ?",
                     (order_id, order_id))
         db.commit()
+        response_cache.bump('orders', 'order_products')
+        audit("order.add_product", order_number=order_number, product_id=product_id, quantity=quantity,
+              unit_price=line["unit_price"], amount=line["total_price"])
         return jsonify({"success": True})
     except Exception as e:
         db.rollback()
@@ -351,49 +1008,57 @@ def add_product_to_order(order_number):
 
 @app.route('/api/orders/<order_number>/products', methods=['GET'])
 def get_order_products(order_number):
-    cur = db.cursor()
-    cur.execute("""
+    lines = fetch_models(OrderLine, """
         SELECT op.id, op.order_id, op.product_id, op.quantity, op.unit_price, op.total_price,
                p.name, p.category
-        FROM order_products op
+        FROM all_order_products op
         JOIN products p ON op.product_id = p.id
-        JOIN orders o ON op.order_id = o.id
+        JOIN all_orders o ON op.order_id = o.id
         WHERE o.order_number = ?
         ORDER BY op.id
     """, (order_number,))
-    rows = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-    return jsonify({"success": True, "data": rows})
+    return json_response({"success": True, "data": lines})
 
 # ---------- Close order (include products) ----------
 @app.route('/api/orders/<order_number>/close', methods=['POST'])
 def close_order(order_number):
+    now = datetime.datetime.now()
+    end_time = now.strftime(TIME_FMT)
+    try:
+        lock_for_write()
+    except sqlite3.OperationalError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
     try:
         cur = db.cursor()
-        cur.execute("SELECT * FROM orders WHERE order_number = ? LIMIT 1", (order_number,))
+        # 一条条件更新完成结账：只有 unpaid 的订单会被改成 paid，并发重复结账只有一个成功；
+        # 时长、商品合计、总额都在同一语句里算出并通过 RETURNING 取回
+        cur.execute("""
+            UPDATE orders SET
+                end_time = :end_time,
+                payment_status = 'paid',
+                total_hours = bill_hours(start_ts, :end_ts),
+                product_total = (SELECT IFNULL(SUM(op.total_cents),0) FROM order_products op WHERE op.order_id = orders.id) / 100.0,
+                total_amount = money(
+                    money(bill_hours(start_ts, :end_ts) * IFNULL((SELECT r.price_per_hour FROM rooms r WHERE r.id = orders.room_id), 0))
+                    + (SELECT IFNULL(SUM(op.total_cents),0) FROM order_products op WHERE op.order_id = orders.id) / 100.0)
+            WHERE order_number = :order_number AND payment_status = 'unpaid'
+            RETURNING id, room_id, total_hours, product_total, total_amount,
+                IFNULL((SELECT r.price_per_hour FROM rooms r WHERE r.id = orders.room_id), 0) AS price_per_hour
+        """, {"end_time": end_time, "end_ts": to_epoch(now), "order_number": order_number})
         order = cur.fetchone()
         if not order:
-            return jsonify({"success": False, "error": "订单不存在"}), 404
-        if order["payment_status"] == "paid":
-            return jsonify({"success": False, "error": "订单已结账"}), 400
-        end_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        start_time = order["start_time"]
-        try:
-            st = datetime.datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-        except Exception:
-            st = datetime.datetime.now()
-        diff = datetime.datetime.now() - st
-        total_hours = round(diff.total_seconds()/3600, 1)
-        # 房间价格
-        cur.execute("SELECT IFNULL(price_per_hour,0) as price_per_hour FROM rooms WHERE id = ?", (order["room_id"],))
-        room = cur.fetchone()
-        price_per_hour = float(room["price_per_hour"] if room and room["price_per_hour"] is not None else 0)
-        room_amount = round(total_hours * price_per_hour, 2)
-        # 商品总额
-        cur.execute("SELECT IFNULL(SUM(total_price),0) as product_total FROM order_products WHERE order_id = ?", (order["id"],))
-        product_total = float(cur.fetchone()["product_total"] or 0)
-        grand_total = round(room_amount + product_total, 2)
+            db.rollback()
+            cur.execute("SELECT 1 FROM orders WHERE order_number = ?", (order_number,))
+            if not cur.fetchone():
+                return jsonify({"success": False, "error": "订单不存在"}), 404
+            return jsonify({"success": False, "error": "订单已结账"}), 409
+        total_hours = order["total_hours"]
+        product_total = float(order["product_total"] or 0)
+        room_amount = money(total_hours * float(order["price_per_hour"] or 0))
+        grand_total = order["total_amount"]
+        cur.execute("UPDATE rooms SET status = 'available' WHERE id = ?", (order["room_id"],))
         # 获取商品明细
-        cur.execute("""
+        products = fetch_models(OrderLine, """
             SELECT op.id, op.order_id, op.product_id, op.quantity, op.unit_price, op.total_price,
                    p.name, p.category
             FROM order_products op
@@ -401,18 +1066,349 @@ def close_order(order_number):
             WHERE op.order_id = ?
             ORDER BY op.id
         """, (order["id"],))
-        products = [serialize_row(row_to_dict(r)) for r in cur.fetchall()]
-        # 更新
-        cur.execute("UPDATE orders SET end_time = ?, total_hours = ?, total_amount = ?, product_total = ?, payment_status = 'paid' WHERE order_number = ?",
-                    (end_time, total_hours, grand_total, product_total, order_number))
-        cur.execute("UPDATE rooms SET status = 'available' WHERE id = ?", (order["room_id"],))
         db.commit()
-        return jsonify({"success": True, "data": {"total_hours": total_hours, "room_amount": room_amount, "product_total": product_total, "grand_total": grand_total, "end_time": end_time, "products": products}})
+        response_cache.bump('orders', 'rooms')
+        reservation_index.close(order["room_id"])
+        audit("order.close", order_number=order_number, room_id=order["room_id"], total_hours=total_hours,
+              room_amount=room_amount, product_total=product_total, grand_total=grand_total, end_time=end_time)
+        return json_response({"success": True, "data": {"total_hours": total_hours, "room_amount": room_amount, "product_total": product_total, "grand_total": grand_total, "end_time": end_time, "products": products}})
     except Exception as e:
         db.rollback()
         logging.exception(e)
         return jsonify({"success": False, "error": str(e)}), 500
 
+# ---------- Health ----------
+_started_at = time.time()
+ready_event = threading.Event()
+_warmup = {}    # 预热结果，/api/ready 里展示
+
+# 首页一次加载的接口：预热时先执行一遍，填好响应缓存
+WARMUP_PATHS = ('/api/rooms', '/api/orders?active=1', '/api/products', '/api/rooms/available', '/api/report/daily')
+
+def _warm_file(path, max_bytes):
+    """顺序读一遍数据库文件，进入系统文件缓存，之后的查询不用等磁盘随机读。返回读取的字节数。"""
+    read = 0
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            while read < max_bytes:
+                chunk = f.read(1 << 20)
+                if not chunk:
+                    break
+                read += len(chunk)
+    return read
+
+def warm_up():
+    """启动预热：检查迁移是否完整，读入数据库文件，在进程内执行首页接口。迁移完整时设置 ready_event。"""
+    started = time.perf_counter()
+    result = {"schema_missing": init_db.missing_schema(db.conn)}
+    if SERVER_CONFIG.get('warm_up', True):
+        max_bytes = int(SERVER_CONFIG.get('warm_file_mb', 64)) * 1024 * 1024
+        result["file_bytes"] = sum(_warm_file(path, max_bytes) for path in (DB_PATH, ARCHIVE_PATH))
+        # 走批量接口的进程内分发：不经过访问日志等钩子
+        environ_base = {'REMOTE_ADDR': '127.0.0.1'}
+        result["requests"] = {path: batch.dispatch(app, 'GET', path, environ_base=environ_base)[0] for path in WARMUP_PATHS}
+        failed = [path for path, status in result["requests"].items() if status != 200]
+        if failed:
+            logging.warning("预热请求失败: %s", ", ".join(failed))
+    result["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    _warmup.update(result)
+    if result["schema_missing"]:
+        logging.error("数据库迁移不完整，服务不会报告就绪: %s", ", ".join(result["schema_missing"]))
+    else:
+        ready_event.set()
+        logging.info("预热完成（%.0f ms），服务已就绪", result["ms"])
+    return result
+
+def start_warm_up(on_ready=None):
+    """在后台线程预热（服务已经在监听，预热期间 /api/ready 返回 503），就绪后调用 on_ready()。"""
+    def run():
+        try:
+            warm_up()
+        except Exception as e:
+            logging.exception(e)
+            return
+        if ready_event.is_set() and on_ready is not None:
+            on_ready()
+    t = threading.Thread(target=run, name="warm-up", daemon=True)
+    t.start()
+    return t
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """存活检查：能处理请求即可，不访问数据库。"""
+    return jsonify({"success": True, "status": "ok", "pid": os.getpid(),
+                    "uptime_seconds": round(time.time() - _started_at, 1)})
+
+@app.route('/api/ready', methods=['GET'])
+def readiness():
+    """就绪检查：预热完成、迁移完整且数据库可访问（附一次查询往返耗时），否则 503。"""
+    checks = {"warmed_up": ready_event.is_set()}
+    try:
+        t0 = time.perf_counter()
+        db.conn.execute("SELECT COUNT(*) FROM change_counters").fetchone()
+        checks["db_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+        checks["db"] = True
+    except sqlite3.Error as e:
+        checks["db"] = False
+        checks["db_error"] = str(e)
+    ok = checks["warmed_up"] and checks["db"]
+    data = dict(checks, warmup=_warmup, replica_ready=replica.ready if replica is not None else None)
+    return jsonify({"success": ok, "data": data}), (200 if ok else 503)
+
+# ---------- Admin ----------
+_last_request = [time.monotonic()]
+
+@app.before_request
+def _track_activity():
+    # 维护任务据此判断是否空闲
+    _last_request[0] = time.monotonic()
+    g.started = time.perf_counter()
+    if MULTI_PROCESS:
+        change_tracker.poll(db.conn)
+
+@app.after_request
+def _log_access(response):
+    # 只是放进队列，写文件在日志线程；压缩在这之后执行，bytes 为压缩前的大小
+    structured_log.log_access(
+        method=request.method, path=request.path, endpoint=request.endpoint, status=response.status_code,
+        ms=round((time.perf_counter() - g.started) * 1000, 2) if 'started' in g else None,
+        ip=request.remote_addr, bytes=response.content_length,
+        order_number=g.get('order_number') or (request.view_args or {}).get('order_number'))
+    return response
+
+def _idle_seconds():
+    # 多进程模式下请求都在工作进程里，主进程按最近是否有写入判断
+    if MULTI_PROCESS and change_tracker.poll(db.conn):
+        _last_request[0] = time.monotonic()
+    return time.monotonic() - _last_request[0]
+
+maintenance = MaintenanceScheduler(
+    [("chess", DB_PATH), ("archive", ARCHIVE_PATH)],
+    MAINTENANCE_CONFIG,
+    idle_seconds_fn=_idle_seconds,
+)
+
+@app.route('/api/admin/maintenance', methods=['POST'])
+def trigger_maintenance():
+    data = request.get_json(silent=True) or {}
+    try:
+        result = maintenance.run_job(data.get('job', ''))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except Exception as e:
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+    if result is None:
+        return jsonify({"success": False, "error": "维护任务进行中"}), 409
+    return jsonify({"success": all(r["ok"] for r in result), "data": result})
+
+@app.route('/api/admin/maintenance', methods=['GET'])
+def maintenance_status():
+    return jsonify({"success": True, "data": maintenance.status()})
+
+@app.route('/api/admin/backup', methods=['POST'])
+def trigger_backup():
+    try:
+        result = backups.run()
+    except Exception as e:
+        logging.exception(e)
+        return jsonify({"success": False, "error": str(e)}), 500
+    if result is None:
+        return jsonify({"success": False, "error": "备份进行中"}), 409
+    return jsonify({"success": result["success"], "data": result}), (200 if result["success"] else 500)
+
+@app.route('/api/admin/backup', methods=['GET'])
+def backup_status():
+    return jsonify({"success": True, "data": {
+        "running": backups.running(),
+        "history": list(backups.history),
+        "snapshots": backups.snapshots(),
+    }})
+
+# ---------- Shutdown ----------
+archive_stop = threading.Event()
+fts_stop = threading.Event()
+
+def _checkpoint_wal():
+    """最后把 WAL 合并回数据库并截断，下次启动不用做恢复。返回各库的 (busy, log, checkpointed)。"""
+    result = {}
+    for name, path in (("chess", DB_PATH), ("archive", ARCHIVE_PATH)):
+        if not path or not os.path.exists(path):
+            continue
+        conn = sqlite3.connect(path, timeout=5)
+        try:
+            result[name] = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.close()
+    return result
+
+def create_shutdown(archive_thread=None, fts_thread=None):
+    """停机清理顺序：后台任务 → 数据库连接 → WAL checkpoint → 日志（最后停，前面步骤的日志也能写进去）。"""
+    timeout = float(SERVER_CONFIG.get('drain_timeout', 10))
+    shutdown = GracefulShutdown(request_drain, timeout)
+
+    def stopper(event, thread):
+        def stop():
+            event.set()
+            if thread is None:
+                return True
+            thread.join(timeout)
+            return not thread.is_alive()
+        return stop
+
+    shutdown.add_step("maintenance", lambda: maintenance.stop(timeout))
+    shutdown.add_step("backup", lambda: backups.stop(timeout))
+    shutdown.add_step("archive", stopper(archive_stop, archive_thread))
+    shutdown.add_step("fulltext", stopper(fts_stop, fts_thread))
+    if replica is not None:
+        shutdown.add_step("replica", replica.close)
+    shutdown.add_step("db", db.close_all)
+    shutdown.add_step("checkpoint", _checkpoint_wal)
+    shutdown.add_step("log", structured_log.stop)
+    return shutdown
+
+# ---------- Debug ----------
+LOCAL_ADDRS = ('127.0.0.1', '::1', 'localhost')
+
+def debug_endpoint(flag):
+    """诊断接口：DEBUG_CONFIG[flag] 未开启时 404，非本机访问 403。"""
+    def decorator(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not DEBUG_CONFIG.get(flag):
+                return jsonify({"success": False, "error": "未开启"}), 404
+            if request.remote_addr not in LOCAL_ADDRS:
+                return jsonify({"success": False, "error": "仅允许本机访问"}), 403
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+_profile_lock = threading.Lock()
+
+@app.route('/api/debug/profile', methods=['GET'])
+@no_compress    # 只在本机访问，火焰图文本不用压缩
+@debug_endpoint('profile_enabled')
+def debug_profile():
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval = float(request.args.get('interval_ms', DEBUG_CONFIG.get('profile_interval_ms', 5))) / 1000.0
+        top_n = int(request.args.get('top', 30))
+    except ValueError:
+        return jsonify({"success": False, "error": "参数错误"}), 400
+    seconds = min(max(seconds, 0.1), float(DEBUG_CONFIG.get('max_profile_seconds', 60)))
+    interval = max(interval, 0.001)
+    if not _profile_lock.acquire(blocking=False):
+        return jsonify({"success": False, "error": "已有采样在进行"}), 409
+    try:
+        prof = SamplingProfiler(interval=interval, include_idle=request.args.get('idle') in ('1', 'true'))
+        prof.run(seconds)
+    finally:
+        _profile_lock.release()
+    if request.args.get('format') == 'collapsed':
+        return app.response_class(prof.collapsed() + "\n", mimetype='text/plain')
+    data = prof.summary(top_n)
+    data['collapsed'] = prof.collapsed()
+    return jsonify({"success": True, "data": data})
+
+@app.route('/api/debug/slow-queries', methods=['GET'])
+@debug_endpoint('slow_queries_enabled')
+def debug_slow_queries():
+    if query_log is None:
+        return jsonify({"success": False, "error": "慢查询日志未开启"}), 404
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({"success": False, "error": "参数错误"}), 400
+    return jsonify({"success": True, "data": query_log.snapshot(limit)})
+
+memory_tracer = MemoryTracer()
+
+@app.route('/api/debug/cache', methods=['GET'])
+@debug_endpoint('cache_stats_enabled')
+def debug_cache():
+    return jsonify({"success": True, "data": response_cache.stats()})
+
+@app.route('/api/debug/single-flight', methods=['GET'])
+@debug_endpoint('cache_stats_enabled')
+def debug_single_flight():
+    if single_flight is None:
+        return jsonify({"success": False, "error": "请求合并未开启"}), 404
+    return jsonify({"success": True, "data": single_flight.stats()})
+
+@app.route('/api/debug/coherence', methods=['GET'])
+@debug_endpoint('cache_stats_enabled')
+def debug_coherence():
+    return jsonify({"success": True, "data": dict(change_tracker.stats(), pid=os.getpid(), workers=WORKERS)})
+
+@app.route('/api/debug/replica', methods=['GET'])
+@debug_endpoint('cache_stats_enabled')
+def debug_replica():
+    if replica is None:
+        return jsonify({"success": False, "error": "只读副本未开启"}), 404
+    return jsonify({"success": True, "data": replica.stats()})
+
+@app.route('/api/debug/traces', methods=['GET'])
+@debug_endpoint('traces_enabled')
+def debug_traces():
+    """最近保留下来的 trace 中最慢的若干条（?limit=）；?trace_id= 查看单条的 span 明细。"""
+    if request.args.get('trace_id'):
+        trace = tracer.find(request.args['trace_id'].lower())
+        if trace is None:
+            return jsonify({"success": False, "error": "trace 不存在或已被挤出缓冲区"}), 404
+        return jsonify({"success": True, "data": trace.tree()})
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({"success": False, "error": "参数错误"}), 400
+    return jsonify({"success": True, "data": dict(tracer.stats(), slowest=tracer.slowest(limit))})
+
+@app.route('/api/debug/memory', methods=['GET'])
+@debug_endpoint('memory_enabled')
+def debug_memory():
+    """?probe=/api/orders 测量一次 GET 请求的峰值内存；否则返回占用排行（有基线时带差异）。"""
+    try:
+        top_n = int(request.args.get('top', 20))
+    except ValueError:
+        return jsonify({"success": False, "error": "参数错误"}), 400
+    group = request.args.get('group', 'lineno')
+    if group not in ('lineno', 'filename', 'traceback'):
+        return jsonify({"success": False, "error": "group 只能是 lineno/filename/traceback"}), 400
+    probe = request.args.get('probe')
+    if probe:
+        if not probe.startswith('/api/') or probe.startswith('/api/debug/'):
+            return jsonify({"success": False, "error": "probe 只能是业务接口路径"}), 400
+        started = not memory_tracer.tracing
+        memory_tracer.start(DEBUG_CONFIG.get('memory_trace_frames', 1))
+        try:
+            client = app.test_client()
+            resp, usage = memory_tracer.measure(lambda: client.get(probe))
+        finally:
+            if started:
+                memory_tracer.stop()
+        usage.update({"path": probe, "status": resp.status_code, "response_kb": round(len(resp.get_data()) / 1024, 1)})
+        return jsonify({"success": True, "data": usage})
+    if not memory_tracer.tracing:
+        return jsonify({"success": True, "data": memory_tracer.status()})
+    return jsonify({"success": True, "data": memory_tracer.report(top_n, group)})
+
+@app.route('/api/debug/memory', methods=['POST'])
+@debug_endpoint('memory_enabled')
+def debug_memory_control():
+    """action: start（开始跟踪）/ baseline（记录基线快照）/ stop。"""
+    data = request.get_json(silent=True) or {}
+    action = data.get('action')
+    if action == 'start':
+        memory_tracer.start(int(data.get('frames', DEBUG_CONFIG.get('memory_trace_frames', 1))))
+    elif action == 'baseline':
+        if not memory_tracer.tracing:
+            return jsonify({"success": False, "error": "未开始跟踪"}), 400
+        memory_tracer.set_baseline()
+    elif action == 'stop':
+        memory_tracer.stop()
+    else:
+        return jsonify({"success": False, "error": "action 只能是 start/baseline/stop"}), 400
+    return jsonify({"success": True, "data": memory_tracer.status()})
+
 # SPA static
 @app.route('/')
 def index():
@@ -425,27 +1421,18 @@ def spa_fallback(p):
     except Exception:
         return send_from_directory(app.static_folder, 'index.html')
 
-def open_browser(timeout=10, interval=0.3):
-    import socket
-    """等待服务器就绪后打开默认浏览器（处理 0.0.0.0、Windows os.startfile 备选）。"""
+def open_browser(ready, timeout=30):
+    """服务就绪（预热完成）后打开默认浏览器（处理 0.0.0.0、Windows os.startfile 备选）。
+
+    ready 为 threading.Event 或多进程的 Event，由预热线程置位，不再轮询端口。
+    """
+    if not ready.wait(timeout):
+        logging.warning("等待服务就绪超时（%s 秒），仍然打开浏览器", timeout)
     host = SERVER_CONFIG.get('host', '127.0.0.1')
     port = SERVER_CONFIG.get('port', 5003)
     # if host == '0.0.0.0':
     #     host = '127.0.0.1'
     url = f"http://{host}:{port}/"
-    deadline = time.time() + timeout
-    while time.time() < deadline:
-        try:
-            with socket.create_connection((host, port), timeout=1):
-                try:
-                    webbrowser.open_new_tab(url)
-                except Exception:
-                    if sys.platform.startswith('win'):
-                        try: os.startfile(url)
-                        except Exception: pass
-                return
-        except OSError:
-            time.sleep(interval)
     try:
         webbrowser.open_new_tab(url)
     except Exception:
@@ -453,17 +1440,76 @@ def open_browser(timeout=10, interval=0.3):
             try: os.startfile(url)
             except Exception: pass
 
+def serve_worker(sock, threads, ready=None):
+    """多进程模式的工作进程入口：子进程重新导入本模块，数据库连接、缓存和索引都是进程自己的。
+
+    ready：主进程的 Event，本进程预热完成后置位（任一工作进程就绪即可打开浏览器）。
+    """
+    from waitress import create_server
+    if replica is not None:
+        replica.start()
+    server = create_server(app, sockets=[sock], threads=threads)
+    shutdown = create_shutdown()
+    # 主进程停止时发 SIGTERM，Ctrl+C 时整个进程组都会收到 SIGINT，两种都先处理完进行中的请求
+    shutdown.install(waitress_flush(server))
+    start_warm_up(ready.set if ready is not None else None)
+    shutdown.run(server.run)
+
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if ARCHIVE_PATH:
+        def on_archived():
+            response_cache.bump('orders', 'order_products')
+            if replica is not None:
+                # 副本挂的是实时归档库，刚搬走的订单在旧副本的主库里还有，立即刷新避免重复统计
+                replica.refresh(force=True)
+        archive_thread = archive.start_archive_thread(db, ARCHIVE_CONFIG, on_change=on_archived, stop=archive_stop)
+    else:
+        archive_thread = None
+    fts_thread = fulltext.start_sync_thread(db, SEARCH_CONFIG.get('sync_interval_seconds', 2), fts_stop) if fulltext_enabled else None
+    if BACKUP_CONFIG.get("enabled"):
+        backups.start_scheduler(BACKUP_CONFIG.get("interval_hours", 6))
+    if MAINTENANCE_CONFIG.get("enabled"):
+        maintenance.start()
+    if replica is not None and not MULTI_PROCESS:
+        replica.start()
+
+    # 单进程由本进程的预热线程置位；多进程由工作进程置位
+    ready_signal = multiprocessing.get_context("spawn").Event() if MULTI_PROCESS else ready_event
     if SERVER_CONFIG.get('open_browser', True):
-        threading.Thread(target=open_browser, daemon=True).start()
+        threading.Thread(target=open_browser, args=(ready_signal, SERVER_CONFIG.get('ready_timeout', 30)), daemon=True).start()
 
-    if SERVER_CONFIG.get('use_waitress', True):
+    if MULTI_PROCESS:
+        # 后台任务（归档、备份、维护）只在主进程里跑，请求由工作进程处理
+        if ORDER_NUMBER_CONFIG.get('generator', 'daily') != 'daily':
+            logging.warning("多进程模式请使用 daily 订单号生成器，其它生成器只保证单进程内不重号")
+        sock = create_listener(SERVER_CONFIG.get('host', '127.0.0.1'), SERVER_CONFIG.get('port', 5003))
+        logging.info("多进程模式启动：%d 个工作进程", WORKERS)
+        shutdown = create_shutdown(archive_thread, fts_thread)
+        shutdown.install()
+        # 工作进程自己排空请求，主进程多等几秒再强制结束
+        supervisor = Supervisor(serve_worker, sock, WORKERS, args=(SERVER_CONFIG.get('threads', 4), ready_signal),
+                                stop_timeout=shutdown.drain_timeout + 5)
+        shutdown.run(supervisor.run)
+    elif SERVER_CONFIG.get('use_waitress', True):
+        shutdown = create_shutdown(archive_thread, fts_thread)
         try:
-            from waitress import serve
+            from waitress import create_server
             logging.info("使用 Waitress 启动")
-            serve(app, host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003))
+            # create_server 时已开始监听，预热期间的请求排队或由 /api/ready 报告未就绪
+            server = create_server(app, host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003), threads=SERVER_CONFIG.get('threads', 4))
         except Exception as e:
             logging.error("Waitress 启动失败，退回 Flask dev server: %s", e)
-            app.run(host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003), debug=SERVER_CONFIG.get('debug', False))
+            shutdown.install()
+            start_warm_up()
+            shutdown.run(lambda: app.run(host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003), debug=SERVER_CONFIG.get('debug', False)))
+        else:
+            shutdown.install(waitress_flush(server))
+            start_warm_up()
+            server.print_listen("Serving on http://{}:{}")
+            shutdown.run(server.run)
     else:
-        app.run(host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003), debug=SERVER_CONFIG.get('debug', False))
\ No newline at end of file
+        shutdown = create_shutdown(archive_thread, fts_thread)
+        shutdown.install()
+        start_warm_up()
+        shutdown.run(lambda: app.run(host=SERVER_CONFIG.get('host','127.0.0.1'), port=SERVER_CONFIG.get('port',5003), debug=SERVER_CONFIG.get('debug', False)))
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""并发压力测试的公共夹具。
+
+整个测试会话在临时目录里新建一个数据库，导入 testapp 前先改好 config，不会碰到 data/chess.db。
+同一组用例分别经 Flask 测试客户端（进程内，不走网络）和真实的 Waitress 服务器（HTTP keep-alive）执行。
+
+规模和随机种子可以用环境变量调整，同一个种子的操作序列相同：
+    STRESS_THREADS（默认 8）、STRESS_ROUNDS（默认 20）、STRESS_SEED（默认 20240601）
+STRESS_RESULTS 指向一个文件时，吞吐量以 JSON Lines 追加到该文件，便于前后对比。
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import threading
+import http.client
+import concurrent.futures
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+THREADS = int(os.environ.get("STRESS_THREADS", 8))
+ROUNDS = int(os.environ.get("STRESS_ROUNDS", 20))
+SEED = int(os.environ.get("STRESS_SEED", 20240601))
+
+_throughput = []
+
+
+@pytest.fixture(scope="session")
+def testapp(tmp_path_factory):
+    """指向临时数据库的 testapp 模块（整个会话共用，各用例自己建房间和商品，互不影响）。"""
+    data_dir = tmp_path_factory.mktemp("data")
+    import config
+    config.DB_CONFIG["filename"] = str(data_dir / "chess.db")
+    config.LOG_CONFIG["dir"] = str(data_dir / "logs")
+    config.BACKUP_CONFIG["dir"] = str(data_dir / "backups")
+    config.SERVER_CONFIG["workers"] = 1
+    import testapp
+    assert testapp.DB_PATH == config.DB_CONFIG["filename"]
+    yield testapp
+    testapp.structured_log.stop()
+    testapp.db.close_all()
+
+
+@pytest.fixture(scope="session")
+def run_threads():
+    """run_threads(n, target)：n 个线程同时开始执行 target(i)，返回各线程的返回值，任一线程的异常会重新抛出。
+
+    线程来自整个会话共用的线程池（和 Waitress 一样固定数量）：testapp 每个线程一个数据库连接，
+    固定的线程一直用自己的连接，和生产环境一致。
+    """
+    pool = concurrent.futures.ThreadPoolExecutor(THREADS, thread_name_prefix="stress")
+
+    def run(n, target):
+        assert n <= THREADS
+        barrier = threading.Barrier(n)
+
+        def start(i):
+            barrier.wait(60)
+            return target(i)
+
+        futures = [pool.submit(start, i) for i in range(n)]
+        return [f.result(timeout=120) for f in futures]
+
+    yield run
+    pool.shutdown()
+
+
+@pytest.fixture(scope="session")
+def waitress_server(testapp):
+    """在后台线程运行的 Waitress（随机端口），返回 (host, port)。"""
+    from waitress import create_server
+    from waitress import wasyncore
+    server = create_server(testapp.app, host="127.0.0.1", port=0, threads=THREADS)
+    thread = threading.Thread(target=server.run, name="waitress", daemon=True)
+    thread.start()
+    yield server.effective_host, server.effective_port
+    # 在服务器的主循环线程里关闭所有连接，主循环随之退出
+    server.trigger.pull_trigger(lambda: wasyncore.close_all(server._map))
+    thread.join(5)
+    server.task_dispatcher.shutdown()
+
+
+class FlaskTransport:
+    """每个线程一个测试客户端。"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        resp = client.open(path, method=method, json=body)
+        return resp.status_code, resp.get_json(silent=True)
+
+
+class WaitressTransport:
+    """每个线程一个 keep-alive 连接。"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._local = threading.local()
+
+    def request(self, method, path, body=None):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        payload = json.dumps(body) if body is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read()
+        except (ConnectionError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        return resp.status, json.loads(data) if data else None
+
+
+@pytest.fixture(params=["flask", "waitress"])
+def api(request, testapp):
+    if request.param == "flask":
+        return FlaskTransport(testapp.app)
+    return WaitressTransport(*request.getfixturevalue("waitress_server"))
+
+
+@pytest.fixture
+def db_reader(testapp):
+    """直接读数据库的连接（不经过接口和响应缓存），用来检查不变量。"""
+    conn = sqlite3.connect(testapp.DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def throughput(request):
+    """record(ops, seconds)：记录一个用例的吞吐量（进 junit 报告、测试结束的汇总和 STRESS_RESULTS）。"""
+    def record(ops, seconds):
+        entry = {"test": request.node.nodeid, "threads": THREADS, "rounds": ROUNDS, "seed": SEED,
+                 "ops": ops, "seconds": round(seconds, 3), "ops_per_sec": round(ops / seconds, 1) if seconds else None,
+                 "ts": time.strftime("%Y-%m-%dT%H:%M:%S")}
+        request.node.user_properties.append(("ops_per_sec", entry["ops_per_sec"]))
+        _throughput.append(entry)
+        path = os.environ.get("STRESS_RESULTS")
+        if path:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return entry
+    return record
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _throughput:
+        return
+    terminalreporter.section("吞吐量")
+    for e in _throughput:
+        terminalreporter.write_line(f"{e['ops_per_sec']:>9} ops/s  {e['ops']:>6} ops  {e['seconds']:>7.2f}s  {e['test']}")
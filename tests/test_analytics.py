@@ -0,0 +1,42 @@
+"""入座率分析的按天缓存：还挂着跨夜未结订单的日期不能缓存。"""
+import datetime
+import sqlite3
+
+import pytest
+
+np = pytest.importorskip("numpy")
+import analytics
+
+
+def _db():
+    conn = sqlite3.connect(":memory:")
+    conn.executescript("""
+        CREATE TABLE rooms (id INTEGER PRIMARY KEY);
+        CREATE TABLE orders (id INTEGER PRIMARY KEY, room_id INTEGER, start_ts INTEGER, end_ts INTEGER,
+                             end_time TEXT, payment_status TEXT);
+        CREATE VIEW all_orders AS SELECT * FROM orders;
+        INSERT INTO rooms (id) VALUES (1), (2);
+    """)
+    return conn
+
+
+def test_overnight_open_order_counted_after_close():
+    conn = _db()
+    yesterday = datetime.date(2026, 3, 10)
+    today = yesterday + datetime.timedelta(days=1)
+    start = analytics.to_epoch(datetime.datetime(2026, 3, 10, 22, 0))
+    now = datetime.datetime(2026, 3, 11, 10, 0)
+    conn.execute("INSERT INTO orders (room_id, start_ts, payment_status) VALUES (1, ?, 'unpaid')", (start,))
+    stats = analytics.OccupancyAnalytics()
+
+    before = stats.occupancy(conn.cursor(), yesterday, yesterday, "day", now=now)
+    assert before["overall"]["sessions"] == 0
+    assert stats.stats()["cached_days"] == 0
+
+    end = analytics.to_epoch(datetime.datetime(2026, 3, 11, 2, 0))
+    conn.execute("UPDATE orders SET end_ts = ?, end_time = '2026-03-11 02:00:00', payment_status = 'paid'", (end,))
+    after = stats.occupancy(conn.cursor(), yesterday, today, "day", now=now)
+    assert after["overall"]["sessions"] == 1
+    assert after["overall"]["avg_session_minutes"] == 240.0
+    # 结账后昨天的结果不会再变，可以缓存
+    assert stats.stats()["cached_days"] == 1
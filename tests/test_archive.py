@@ -0,0 +1,46 @@
+"""归档：先提交归档库、再删主库的两次提交之间，all_* 视图不会把同一订单算两次。"""
+import sqlite3
+
+import archive
+import init_db
+
+
+def _revenue(conn):
+    return conn.execute("""
+        SELECT COUNT(*), IFNULL(SUM(total_amount), 0),
+               (SELECT COUNT(*) FROM all_order_products) FROM all_orders
+    """).fetchone()
+
+
+def test_views_do_not_double_count_between_copy_and_delete(tmp_path):
+    path = str(tmp_path / "chess.db")
+    init_db.ensure_initialized(path)
+    conn = sqlite3.connect(path)
+    archive.attach(conn, str(tmp_path / "archive.db"))
+    room_id = conn.execute("INSERT INTO rooms (name, room_type, price_per_hour) VALUES ('归档测试', '小包', 20)").lastrowid
+    product_id = conn.execute("INSERT INTO products (name, price, stock) VALUES ('归档测试茶', 10, 100)").lastrowid
+    for i, amount in ((1, 50.0), (2, 70.0)):
+        conn.execute("INSERT INTO orders (id, order_number, room_id, start_time, end_time, total_amount, payment_status) "
+                     "VALUES (?, ?, ?, '2020-01-01 10:00:00', '2020-01-01 12:00:00', ?, 'paid')", (i, f"T{i}", room_id, amount))
+        conn.execute("INSERT INTO order_products (order_id, product_id, quantity, unit_price, total_price) "
+                     "VALUES (?, ?, 1, 10, 10)", (i, product_id))
+    conn.commit()
+    assert _revenue(conn) == (2, 120.0, 2)
+
+    # 归档库已提交、主库还没删（archive_paid_orders 两次提交之间，或者中途崩溃）
+    cols = archive.table_columns(conn, "main", "orders")
+    conn.execute(f"INSERT INTO archive.orders ({', '.join(cols)}) SELECT {', '.join(cols)} FROM main.orders WHERE id = 1")
+    cols = archive.table_columns(conn, "main", "order_products")
+    conn.execute(f"INSERT INTO archive.order_products ({', '.join(cols)}) "
+                 f"SELECT {', '.join(cols)} FROM main.order_products WHERE order_id = 1")
+    conn.commit()
+    reader = sqlite3.connect(path)
+    archive.attach(reader, str(tmp_path / "archive.db"))
+    assert _revenue(reader) == (2, 120.0, 2)
+
+    result = archive.archive_paid_orders(conn, 30, sleep=0, log=lambda m: None)
+    assert result["orders"] == 2
+    assert conn.execute("SELECT COUNT(*) FROM main.orders").fetchone()[0] == 0
+    assert _revenue(reader) == (2, 120.0, 2)
+    reader.close()
+    conn.close()
@@ -0,0 +1,23 @@
+"""在线备份：分批拷贝时批次之间按 step_sleep 让出。"""
+import sqlite3
+
+from backup import BackupManager
+
+
+def test_backup_sleeps_between_steps(tmp_path):
+    path = tmp_path / "chess.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [("x" * 500,)] * 400)
+    conn.commit()
+    conn.close()
+
+    step_sleep = 0.02
+    manager = BackupManager([("chess", str(path))], str(tmp_path / "backups"), pages_per_step=5,
+                            step_sleep=step_sleep, measure_stall=False)
+    result = manager.run()
+
+    info = result["files"][0]
+    assert result["success"] and info["integrity"] == "ok"
+    assert info["steps"] > 5
+    assert info["copy_seconds"] >= (info["steps"] - 1) * step_sleep
@@ -0,0 +1,59 @@
+"""合并并发请求（coalesced）：写入提交之后到达的请求不能共享提交前开始的查询结果。"""
+import threading
+import datetime
+
+from test_order_concurrency import create_room, open_room
+from conftest import FlaskTransport
+
+
+def test_request_after_commit_not_coalesced_with_earlier_query(testapp, monkeypatch):
+    api = FlaskTransport(testapp.app)
+    room_id = create_room(api)
+    status, order_number = open_room(api, room_id)
+    assert status == 200
+    date = datetime.date.today().strftime("%Y-%m-%d")
+    path = f"/api/report/daily?date={date}"
+    before = api.request("GET", path)[1]["data"]["order_count"]
+
+    # 第一个请求查完库后停住，模拟查询还没返回时有结账提交
+    queried, release = threading.Event(), threading.Event()
+    run_view = testapp._run_view
+
+    def slow_run_view(f, args, kwargs):
+        result = run_view(f, args, kwargs)
+        if not queried.is_set():
+            queried.set()
+            release.wait(10)
+        return result
+
+    monkeypatch.setattr(testapp, "_run_view", slow_run_view)
+    first = {}
+
+    def leader():
+        with testapp.app.test_client() as client:
+            first["resp"] = client.get(path)
+
+    t = threading.Thread(target=leader)
+    t.start()
+    try:
+        assert queried.wait(10)
+        status, body = api.request("POST", f"/api/orders/{order_number}/close")
+        assert status == 200, body
+        follower = {}
+
+        def after_commit():
+            with testapp.app.test_client() as client:
+                follower["resp"] = client.get(path)
+
+        t2 = threading.Thread(target=after_commit)
+        t2.start()
+        t2.join(5)
+        # 提交之后到达的请求自己查库，不等也不共享提交前的查询
+        assert "resp" in follower
+    finally:
+        release.set()
+        t.join(10)
+    resp = follower["resp"]
+    assert "X-Coalesced" not in resp.headers
+    assert resp.get_json()["data"]["order_count"] == before + 1
+    assert first["resp"].get_json()["data"]["order_count"] == before
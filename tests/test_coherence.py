@@ -0,0 +1,67 @@
+"""多进程缓存一致性：同进程其它线程的提交不算外部改动，其它进程的提交照常触发回调。"""
+import sqlite3
+
+import coherence
+from coherence import ChangeTracker
+
+
+def _connect(path):
+    conn = sqlite3.connect(str(path), timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+
+def _local_write(tracker, conn, sql, params=()):
+    # 与 lock_for_write() + db.commit() 相同的顺序
+    conn.execute("BEGIN IMMEDIATE")
+    tracker.begin_write(conn)
+    conn.execute(sql, params)
+    tracker.commit(conn, conn.commit)
+
+
+def test_sibling_commits_do_not_fire_reload(tmp_path):
+    path = tmp_path / "coherence.db"
+    setup = _connect(path)
+    for table in coherence.TRACKED_TABLES:
+        setup.execute(f"CREATE TABLE {table} (id INTEGER PRIMARY KEY, name TEXT)")
+    coherence.install(setup)
+    setup.close()
+
+    tracker = ChangeTracker()
+    fired = []
+    tracker.on_change(("customers",), lambda tables: fired.append(sorted(tables)))
+    # 同一进程两个线程的连接，外加一个代表其它进程的连接
+    a, b, other = _connect(path), _connect(path), _connect(path)
+    tracker.poll(a)
+    tracker.poll(b)
+
+    _local_write(tracker, b, "INSERT INTO customers (name) VALUES ('本进程')")
+    _local_write(tracker, a, "UPDATE customers SET name = '本进程改名'")
+    assert tracker.poll(a) == set() and tracker.poll(b) == set()
+    assert fired == []
+
+    other.execute("INSERT INTO customers (name) VALUES ('其它进程')")
+    other.commit()
+    assert tracker.poll(a) == {"customers"}
+    assert tracker.poll(b) == set()
+    assert fired == [["customers"]]
+
+    # 其它进程先提交、本进程紧接着写：外部改动在拿写锁时处理，本进程的写入不再回调
+    other.execute("UPDATE customers SET name = '其它进程改名'")
+    other.commit()
+    _local_write(tracker, b, "INSERT INTO customers (name) VALUES ('本进程 2')")
+    assert fired == [["customers"], ["customers"]]
+    assert tracker.poll(a) == set()
+    assert fired == [["customers"], ["customers"]]
+
+    # 回滚的写入不记账
+    b.execute("BEGIN IMMEDIATE")
+    tracker.begin_write(b)
+    b.execute("INSERT INTO customers (name) VALUES ('回滚')")
+    b.rollback()
+    tracker.discard()
+    other.execute("INSERT INTO customers (name) VALUES ('其它进程 2')")
+    other.commit()
+    assert tracker.poll(a) == {"customers"}
+    for conn in (a, b, other):
+        conn.close()
@@ -0,0 +1,160 @@
+"""响应压缩：按 Accept-Encoding 协商编码，小响应、流式响应、标了 no_compress 的接口分别处理。"""
+import gzip
+import json
+import zlib
+
+import pytest
+from flask import Flask, Response
+
+import compression
+from compression import Compress, parse_accept_encoding
+from test_order_concurrency import create_room
+from conftest import FlaskTransport
+
+BIG = "x" * 2000
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    Compress(app, {"min_size": 1024})
+
+    @app.route("/big")
+    def big():
+        return {"data": BIG}
+
+    @app.route("/small")
+    def small():
+        return {"data": "x"}
+
+    @app.route("/stream")
+    def stream():
+        def parts():
+            yield "part1-"
+            yield b"part2-"
+            yield "part3"
+        # 未压缩长度，压缩后必须去掉
+        return Response(parts(), mimetype="text/plain", headers={"Content-Length": "17"})
+
+    return app.test_client()
+
+
+def test_parse_accept_encoding_q_values():
+    assert parse_accept_encoding("gzip;q=0.5, br, identity;q=0, *;q=bad") == {
+        "gzip": 0.5, "br": 1.0, "identity": 0.0, "*": 0.0}
+    assert parse_accept_encoding(None) == {}
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", "gzip"),
+    ("GZIP;q=0.3", "gzip"),
+    ("gzip;q=0", None),
+    ("identity", None),
+    ("*", "gzip"),
+    ("*;q=0.5, gzip;q=0", None),
+    ("", None),
+])
+def test_choose_encoding_gzip_only(monkeypatch, header, expected):
+    monkeypatch.setattr(compression, "brotli", None)
+    assert Compress().choose_encoding(header) == expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, br", "br"),
+    ("br;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0.1", "gzip"),
+    ("*", "br"),
+])
+def test_choose_encoding_prefers_br_when_available(monkeypatch, header, expected):
+    # choose_encoding 只看 brotli 模块是否可用，这里不需要真的装上
+    monkeypatch.setattr(compression, "brotli", object())
+    assert Compress().choose_encoding(header) == expected
+
+
+def test_br_falls_back_to_gzip_without_brotli(monkeypatch, client):
+    monkeypatch.setattr(compression, "brotli", None)
+    resp = client.get("/big", headers={"Accept-Encoding": "br, gzip;q=0.5"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert json.loads(gzip.decompress(resp.get_data())) == {"data": BIG}
+
+
+def test_br_response_decodes():
+    brotli = pytest.importorskip("brotli")
+    app = Flask(__name__)
+    Compress(app)
+
+    @app.route("/big")
+    def big():
+        return {"data": BIG}
+
+    resp = app.test_client().get("/big", headers={"Accept-Encoding": "br"})
+    assert resp.headers["Content-Encoding"] == "br"
+    assert json.loads(brotli.decompress(resp.get_data())) == {"data": BIG}
+
+
+def test_identity_and_missing_header_not_compressed(client):
+    for headers in ({}, {"Accept-Encoding": "identity"}, {"Accept-Encoding": "gzip;q=0"}):
+        resp = client.get("/big", headers=headers)
+        assert "Content-Encoding" not in resp.headers
+        assert resp.get_json() == {"data": BIG}
+
+
+def test_min_size_threshold(client):
+    headers = {"Accept-Encoding": "gzip"}
+    small = client.get("/small", headers=headers)
+    assert "Content-Encoding" not in small.headers
+    assert small.get_json() == {"data": "x"}
+
+    big = client.get("/big", headers=headers)
+    assert big.headers["Content-Encoding"] == "gzip"
+    assert int(big.headers["Content-Length"]) == len(big.get_data()) < 1024
+
+
+def test_vary_only_on_compressed_responses(client):
+    resp = client.get("/big", headers={"Accept-Encoding": "gzip"})
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    # 小于 min_size 的响应不压缩，内容与编码无关，不加 Vary
+    assert "Vary" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+
+
+def test_streamed_response_compressed_chunk_by_chunk(client):
+    resp = client.get("/stream", headers={"Accept-Encoding": "gzip"}, buffered=False)
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in resp.headers
+    assert "Accept-Encoding" in resp.headers["Vary"]
+    # 每个块单独 flush：收到第一块就能解出对应内容，不用等整个响应
+    d = zlib.decompressobj(31)
+    chunks = iter(resp.response)
+    assert d.decompress(next(chunks)) == b"part1-"
+    assert d.decompress(next(chunks)) == b"part2-"
+    rest = b"".join(d.decompress(c) for c in chunks)
+    assert rest == b"part3"
+    assert d.eof
+    resp.close()
+
+
+def test_streamed_response_without_gzip_untouched(client):
+    resp = client.get("/stream", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_data() == b"part1-part2-part3"
+
+
+def test_batch_and_profile_not_compressed(testapp):
+    api = FlaskTransport(testapp.app)
+    for _ in range(20):
+        create_room(api)
+    client = testapp.app.test_client()
+    headers = {"Accept-Encoding": "gzip"}
+
+    single = client.get("/api/rooms", headers=headers)
+    assert single.headers.get("Content-Encoding") == "gzip"
+    rooms = json.loads(gzip.decompress(single.get_data()))
+
+    resp = client.post("/api/batch", headers=headers,
+                       json={"requests": [{"method": "GET", "path": "/api/rooms"}] * 5})
+    assert resp.status_code == 200
+    assert "Content-Encoding" not in resp.headers
+    assert len(resp.get_data()) > len(single.get_data())
+    assert [r["body"] for r in resp.get_json()["results"]] == [rooms] * 5
+
+    assert testapp.app.view_functions["debug_profile"]._no_compress
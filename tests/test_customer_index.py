@@ -0,0 +1,90 @@
+"""会员查找索引：拼音首字母 / 手机号尾号查找，并发修改同一会员后索引与数据库一致。"""
+import random
+import threading
+import time
+
+import customer_index
+from conftest import FlaskTransport
+from customer_index import CustomerIndex, pinyin_initials
+
+
+def test_pinyin_initials_builtin_table(monkeypatch):
+    # 不依赖 pypinyin：GB2312 区位码区间
+    monkeypatch.setattr(customer_index, "lazy_pinyin", None)
+    assert pinyin_initials("张三丰") == "zsf"
+    assert pinyin_initials("李四 A1") == "lsa1"
+    assert pinyin_initials("") == ""
+
+
+def test_search_by_initials_name_and_phone(monkeypatch):
+    monkeypatch.setattr(customer_index, "lazy_pinyin", None)
+    index = CustomerIndex()
+    index.load([
+        {"id": 1, "name": "张三丰", "phone": "138-0013-1234", "member_level": "普通会员"},
+        {"id": 2, "name": "张三", "phone": "13900005678", "member_level": "金卡"},
+        {"id": 3, "name": "王五", "phone": "13700001234", "member_level": "普通会员"},
+    ])
+    assert sorted(c["id"] for c in index.search("zs")) == [1, 2]
+    assert [c["id"] for c in index.search("ZSF")] == [1]
+    assert [c["id"] for c in index.search("张三丰")] == [1]
+    assert [c["id"] for c in index.search("wu")] == []
+    # 手机号前缀和尾号
+    assert [c["id"] for c in index.search("139")] == [2]
+    assert sorted(c["id"] for c in index.search("1234")) == [1, 3]
+    assert len(index.search("zs", limit=1)) == 1
+
+
+def test_refresh_applies_latest_row():
+    index = CustomerIndex()
+    rows = {1: {"id": 1, "name": "张三", "phone": "13800000000", "member_level": "普通会员"}}
+    index.load(rows.values())
+    reading = threading.Event()
+
+    def slow_fetch(customer_id):
+        # 第一次刷新读到旧行之后才提交新数据，第二次刷新要排在它后面
+        row = dict(rows[customer_id])
+        reading.set()
+        time.sleep(0.05)
+        return row
+
+    t = threading.Thread(target=index.refresh, args=(1, slow_fetch))
+    t.start()
+    reading.wait(5)
+    rows[1] = dict(rows[1], name="李四")
+    index.refresh(1, lambda cid: dict(rows[cid]))
+    t.join(5)
+    assert [c["name"] for c in index.search("ls")] == ["李四"]
+    assert index.search("zs") == []
+
+    rows.pop(1)
+    index.refresh(1, rows.get)
+    assert len(index) == 0 and index.search("138") == []
+
+
+def test_concurrent_updates_leave_index_in_sync(testapp, run_threads, db_reader, monkeypatch):
+    api = FlaskTransport(testapp.app)
+    phone = "155%08d" % random.randrange(10 ** 8)
+    status, body = api.request("POST", "/api/customers", {"name": "赵六", "phone": phone})
+    assert status == 200
+    customer_id = body["customer_id"]
+    assert [c["id"] for c in api.request("GET", "/api/customers/search?q=zl&limit=50", None)[1]["data"]
+            if c["phone"] == phone] == [customer_id]
+
+    # 拉大“提交”到“写进索引”之间的间隔，让各请求的索引更新乱序到达
+    upsert = testapp.customer_index.upsert
+
+    def slow_upsert(c):
+        time.sleep(random.random() * 0.03)
+        upsert(c)
+
+    monkeypatch.setattr(testapp.customer_index, "upsert", slow_upsert)
+
+    for round_ in range(10):
+        def worker(i):
+            status, _ = api.request("PUT", f"/api/customers/{customer_id}", {"name": f"会员{round_}-{i}"})
+            assert status == 200
+
+        run_threads(8, worker)
+        name = db_reader.execute("SELECT name FROM customers WHERE id = ?", (customer_id,)).fetchone()[0]
+        found = api.request("GET", f"/api/customers/search?q={phone}", None)[1]["data"]
+        assert [(c["id"], c["name"]) for c in found] == [(customer_id, name)]
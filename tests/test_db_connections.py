@@ -0,0 +1,41 @@
+"""每个请求一个新线程时（Flask 开发服务器），数据库连接复用，不会随请求数增加。"""
+import gc
+import threading
+
+
+def _in_new_thread(fn, n=1):
+    barrier = threading.Barrier(n)
+
+    def run():
+        barrier.wait(10)
+        fn()
+
+    threads = [threading.Thread(target=run) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    gc.collect()
+
+
+def test_connections_reused_across_short_lived_threads(testapp):
+    db = testapp.db
+    client = testapp.app.test_client()
+    _in_new_thread(lambda: client.get("/api/rooms"))
+    before = len(db._conns)
+    for _ in range(30):
+        _in_new_thread(lambda: client.get("/api/rooms"))
+    assert len(db._conns) == before
+
+    # 同时存在的线程多于 max_idle：结束后多出来的连接被关闭
+    _in_new_thread(lambda: client.get("/api/rooms"), n=db.max_idle + 4)
+    assert len(db._idle) <= db.max_idle
+    assert len(db._conns) <= before + db.max_idle
+
+    # 线程留下的未提交事务在复用前回滚
+    def leave_open_transaction():
+        db.conn.execute("UPDATE rooms SET name = name")
+        assert db.conn.in_transaction
+
+    _in_new_thread(leave_open_transaction)
+    assert not any(c.in_transaction for c in db._idle)
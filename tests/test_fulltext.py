@@ -0,0 +1,103 @@
+"""全文检索：索引由 Python 分词维护，其它程序直接写库不需要注册任何函数。"""
+import time
+import sqlite3
+import threading
+
+import pytest
+
+import archive
+import fulltext
+import init_db
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "chess.db")
+    init_db.ensure_initialized(path)
+    conn = sqlite3.connect(path)
+    archive.attach(conn, None)
+    if not fulltext.ensure_fts(conn):
+        pytest.skip("SQLite 未启用 FTS5")
+    conn.close()
+    return path
+
+
+def test_plain_connection_can_write(db_path):
+    # 没有注册任何函数的连接（sqlite3 命令行、数据库浏览器、脚本）
+    plain = sqlite3.connect(db_path)
+    plain.execute("INSERT INTO customers (name, phone) VALUES ('张三丰', '13912345678')")
+    plain.execute("UPDATE products SET name = '红牛加强' WHERE name = '红牛'")
+    plain.execute("INSERT INTO rooms (name, room_number, room_type, price_per_hour) VALUES ('观景大包', 'V10', '大包', 30)")
+    plain.commit()
+    plain.close()
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    archive.attach(conn, None)
+    assert fulltext.sync(conn) == 3
+    for q, kind in (("三丰", "customer"), ("1391234", "customer"), ("红牛加", "product"), ("观景", "room")):
+        hits, total = fulltext.search(conn.cursor(), q)
+        assert total == 1 and hits[0]["type"] == kind, q
+    assert conn.execute("SELECT COUNT(*) FROM fts_pending").fetchone()[0] == 0
+
+
+def test_legacy_udf_triggers_are_replaced(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("DROP TRIGGER customers_fts_ai")
+    conn.execute("""CREATE TRIGGER customers_fts_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customers_fts (rowid, name, phone) VALUES (NEW.id, fts_segment(NEW.name), NEW.phone);
+    END""")
+    conn.commit()
+    conn.close()
+
+    init_db.ensure_initialized(db_path)
+    plain = sqlite3.connect(db_path)
+    plain.execute("INSERT INTO customers (name, phone) VALUES ('李四', '13800000000')")
+    plain.commit()
+    assert plain.execute("SELECT COUNT(*) FROM sqlite_master WHERE sql LIKE '%fts_segment%'").fetchone()[0] == 0
+    plain.close()
+
+
+def _reader(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    archive.attach(conn, None)
+    return conn
+
+
+def test_snippet_escapes_html(db_path):
+    conn = _reader(db_path)
+    conn.execute("INSERT INTO customers (name, phone) VALUES ('<img src=x onerror=alert(1)>王五', '13700000000')")
+    conn.commit()
+    fulltext.sync(conn)
+    hits, total = fulltext.search(conn.cursor(), "王五")
+    assert total == 1
+    snippet = hits[0]["snippet"]
+    assert "<img" not in snippet and "&lt;img" in snippet
+    assert "<mark>王五</mark>" in snippet
+    conn.close()
+
+
+def test_sync_limit_leaves_backlog_for_background(db_path):
+    conn = _reader(db_path)
+    conn.executemany("INSERT INTO customers (name, phone) VALUES (?, ?)",
+                     [(f"会员{i}", f"1360000{i:04d}") for i in range(120)])
+    conn.commit()
+    assert fulltext.sync(conn, batch=50, limit=50) == 50
+    assert conn.execute("SELECT COUNT(*) FROM fts_pending").fetchone()[0] == 70
+
+    class Db:
+        def create_connection(self):
+            return _reader(db_path)
+
+    stop = threading.Event()
+    thread = fulltext.start_sync_thread(Db(), interval=0.01, stop=stop)
+    deadline = time.monotonic() + 10
+    while conn.execute("SELECT COUNT(*) FROM fts_pending").fetchone()[0] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    stop.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert conn.execute("SELECT COUNT(*) FROM fts_pending").fetchone()[0] == 0
+    assert fulltext.search(conn.cursor(), "会员")[1] == 120
+    conn.close()
@@ -0,0 +1,37 @@
+"""合成数据：默认不写营业库；同一房间的场次不重叠。"""
+import sqlite3
+
+import gen_workload
+from config import DB_CONFIG
+
+
+def count_overlaps(conn):
+    return conn.execute("""
+        SELECT COUNT(*) FROM orders a JOIN orders b
+          ON a.room_id = b.room_id AND a.id < b.id AND a.start_time < b.end_time AND b.start_time < a.end_time
+    """).fetchone()[0]
+
+
+def test_default_db_is_not_live_db(monkeypatch):
+    called = {}
+    monkeypatch.setattr(gen_workload, "generate", lambda db, *a, **kw: called.setdefault("db", db) and {})
+    gen_workload.main([])
+    assert called["db"] != DB_CONFIG["filename"]
+    assert called["db"].endswith("bench.db")
+
+
+def test_sessions_in_a_room_never_overlap(tmp_path):
+    path = str(tmp_path / "bench.db")
+    # 房间少、订单多：容量不够时放弃订单，而不是往同一间房里塞
+    result = gen_workload.generate(path, days=10, orders_per_day=120, rooms=4, products=5, customers=20,
+                                   seed=7, log=lambda m: None)
+    assert result["orders"] > 0 and result["skipped"] > 0
+    conn = sqlite3.connect(path)
+    assert count_overlaps(conn) == 0
+    assert conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0] == result["orders"]
+
+    # 追加生成时接着已有订单往后排
+    gen_workload.generate(path, days=10, orders_per_day=120, rooms=4, products=5, customers=20,
+                          seed=8, log=lambda m: None)
+    assert count_overlaps(conn) == 0
+    conn.close()
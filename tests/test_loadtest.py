@@ -0,0 +1,29 @@
+"""压测脚本不碰压测开始前已有的进行中订单（可能是真实顾客）。"""
+import pytest
+
+import loadtest
+from conftest import WaitressTransport
+from test_order_concurrency import create_room, open_room
+
+
+def test_load_refuses_or_leaves_existing_orders_alone(waitress_server, db_reader):
+    host, port = waitress_server
+    url = f"http://{host}:{port}"
+    api = WaitressTransport(host, port)
+    for _ in range(3):
+        create_room(api)
+    status, order_number = open_room(api, create_room(api))
+    assert status == 200
+    existing = {r[0] for r in db_reader.execute("SELECT order_number FROM orders WHERE payment_status = 'unpaid'")}
+    assert order_number in existing
+
+    with pytest.raises(RuntimeError):
+        loadtest.run_load(url, threads=2, duration=0.2)
+
+    result = loadtest.run_load(url, threads=2, duration=0.5, seed=1, mix="open=2,add=2,close=2",
+                               allow_active=True)
+    assert result["errors"] == 0
+    assert result["ops"]["close"]["count"] > 0
+    still_open = {r[0] for r in db_reader.execute("SELECT order_number FROM orders WHERE payment_status = 'unpaid'")}
+    # 已有订单一张都没被结掉，压测自己开的订单在收尾时全部结清
+    assert still_open == existing
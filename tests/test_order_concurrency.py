@@ -0,0 +1,271 @@
+"""订单生命周期（开房、点单、结账、删房）的并发压力测试。
+
+多个线程同时打同一批房间和订单，结束后直接查库检查不变量：
+- 一个房间最多一张未结订单，房间状态和未结订单一致（occupied 恰有一张，其它状态没有）；
+- 每张订单的 product_total 等于明细合计，明细金额等于单价 × 数量；
+- 没有丢失更新：成功的点单请求数 = 明细行数，成功的开房数 = 订单数。
+"""
+import random
+import threading
+import time
+import itertools
+
+import loadtest
+from conftest import THREADS, ROUNDS, SEED, WaitressTransport
+
+_names = itertools.count(1)
+
+
+def create_room(api, price_per_hour=30):
+    status, body = api.request("POST", "/api/rooms", {"name": f"压测-{next(_names)}", "price_per_hour": price_per_hour})
+    assert status == 200, body
+    return body["room_id"]
+
+
+def create_product(api, price):
+    status, body = api.request("POST", "/api/products", {"name": f"压测商品-{next(_names)}", "price": price, "stock": 1000})
+    assert status == 200, body
+    return body["product_id"]
+
+
+def open_room(api, room_id):
+    status, body = api.request("POST", f"/api/rooms/{room_id}/open", {})
+    return status, body.get("order_number") if status == 200 else None
+
+
+def check_invariants(conn):
+    violations = []
+    for r in conn.execute("""
+        SELECT room_id, COUNT(*) AS n FROM orders WHERE payment_status = 'unpaid' GROUP BY room_id HAVING n > 1
+    """):
+        violations.append(f"房间 {r['room_id']} 有 {r['n']} 张未结订单")
+    for r in conn.execute("""
+        SELECT r.id, r.status, EXISTS(SELECT 1 FROM orders o WHERE o.room_id = r.id AND o.payment_status = 'unpaid') AS busy
+        FROM rooms r
+        WHERE (r.status = 'occupied') != busy
+    """):
+        violations.append(f"房间 {r['id']} 状态 {r['status']}，未结订单 {'有' if r['busy'] else '无'}")
+    for r in conn.execute("""
+        SELECT o.order_number FROM orders o
+        WHERE o.payment_status = 'unpaid' AND NOT EXISTS(SELECT 1 FROM rooms r WHERE r.id = o.room_id)
+    """):
+        violations.append(f"订单 {r['order_number']} 的房间已被删除")
+    for r in conn.execute("""
+        SELECT o.order_number, o.product_total, o.product_cents,
+               (SELECT IFNULL(SUM(op.total_cents), 0) FROM order_products op WHERE op.order_id = o.id) AS lines_cents
+        FROM orders o
+        WHERE o.product_cents != lines_cents OR o.product_cents != CAST(round(o.product_total * 100) AS INTEGER)
+    """):
+        violations.append(f"订单 {r['order_number']} 商品合计 {r['product_total']}，明细合计 {r['lines_cents'] / 100}")
+    for r in conn.execute("""
+        SELECT id, quantity, unit_price, total_price FROM order_products
+        WHERE total_cents != unit_cents * quantity OR total_cents != CAST(round(total_price * 100) AS INTEGER)
+    """):
+        violations.append(f"明细 {r['id']}：{r['unit_price']} × {r['quantity']} != {r['total_price']}")
+    return violations
+
+
+def unpaid_orders(conn, room_id):
+    return [r["order_number"] for r in conn.execute(
+        "SELECT order_number FROM orders WHERE room_id = ? AND payment_status = 'unpaid'", (room_id,))]
+
+
+def test_concurrent_open_same_room(api, run_threads, db_reader, throughput):
+    """同一间房被多个线程同时开，每一轮只能有一个成功。"""
+    room_id = create_room(api)
+    rounds = max(1, ROUNDS // 4)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        results = run_threads(THREADS, lambda i: open_room(api, room_id))
+        winners = [number for status, number in results if status == 200]
+        assert len(winners) == 1, results
+        assert sorted(status for status, _ in results) == [200] + [409] * (THREADS - 1)
+        assert unpaid_orders(db_reader, room_id) == winners
+        status, body = api.request("POST", f"/api/orders/{winners[0]}/close")
+        assert status == 200, body
+    throughput(rounds * (THREADS + 1), time.perf_counter() - started)
+    assert db_reader.execute("SELECT COUNT(*) FROM orders WHERE room_id = ?", (room_id,)).fetchone()[0] == rounds
+    assert check_invariants(db_reader) == []
+
+
+def test_race_cli_exactly_once(waitress_server, db_reader):
+    """loadtest.py --race 50：50 个连接同时开同一间房、再同时结同一张订单，各只成功一次，其余都是 409。"""
+    host, port = waitress_server
+    create_room(WaitressTransport(host, port))
+    list_orders = "SELECT room_id, order_number, payment_status FROM orders"
+    before = {tuple(o) for o in db_reader.execute(list_orders)}
+    result = loadtest.run_race(f"http://{host}:{port}", 50)
+    assert result["open"] == {"requests": 50, "succeeded": 1, "rejected": 49, "conflicts": 49, "errors": 0}, result
+    assert result["close"] == {"requests": 50, "succeeded": 1, "rejected": 49, "conflicts": 49, "errors": 0}, result
+    assert result["exactly_once"], result
+    # 只多出一张订单，且已结账
+    new_orders = {tuple(o) for o in db_reader.execute(list_orders)} - before
+    assert new_orders == {(result["room_id"], result["order_number"], "paid")}
+    assert check_invariants(db_reader) == []
+
+
+def test_concurrent_add_products_no_lost_updates(api, run_threads, db_reader, throughput):
+    """多个线程往同一张订单加商品：明细一条不少，商品合计等于每次加购金额之和（按分）。"""
+    room_id = create_room(api)
+    products = {create_product(api, price): round(price * 100) for price in (12.34, 0.1, 3.33, 7)}
+    status, order_number = open_room(api, room_id)
+    assert status == 200
+
+    def worker(i):
+        rng = random.Random(SEED + i)
+        cents = 0
+        for _ in range(ROUNDS):
+            product_id = rng.choice(list(products))
+            quantity = rng.randint(1, 5)
+            status, body = api.request("POST", f"/api/orders/{order_number}/products",
+                                       {"product_id": product_id, "quantity": quantity})
+            assert status == 200, body
+            cents += products[product_id] * quantity
+        return cents
+
+    started = time.perf_counter()
+    expected_cents = sum(run_threads(THREADS, worker))
+    throughput(THREADS * ROUNDS, time.perf_counter() - started)
+
+    order = db_reader.execute("SELECT id, product_cents FROM orders WHERE order_number = ?", (order_number,)).fetchone()
+    lines = db_reader.execute("SELECT COUNT(*) AS n, SUM(total_cents) AS cents FROM order_products WHERE order_id = ?",
+                              (order["id"],)).fetchone()
+    assert lines["n"] == THREADS * ROUNDS
+    assert lines["cents"] == expected_cents
+    assert order["product_cents"] == expected_cents
+    status, body = api.request("GET", f"/api/orders/room/{room_id}/current")
+    assert status == 200 and round(body["data"]["product_total"] * 100) == expected_cents
+    status, body = api.request("POST", f"/api/orders/{order_number}/close")
+    assert status == 200 and round(body["data"]["product_total"] * 100) == expected_cents
+    assert check_invariants(db_reader) == []
+
+
+def test_add_products_racing_close(api, run_threads, db_reader, throughput):
+    """结账和加商品同时进行：结账金额包含结账前加的所有商品，结账后加的全部被拒绝，且不留下明细。"""
+    room_id = create_room(api)
+    product_id = create_product(api, 2.5)
+    status, order_number = open_room(api, room_id)
+    assert status == 200
+    closed = threading.Event()
+
+    def worker(i):
+        if i == 0:
+            # 等其它线程加了一部分再结账
+            time.sleep(0.05)
+            status, body = api.request("POST", f"/api/orders/{order_number}/close")
+            assert status == 200, body
+            closed.set()
+            return ("close", body["data"]["product_total"])
+        accepted = rejected_after_close = 0
+        for _ in range(ROUNDS):
+            status, body = api.request("POST", f"/api/orders/{order_number}/products",
+                                       {"product_id": product_id, "quantity": 1})
+            if status == 200:
+                accepted += 1
+            else:
+                assert status == 404, body
+                rejected_after_close += 1
+        return ("add", accepted)
+
+    started = time.perf_counter()
+    results = run_threads(THREADS, worker)
+    throughput(1 + (THREADS - 1) * ROUNDS, time.perf_counter() - started)
+
+    assert closed.is_set()
+    close_total = next(v for kind, v in results if kind == "close")
+    accepted = sum(v for kind, v in results if kind == "add")
+    order = db_reader.execute("SELECT id, payment_status, product_cents FROM orders WHERE order_number = ?",
+                              (order_number,)).fetchone()
+    lines = db_reader.execute("SELECT COUNT(*) FROM order_products WHERE order_id = ?", (order["id"],)).fetchone()[0]
+    assert order["payment_status"] == "paid"
+    assert lines == accepted
+    assert order["product_cents"] == round(close_total * 100) == accepted * 250
+    assert unpaid_orders(db_reader, room_id) == []
+    assert check_invariants(db_reader) == []
+
+
+def test_delete_room_racing_open(api, run_threads, db_reader, throughput):
+    """删房和开房同时进行：要么删掉（开房 404），要么开成（删房 400），不会留下房间已删除的未结订单。"""
+    rooms = [create_room(api) for _ in range(max(1, ROUNDS // 2))]
+    started = time.perf_counter()
+    outcomes = []
+    for room_id in rooms:
+        def worker(i, room_id=room_id):
+            if i % 2:
+                return "delete", api.request("DELETE", f"/api/rooms/{room_id}")[0]
+            return "open", open_room(api, room_id)[0]
+        results = run_threads(min(THREADS, 4), worker)
+        deletes = [status for kind, status in results if kind == "delete"]
+        opens = [status for kind, status in results if kind == "open"]
+        assert set(deletes) <= {200, 400}, results
+        assert set(opens) <= {200, 409, 404}, results
+        if 200 in opens:
+            assert opens.count(200) == 1 and 200 not in deletes, results
+        outcomes.append("opened" if 200 in opens else "deleted")
+    throughput(len(rooms) * min(THREADS, 4), time.perf_counter() - started)
+    assert check_invariants(db_reader) == []
+    # 开成的房间结账后照常可用
+    for room_id in rooms:
+        for order_number in unpaid_orders(db_reader, room_id):
+            status, body = api.request("POST", f"/api/orders/{order_number}/close")
+            assert status == 200, body
+    assert check_invariants(db_reader) == []
+
+
+def test_mixed_order_lifecycle(api, run_threads, db_reader, throughput):
+    """少量房间、多个线程随机开房、点单、结账：房间争用激烈，所有成功的操作都要落到库里。"""
+    rooms = [create_room(api, price) for price in (20, 25, 30)[:max(1, THREADS // 3)] * 2]
+    products = {create_product(api, price): round(price * 100) for price in (10, 6, 4.5, 0.99)}
+
+    def worker(i):
+        rng = random.Random(SEED * 31 + i)
+        stats = {"ops": 0, "opened": 0, "closed": 0, "lines": 0}
+        for _ in range(ROUNDS):
+            room_id = rng.choice(rooms)
+            status, order_number = open_room(api, room_id)
+            stats["ops"] += 1
+            if status == 200:
+                stats["opened"] += 1
+            else:
+                assert status == 409
+                # 房间被别人占着：找到它的订单一起点单，有时顺手结账
+                status, body = api.request("GET", f"/api/orders/room/{room_id}/current")
+                stats["ops"] += 1
+                if status != 200:
+                    continue
+                order_number = body["data"]["order_number"]
+            for _ in range(rng.randint(0, 3)):
+                product_id = rng.choice(list(products))
+                status, body = api.request("POST", f"/api/orders/{order_number}/products",
+                                           {"product_id": product_id, "quantity": rng.randint(1, 3)})
+                stats["ops"] += 1
+                if status == 200:
+                    stats["lines"] += 1
+                else:
+                    assert status == 404, body     # 订单刚被别的线程结账
+            if rng.random() < 0.5:
+                status, body = api.request("POST", f"/api/orders/{order_number}/close")
+                stats["ops"] += 1
+                if status == 200:
+                    stats["closed"] += 1
+                else:
+                    assert status == 409, body     # 别的线程先结了
+        return stats
+
+    started = time.perf_counter()
+    results = run_threads(THREADS, worker)
+    elapsed = time.perf_counter() - started
+    total = {k: sum(s[k] for s in results) for k in results[0]}
+    throughput(total["ops"], elapsed)
+
+    placeholders = ",".join("?" * len(rooms))
+    orders = db_reader.execute(f"""
+        SELECT COUNT(*) AS n, SUM(payment_status = 'paid') AS paid,
+               (SELECT COUNT(*) FROM order_products op JOIN orders o ON op.order_id = o.id
+                WHERE o.room_id IN ({placeholders})) AS lines
+        FROM orders WHERE room_id IN ({placeholders})
+    """, rooms + rooms).fetchone()
+    assert orders["n"] == total["opened"]
+    assert orders["paid"] == total["closed"]
+    assert orders["lines"] == total["lines"]
+    assert check_invariants(db_reader) == []
@@ -0,0 +1,33 @@
+"""订单金额按分计算：进行中订单显示的商品合计与结账金额完全一致，不带浮点误差。"""
+from test_order_concurrency import create_room, create_product, open_room
+
+
+def test_running_product_total_matches_checkout(api, db_reader):
+    room_id = create_room(api)
+    cheap = create_product(api, 0.1)
+    odd = create_product(api, 3.33)
+    status, order_number = open_room(api, room_id)
+    assert status == 200
+    def add(product_id, quantity):
+        status, body = api.request("POST", f"/api/orders/{order_number}/products",
+                                   {"product_id": product_id, "quantity": quantity})
+        assert status == 200, body
+
+    def running():
+        return db_reader.execute("SELECT product_total FROM orders WHERE order_number = ?", (order_number,)).fetchone()[0]
+
+    for _ in range(10):
+        add(cheap, 1)
+    # REAL 累加十个 0.1 得到 0.9999999999999999
+    assert running() == 1.0
+    add(odd, 3)
+    add(cheap, 7)
+    assert running() == 11.69
+    lines = [r[0] for r in db_reader.execute(
+        "SELECT total_price FROM order_products op JOIN orders o ON o.id = op.order_id WHERE o.order_number = ? ORDER BY op.id",
+        (order_number,))]
+    assert lines[-2:] == [9.99, 0.7]
+
+    status, body = api.request("POST", f"/api/orders/{order_number}/close")
+    assert status == 200
+    assert body["data"]["product_total"] == running()
@@ -0,0 +1,45 @@
+"""慢查询日志：快查询只在本线程计数，不争全局锁；总数和慢查询照常统计。"""
+import threading
+
+from querylog import QueryLog
+
+
+class CountingLock:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquired = 0
+
+    def __enter__(self):
+        self._lock.acquire()
+        self.acquired += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._lock.release()
+
+
+def test_fast_queries_skip_global_lock():
+    log = QueryLog(threshold_ms=50, explain=False)
+    log._lock = lock = CountingLock()
+    n_threads, per_thread = 8, 1000
+    barrier = threading.Barrier(n_threads)
+
+    def worker():
+        barrier.wait()
+        for _ in range(per_thread):
+            log.record(None, "SELECT 1", (), 0.0001, 1)
+
+    threads = [threading.Thread(target=worker) for _ in range(n_threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # 每个线程只在第一次登记计数器时拿一次锁
+    assert lock.acquired == n_threads
+    assert log.total == n_threads * per_thread
+
+    log.record(None, "SELECT 2", (1,), 0.2, 3)
+    snap = log.snapshot()
+    assert snap["total_queries"] == n_threads * per_thread + 1
+    assert snap["slow_queries"] == 1
+    assert snap["entries"][0]["params"] == ["int"]
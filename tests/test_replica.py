@@ -0,0 +1,46 @@
+"""报表只读副本：查询开始前副本被替换时，改用新副本，不会用到已关闭的旧连接。"""
+import sqlite3
+
+from replica import ReadReplica
+
+
+class _SwapThenRefresh:
+    """包装 _swap_lock：reader() 取到当前副本、释放锁之后立刻刷新一次副本（模拟刷新线程插进这个间隙）。"""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.lock = replica._swap_lock
+        self.fired = False
+
+    def __enter__(self):
+        return self.lock.__enter__()
+
+    def __exit__(self, *exc):
+        self.lock.__exit__(*exc)
+        if not self.fired and not self.replica._refresh_lock.locked():
+            self.fired = True
+            self.replica._swap_lock = self.lock
+            self.replica.refresh(force=True)
+
+
+def test_reader_retries_when_copy_swapped_before_lock(tmp_path):
+    path = str(tmp_path / "source.db")
+    src = sqlite3.connect(path)
+    src.execute("CREATE TABLE t (v INTEGER)")
+    src.execute("INSERT INTO t VALUES (1)")
+    src.commit()
+
+    replica = ReadReplica(path)
+    replica.refresh(force=True)
+    first = replica._current
+    src.execute("INSERT INTO t VALUES (2)")
+    src.commit()
+
+    hook = _SwapThenRefresh(replica)
+    replica._swap_lock = hook
+    with replica.reader(lambda: None) as cur:
+        assert cur.execute("SELECT COUNT(*) FROM t").fetchone()[0] == 2
+    assert hook.fired and replica._current is not first
+    assert replica.stats()["reads"] == 1
+    replica.close()
+    src.close()
@@ -0,0 +1,126 @@
+"""预约冲突索引和预约接口：时段重叠、占位确认、散客开房拦截、爽约失效、删房。"""
+import datetime
+
+from reservations import ReservationIndex, TIME_FMT
+from test_order_concurrency import create_room, open_room
+
+NOW = datetime.datetime(2024, 6, 1, 18, 0)
+
+
+def at(hours):
+    return NOW + datetime.timedelta(hours=hours)
+
+
+def make_index():
+    return ReservationIndex(walkin_guard_minutes=60, no_show_minutes=30, open_hold_minutes=30)
+
+
+def test_overlapping_reservations_rejected():
+    index = make_index()
+    index.load([(1, 10, at(2).strftime(TIME_FMT), at(4).strftime(TIME_FMT))], [])
+    token, conflicts = index.reserve(10, at(3), at(5), NOW)
+    assert token is None and [c["reservation_id"] for c in conflicts] == [1]
+    # 首尾相接不算重叠，其它房间不受影响
+    assert index.reserve(10, at(4), at(6), NOW)[0] is not None
+    assert index.reserve(11, at(3), at(5), NOW)[0] is not None
+    assert index.reserve(10, at(0.5), at(2), NOW)[0] is not None
+
+
+def test_placeholder_blocks_until_confirmed_or_removed():
+    index = make_index()
+    token, _ = index.reserve(10, at(2), at(4), NOW)
+    assert token < 0
+    # 占位还没写库，同一时段的并发预约也要被拒绝
+    token2, conflicts = index.reserve(10, at(3), at(5), NOW)
+    assert token2 is None and conflicts == [{"type": "pending"}]
+    index.confirm(token, 42)
+    assert [c.get("reservation_id") for c in index.conflicts(10, at(3), at(5), NOW)] == [42]
+    assert index.stats()["reservations"] == 1
+    # 写库失败时撤销占位，时段重新可约
+    token3, _ = index.reserve(10, at(6), at(8), NOW)
+    index.remove(token3)
+    assert index.reserve(10, at(6), at(8), NOW)[0] is not None
+    # 取消后时段释放
+    index.remove(42)
+    assert index.conflicts(10, at(3), at(5), NOW) == []
+
+
+def test_walkin_blocked_by_upcoming_reservation_but_not_by_its_own():
+    index = make_index()
+    index.load([(1, 10, at(0.5).strftime(TIME_FMT), at(3).strftime(TIME_FMT)),
+                (2, 12, at(1.5).strftime(TIME_FMT), at(3).strftime(TIME_FMT))], [])
+    blockers, registered = index.begin_open(10, NOW)
+    assert [b["reservation_id"] for b in blockers] == [1] and not registered
+    # 没有预约的房间、超过 walkin_guard 才开始的预约不拦散客
+    assert index.begin_open(11, NOW) == ([], True)
+    assert index.begin_open(12, NOW) == ([], True)
+    # 预约本人到店
+    blockers, registered = index.begin_open(10, NOW, reservation_id=1)
+    assert blockers == [] and registered
+    # 已登记开房的房间，近期预约与进行中订单冲突
+    index.opened(10, NOW)
+    assert index.reserve(10, at(0.25), at(1), NOW)[1][-1]["type"] == "open_order"
+    index.close(10)
+    assert index.conflicts(10, at(4), at(5), NOW) == []
+
+
+def test_no_show_stops_blocking_walkins():
+    index = make_index()
+    index.load([(1, 10, at(-1).strftime(TIME_FMT), at(2).strftime(TIME_FMT))], [])
+    # 预约已开始 60 分钟仍未到店（超过 no_show 30 分钟），散客可以开房
+    assert index.begin_open(10, NOW) == ([], True)
+    index.abort_open(10, True)
+    # 开始 20 分钟内仍然为预约保留
+    assert index.begin_open(10, at(-1) + datetime.timedelta(minutes=20))[0]
+
+
+def _slot(start_hours, end_hours):
+    now = datetime.datetime.now()
+    return {"start_time": (now + datetime.timedelta(hours=start_hours)).strftime(TIME_FMT),
+            "end_time": (now + datetime.timedelta(hours=end_hours)).strftime(TIME_FMT)}
+
+
+def test_reservation_api_flow(api, db_reader):
+    room_id = create_room(api)
+    status, body = api.request("POST", "/api/reservations", dict(room_id=room_id, contact_name="张三", **_slot(0.5, 2)))
+    assert status == 200, body
+    reservation_id = body["reservation_id"]
+    status, body = api.request("POST", "/api/reservations", dict(room_id=room_id, **_slot(1, 3)))
+    assert status == 409 and body["conflicts"][0]["reservation_id"] == reservation_id
+
+    # 半小时后有预约：散客开房被拦下，预约本人可以开
+    status, body = api.request("POST", f"/api/rooms/{room_id}/open", {})
+    assert status == 409 and body["reservations"][0]["reservation_id"] == reservation_id
+    status, body = api.request("POST", f"/api/rooms/{room_id}/open", {"reservation_id": reservation_id})
+    assert status == 200, body
+    row = db_reader.execute("SELECT status, order_id FROM reservations WHERE id = ?", (reservation_id,)).fetchone()
+    assert row["status"] == "fulfilled" and row["order_id"]
+    status, body = api.request("POST", f"/api/orders/{body['order_number']}/close")
+    assert status == 200, body
+
+    # 取消：只有有效预约能取消一次
+    status, body = api.request("POST", "/api/reservations", dict(room_id=room_id, **_slot(5, 6)))
+    assert status == 200, body
+    other = body["reservation_id"]
+    assert api.request("POST", f"/api/reservations/{other}/cancel")[0] == 200
+    assert api.request("POST", f"/api/reservations/{other}/cancel")[0] == 400
+    assert api.request("POST", "/api/reservations", dict(room_id=room_id, **_slot(5, 6)))[0] == 200
+
+
+def test_delete_room_with_reservations(api):
+    room_id = create_room(api)
+    status, body = api.request("POST", "/api/reservations", dict(room_id=room_id, **_slot(3, 4)))
+    assert status == 200, body
+    status, body = api.request("DELETE", f"/api/rooms/{room_id}")
+    assert status == 409 and body["error"] == "房间有预约记录，无法删除"
+
+    # 有历史订单的房间同样不能删
+    room_id = create_room(api)
+    status, order_number = open_room(api, room_id)
+    assert status == 200
+    assert api.request("POST", f"/api/orders/{order_number}/close")[0] == 200
+    status, body = api.request("DELETE", f"/api/rooms/{room_id}")
+    assert status == 409 and body["error"] == "房间有历史订单，无法删除"
+
+    room_id = create_room(api)
+    assert api.request("DELETE", f"/api/rooms/{room_id}")[0] == 200
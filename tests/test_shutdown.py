@@ -0,0 +1,54 @@
+"""优雅停机：排空后打断服务循环属于正常退出，不打印 traceback，返回码 0。"""
+import os
+import sys
+import signal
+import subprocess
+import textwrap
+
+import pytest
+
+from shutdown import GracefulShutdown, RequestDrain
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 用真实信号走一遍：install() -> SIGTERM -> 排空 -> interrupt_main() -> run() 返回
+_SERVE = textwrap.dedent("""
+    import os, signal, threading, time
+    from shutdown import GracefulShutdown, RequestDrain
+
+    shutdown = GracefulShutdown(RequestDrain(None), drain_timeout=1.0)
+    shutdown.add_step("mark", lambda: print("cleanup", flush=True))
+    shutdown.install()
+
+    def serve():
+        threading.Timer(0.2, os.kill, (os.getpid(), signal.SIG{sig})).start()
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+        raise SystemExit("服务循环没有被打断")
+
+    shutdown.run(serve)
+    print("exited", flush=True)
+""")
+
+
+@pytest.mark.parametrize("sig", ["TERM", "INT"])
+def test_graceful_stop_exits_zero_without_traceback(sig):
+    proc = subprocess.run([sys.executable, "-c", _SERVE.replace("{sig}", sig)], cwd=ROOT,
+                          capture_output=True, text=True, timeout=30)
+    assert proc.returncode == 0, proc.stderr
+    assert "Traceback" not in proc.stderr
+    assert proc.stdout.split() == ["cleanup", "exited"]
+
+
+def test_interrupt_without_shutdown_request_propagates():
+    shutdown = GracefulShutdown(RequestDrain(None))
+    ran = []
+    shutdown.add_step("mark", lambda: ran.append(True))
+
+    def serve():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        shutdown.run(serve)
+    assert ran == [True]
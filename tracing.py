@@ -0,0 +1,397 @@
+"""请求追踪：每个请求一条 trace，SQL、序列化、响应写出各记一个 span，导出为 OpenTelemetry（OTLP/JSON）格式。
+
+用来回答“这次结账慢在哪”：SQL 执行取数、模型构造和 JSON 编码、Waitress 写出响应体各占多少。
+- trace 由 WSGI 中间件开始和结束，响应体被 Waitress 写完（close）时才结束，写出耗时记为 response.write；
+- 响应头带 X-Trace-Id；请求带 traceparent（W3C）或 X-Trace-Id 时沿用其中的 trace ID；
+- 头部采样：按 sample_rate 决定是否记录（请求头标记了 sampled 的总是记录）；
+- 尾部采样：记录下来的 trace 只保留耗时不少于 tail_ms 或出错（5xx）的，进内存环形缓冲区并导出。
+
+导出为每行一个 ExportTraceServiceRequest（resourceSpans/scopeSpans/spans），
+可以直接交给 OpenTelemetry Collector 的 otlpjsonfile 接收器，或用 Jaeger 等工具导入查看。
+"""
+import os
+import time
+import random
+import functools
+import threading
+from collections import deque
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+
+SPAN_KIND_INTERNAL, SPAN_KIND_SERVER, SPAN_KIND_CLIENT = 1, 2, 3
+STATUS_UNSET, STATUS_ERROR = 0, 2
+BREAKDOWN = ("db", "serialize", "response")
+
+
+def parse_trace_header(environ):
+    """返回 (trace_id, 远端 parent span id, 是否已采样)，没有或格式不对时返回 (None, None, False)。"""
+    tp = environ.get('HTTP_TRACEPARENT', '')
+    parts = tp.strip().split('-')
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        try:
+            flags = int(parts[3], 16)
+            int(parts[1], 16), int(parts[2], 16)
+        except ValueError:
+            pass
+        else:
+            if parts[1] != '0' * 32:
+                return parts[1].lower(), parts[2].lower(), bool(flags & 1)
+    tid = environ.get('HTTP_X_TRACE_ID', '').strip().lower()
+    if len(tid) == 32:
+        try:
+            int(tid, 16)
+            return tid, None, True
+        except ValueError:
+            pass
+    return None, None, False
+
+
+class Trace:
+    __slots__ = ('trace_id', 'remote_parent', 'name', 'attrs', 'status', 'spans', 'stack',
+                 'aggregates', '_next_id', '_epoch_ns', '_perf_ns', 'start_ns', 'end_ns')
+
+    def __init__(self, trace_id, remote_parent, name, attrs):
+        self.trace_id = trace_id
+        self.remote_parent = remote_parent
+        self.name = name
+        self.attrs = attrs
+        self.status = None
+        self.spans = []             # [span_id, parent_id, name, start_ns, end_ns, attrs, kind]
+        self.aggregates = {}        # name -> [parent_id, 首次开始, 累计耗时, 次数]
+        self._next_id = random.getrandbits(63) | 1
+        # 墙上时间只取一次，span 时间用 perf_counter_ns 的差值换算，不受系统时间跳变影响
+        self._epoch_ns = time.time_ns()
+        self._perf_ns = time.perf_counter_ns()
+        self.start_ns = self._epoch_ns
+        self.end_ns = None
+        self.stack = [self.new_id()]     # 根 span
+
+    def new_id(self):
+        self._next_id += 1
+        return '%016x' % (self._next_id & 0xFFFFFFFFFFFFFFFF)
+
+    def now_ns(self):
+        return self._epoch_ns + time.perf_counter_ns() - self._perf_ns
+
+    def add_span(self, name, start_ns, end_ns, attrs=None, kind=SPAN_KIND_INTERNAL):
+        self.spans.append([self.new_id(), self.stack[-1], name, start_ns, end_ns, attrs, kind])
+
+    def record(self, conn, sql, params, elapsed, rows):
+        """TimedCursor 的回调：每条 SQL（含取数）记一个 span，结束时间为当前时刻。"""
+        end = self.now_ns()
+        statement = " ".join(sql.split())
+        self.add_span("db.query", end - int(elapsed * 1e9), end,
+                      {"db.system": "sqlite", "db.statement": statement[:500], "db.rows": rows}, SPAN_KIND_CLIENT)
+
+    def aggregate(self, name, start_ns, duration_ns):
+        """逐行调用的小函数不单独记 span，同名的合并成一个（耗时为累计值，count 为调用次数）。"""
+        agg = self.aggregates.get(name)
+        if agg is None:
+            self.aggregates[name] = [self.stack[-1], start_ns, duration_ns, 1]
+        else:
+            agg[2] += duration_ns
+            agg[3] += 1
+
+    @property
+    def duration_ms(self):
+        return ((self.end_ns or self.now_ns()) - self.start_ns) / 1e6
+
+    def all_spans(self):
+        root = [self.stack[0], self.remote_parent, self.name, self.start_ns, self.end_ns, self.attrs, SPAN_KIND_SERVER]
+        spans = [root] + self.spans
+        for name, (parent, start, total, count) in self.aggregates.items():
+            spans.append([self.new_id(), parent, name, start, start + total, {"count": count, "aggregated": True},
+                          SPAN_KIND_INTERNAL])
+        return spans
+
+    def summary(self):
+        """按 span 名前缀（db / serialize / response）汇总耗时，给调试接口列表用。"""
+        totals = {}
+        for span in self.all_spans()[1:]:
+            key = span[2].split('.', 1)[0]
+            if key in BREAKDOWN:    # batch 等外层 span 包含了里面的 SQL 和序列化，不重复计入
+                totals[key] = totals.get(key, 0) + (span[4] - span[3])
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "status": self.status,
+            "ms": round(self.duration_ms, 3),
+            "at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.start_ns / 1e9)),
+            "spans": len(self.spans) + len(self.aggregates) + 1,
+            "breakdown_ms": {k: round(v / 1e6, 3) for k, v in sorted(totals.items())},
+        }
+
+    def tree(self):
+        """调试接口的明细：按开始时间排序，offset/duration 为毫秒，depth 为嵌套层级。"""
+        spans = sorted(self.all_spans(), key=lambda s: s[3])
+        depth = {spans[0][0]: 0}
+        out = []
+        for span_id, parent, name, start, end, attrs, _ in spans:
+            d = depth.get(parent, -1) + 1 if span_id != spans[0][0] else 0
+            depth[span_id] = d
+            out.append({"name": name, "depth": d, "offset_ms": round((start - self.start_ns) / 1e6, 3),
+                        "ms": round((end - start) / 1e6, 3), "attributes": attrs or {}})
+        return {**self.summary(), "spans": out}
+
+
+def _otlp_value(v):
+    if isinstance(v, bool):
+        return {"boolValue": v}
+    if isinstance(v, int):
+        return {"intValue": str(v)}
+    if isinstance(v, float):
+        return {"doubleValue": v}
+    return {"stringValue": str(v)}
+
+
+def _otlp_attrs(attrs):
+    return [{"key": k, "value": _otlp_value(v)} for k, v in (attrs or {}).items() if v is not None]
+
+
+class Tracer:
+    def __init__(self, enabled=False, sample_rate=1.0, tail_ms=100, keep=200, export=None,
+                 service_name="chess-billing", path_prefix='/api/', exclude_prefixes=('/api/debug/',)):
+        """export(otlp_dict)：保留下来的 trace 的导出函数（写文件等），为 None 时只放内存。"""
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.tail_ms = tail_ms
+        self.export = export
+        self.service_name = service_name
+        self.path_prefix = path_prefix
+        self.exclude_prefixes = tuple(exclude_prefixes)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.kept = deque(maxlen=keep)
+        self.started = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.wsgi_app = _TracingMiddleware(app.wsgi_app, self)
+        app.json = _TracedJSONProvider(app, self)
+
+        @app.after_request
+        def _trace_route(response):
+            # 批量接口的子请求不执行 after_request，这里只会是外层请求
+            trace = self.current()
+            if trace is not None and request.url_rule is not None:
+                trace.name = f"{request.method} {request.url_rule.rule}"
+                trace.attrs["http.route"] = request.url_rule.rule
+            return response
+
+    def current(self):
+        return getattr(self._local, 'trace', None)
+
+    # ---- 埋点 ----
+
+    def span(self, name, **attrs):
+        trace = self.current()
+        if trace is None:
+            return _NULL_SPAN
+        return _Span(trace, name, attrs)
+
+    def traced(self, name, aggregate=False):
+        """装饰器：函数调用记为一个 span；aggregate=True 时同一请求内的多次调用合并成一个。"""
+        def decorator(f):
+            @functools.wraps(f)
+            def wrapper(*args, **kwargs):
+                trace = getattr(self._local, 'trace', None)
+                if trace is None:
+                    return f(*args, **kwargs)
+                if not aggregate:
+                    with _Span(trace, name, None):
+                        return f(*args, **kwargs)
+                start = trace.now_ns()
+                try:
+                    return f(*args, **kwargs)
+                finally:
+                    trace.aggregate(name, start, trace.now_ns() - start)
+            return wrapper
+        return decorator
+
+    # ---- 生命周期（中间件调用）----
+
+    def start(self, environ):
+        # 上一个响应体没被读完也没 close（只在测试客户端里出现）时，不让它的 trace 留在线程上
+        self._local.trace = None
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.path_prefix) or path.startswith(self.exclude_prefixes):
+            return None
+        trace_id, remote_parent, sampled = parse_trace_header(environ)
+        if not sampled and random.random() >= self.sample_rate:
+            return None
+        method = environ.get('REQUEST_METHOD', 'GET')
+        trace = Trace(trace_id or '%032x' % random.getrandbits(128), remote_parent, f"{method} {path}",
+                      {"http.method": method, "http.target": path,
+                       "net.peer.ip": environ.get('REMOTE_ADDR')})
+        self._local.trace = trace
+        with self._lock:
+            self.started += 1
+        return trace
+
+    def finish(self, trace):
+        trace.end_ns = trace.now_ns()
+        self._local.trace = None
+        error = trace.status is None or trace.status >= 500
+        if not error and trace.duration_ms < self.tail_ms:
+            with self._lock:
+                self.dropped += 1
+            return
+        trace.attrs["http.status_code"] = trace.status
+        with self._lock:
+            self.kept.append(trace)
+        if self.export is not None:
+            self.export(self.to_otlp(trace))
+
+    # ---- 导出与查看 ----
+
+    def to_otlp(self, trace):
+        error = trace.status is None or trace.status >= 500
+        spans = []
+        for i, (span_id, parent, name, start, end, attrs, kind) in enumerate(trace.all_spans()):
+            span = {"traceId": trace.trace_id, "spanId": span_id, "name": name, "kind": kind,
+                    "startTimeUnixNano": str(start), "endTimeUnixNano": str(end),
+                    "attributes": _otlp_attrs(attrs),
+                    "status": {"code": STATUS_ERROR if i == 0 and error else STATUS_UNSET}}
+            if parent:
+                span["parentSpanId"] = parent
+            spans.append(span)
+        return {"resourceSpans": [{
+            "resource": {"attributes": _otlp_attrs({"service.name": self.service_name, "process.pid": os.getpid()})},
+            "scopeSpans": [{"scope": {"name": "chess.tracing"}, "spans": spans}],
+        }]}
+
+    def slowest(self, limit=20):
+        with self._lock:
+            traces = list(self.kept)
+        traces.sort(key=lambda t: t.duration_ms, reverse=True)
+        return [t.summary() for t in traces[:limit]]
+
+    def find(self, trace_id):
+        with self._lock:
+            for t in reversed(self.kept):
+                if t.trace_id == trace_id:
+                    return t
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {"enabled": self.enabled, "sample_rate": self.sample_rate, "tail_ms": self.tail_ms,
+                    "traced": self.started, "dropped_fast": self.dropped, "kept": len(self.kept)}
+
+
+class _Span:
+    __slots__ = ('trace', 'name', 'attrs', 'span_id', 'start')
+
+    def __init__(self, trace, name, attrs):
+        self.trace = trace
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.span_id = self.trace.new_id()
+        self.start = self.trace.now_ns()
+        self.trace.stack.append(self.span_id)
+        return self
+
+    def set(self, **attrs):
+        self.attrs = {**(self.attrs or {}), **attrs}
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self.trace
+        trace.stack.pop()
+        if exc_type is not None:
+            self.set(error=exc_type.__name__)
+        trace.spans.append([self.span_id, trace.stack[-1], self.name, self.start, trace.now_ns(), self.attrs,
+                            SPAN_KIND_INTERNAL])
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def set(self, **attrs):
+        pass
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _TracedJSONProvider(DefaultJSONProvider):
+    """jsonify 的编码耗时记为 serialize.jsonify。"""
+
+    def __init__(self, app, tracer):
+        super().__init__(app)
+        self._tracer = tracer
+
+    def response(self, *args, **kwargs):
+        with self._tracer.span("serialize.jsonify"):
+            return super().response(*args, **kwargs)
+
+
+class _TracingMiddleware:
+    def __init__(self, wsgi_app, tracer):
+        self.wsgi_app = wsgi_app
+        self.tracer = tracer
+
+    def __call__(self, environ, start_response):
+        tracer = self.tracer
+        trace = tracer.start(environ)
+        if trace is None:
+            return self.wsgi_app(environ, start_response)
+
+        def traced_start_response(status, headers, exc_info=None):
+            trace.status = int(status[:3])
+            headers.append(('X-Trace-Id', trace.trace_id))
+            return start_response(status, headers, exc_info)
+
+        try:
+            body = self.wsgi_app(environ, traced_start_response)
+        except BaseException:
+            tracer.finish(trace)
+            raise
+        return _TracedBody(body, trace, tracer)
+
+
+class _TracedBody:
+    """包装响应体：Waitress 逐块取数据并写出（含流式压缩），取完时请求结束；中途断开时在 close() 结束。"""
+
+    def __init__(self, body, trace, tracer):
+        self.body = body
+        self.trace = trace
+        self.tracer = tracer
+        self.start = None
+        self.chunks = 0
+        self.bytes = 0
+        self.finished = False
+
+    def __iter__(self):
+        self.start = self.trace.now_ns()
+        for chunk in self.body:
+            self.chunks += 1
+            self.bytes += len(chunk)
+            yield chunk
+        self._finish()
+
+    def _finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        trace = self.trace
+        if self.start is not None:
+            trace.add_span("response.write", self.start, trace.now_ns(), {"chunks": self.chunks, "bytes": self.bytes})
+        self.tracer.finish(trace)
+
+    def close(self):
+        try:
+            close = getattr(self.body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self._finish()